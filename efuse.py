@@ -6,65 +6,180 @@
 import sys
 import os
 import re
+import time
+import signal
 import argparse
 import logging
+import contextvars
 from importlib import util as import_util
 from datetime import datetime
 from pathlib import Path
 from shutil import copy, copytree
 import subprocess as sp
 
-from src.efuse_gds_gen.efuse_array import create_efuse_array
+from src.efuse_gds_gen.efuse_array import create_efuse_array, warm_up, bitline_cache, bit_sel_buf_capacity
+from src.efuse_gds_gen.gf180_klayout import CellTemplates, StdCellLibrary
 from src.efuse_spice_gen.generate_spice import generate_spices
 from src.efuse_spice_gen.efuse_tests import EfuseArrayTest
 from src.magic.magic_wrapper import magic
 from src.digital.librelane import EfuseLibrelane
 from src.digital.verilog import EfuseVerilog
+from src.flow.scheduler import Stage, StageScheduler
+from src.flow.cache import ArtifactCache, hash_paths, hash_key, pdk_id
+from src.flow.batch import BatchRunner, read_spec, expand_configs, macro_size
+from src.flow.manifest import ManifestStore, snapshot
+from src.flow.stats import ResourceStats
+from src.flow.errors import FlowError
+from src.flow.daemon import CompilerDaemon, EventHandler
+from src.flow import process, stats
+
+ROOT_DIR = Path(__file__).parent.absolute()
+
+LOG_FORMAT = "%(asctime)s | %(module)-12s | %(levelname)-8s | %(message)s"
+LOG_DATE_FORMAT = "%d-%b-%Y %H:%M:%S"
+
+# flow the current thread or task works for, routes log records into run.log of that flow
+_current_flow = contextvars.ContextVar("efuse_flow", default = None)
+
+class FlowLogFilter(logging.Filter):
+    """
+    Pass only records logged on behalf of the flow.
+    """
+    def __init__(self, flow):
+        super().__init__()
+        self.flow = flow
+
+    def filter(self, record) -> bool:
+        return _current_flow.get() is self.flow
+
+def setup_console_logging(level : int = logging.INFO, log_file : Path = None):
+    """
+    Log to the terminal (and log_file) when running from command line.
+    """
+    handlers = [logging.StreamHandler()]
+    if process.live_tail(sys.stderr):
+        # clear live tool output line before log messages
+        handlers[0].setFormatter(logging.Formatter("\x1b[K" + LOG_FORMAT, LOG_DATE_FORMAT))
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    logging.basicConfig(level = level, handlers = handlers, format = LOG_FORMAT, datefmt = LOG_DATE_FORMAT)
+
+def macro_name(nwords : int, word_width : int, columns : int = 1, aspect : float = None, centre_tap : bool = False,
+                bit_sel_buf : bool = False, ctrl_buf_rows : int = 0) -> str:
+    """
+    Macro name, non-default layout options are added as suffixes so variants of one size do not overwrite each other.
+    """
+    name = f"efuse_array_{nwords}x{word_width}"
+    if aspect is not None:
+        name += "_a" + f"{aspect:g}".replace(".", "p")
+    elif columns != 1:
+        name += f"_c{columns}"
+    if centre_tap:
+        name += "_ct"
+    if bit_sel_buf:
+        name += "_bsb"
+    if ctrl_buf_rows:
+        name += f"_cb{ctrl_buf_rows}"
+    return name
 
 class EfuseFlow:
     """
-    eFuse array creation & verification flow.
+    eFuse array creation & verification flow. All the paths are explicit & nothing depends
+    on the current directory, so several flows could run concurrently in one process.
     """
     def __init__(self, nwords : int, word_width : int, root_dir : Path, 
                     xyce_netlist : str, digital_wrapper : tuple, ncpus : int, 
-                    skip_drclvs : bool, verbose : bool):
+                    skip_drclvs : bool, verbose : bool, cache : ArtifactCache = None, 
+                    run_dir : Path = None, quiet : bool = False, from_stage : str = None, to_stage : str = None, 
+                    trace : bool = False, timeouts : dict = {}, release_dir : Path = None, templates : CellTemplates = None,
+                    columns : int = 1, aspect : float = None, centre_tap : bool = False, bit_sel_buf : bool = False,
+                    ctrl_buf_rows : int = 0):
         self.nwords = nwords
         self.word_width = word_width
-        self.name = f"efuse_array_{nwords}x{word_width}"
+        self.columns = columns
+        self.aspect = aspect
+        self.centre_tap = centre_tap
+        self.bit_sel_buf = bit_sel_buf
+        self.ctrl_buf_rows = ctrl_buf_rows
+        self.name = macro_name(nwords, word_width, columns, aspect, centre_tap, bit_sel_buf, ctrl_buf_rows)
         self.ncpus = ncpus
         self.xyce_netlist = xyce_netlist.lower()
         self.digital_wrapper = digital_wrapper
         self.skip_checks = skip_drclvs
+        self.cache = cache
+        self.from_stage = from_stage
+        self.to_stage = to_stage
+        self.trace = trace
+        self.timeouts = dict(timeouts)
+        self.templates = templates
+        self.digital = None
+        self.released = None
 
         self.root_dir = root_dir
         self.scripts_dir = root_dir / "src"
-        self.release_dir = root_dir / "macros" / self.name
-        rundir = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
-        self.run_dir = root_dir / "runs"
-        self.last_link = self.run_dir / "last"
-        self.run_dir = self.run_dir / rundir
-        os.makedirs(self.run_dir, exist_ok=True)
+        self.release_dir = Path(release_dir).absolute() if release_dir else root_dir / "macros" / self.name
+        if run_dir:
+            self.run_dir = Path(run_dir).absolute()
+            os.makedirs(self.run_dir, exist_ok=True)
+        else:
+            self.run_dir = self.new_run_dir(root_dir)
+
+        # flow artifacts
+        self.gds_name = self.run_dir / f"{self.name}.gds"
+        self.lef_name = self.run_dir / f"{self.name}.lef"
+        self.add_cells_json = self.run_dir / "add_cells.json"
+        self.spice_name = self.run_dir / f"{self.name}.spice"
+        self.klvs_name = self.run_dir / f"{self.name}.klvs.spice"
+        self.tb_name = self.run_dir / f"{self.name}_test.xyce"
+        self.ext_netlist = self.run_dir / f"{self.name}.magic_ext.spice"
+        self.pex_netlist = self.run_dir / f"{self.name}.magic_pex.spice"
+        self.verilog_bb = self.run_dir / f"{self.name}_bb.v"
+        self.verilog_model = self.run_dir / f"{self.name}.v"
+        self.files = {
+            "gds"       : [self.gds_name],
+            "lef"       : [self.lef_name],
+            "add_cells" : [self.add_cells_json],
+            "spice"     : [self.spice_name],
+            "klvs"      : [self.klvs_name],
+            "tb"        : [self.tb_name],
+            "ports"     : [self.run_dir / "efuse_array_ports.tcl", self.run_dir / "efuse_bitline_ports.tcl"],
+            "ext"       : [self.ext_netlist],
+            "pex"       : [self.pex_netlist],
+            "drc"       : [self.run_dir / "drc.log"],
+            "lvs"       : [self.run_dir / "lvs.log"],
+            "xyce"      : [],
+            "verilog"   : [self.verilog_bb, self.verilog_model],
+            "digital"   : [self.run_dir / "librelane"],
+        }
+        self.manifests = ManifestStore(self.run_dir)
+        self.stats = ResourceStats()
+
+        # setup logging, run.log gets only records of this flow
+        if verbose:
+            self.log_level = logging.DEBUG
+        else:
+            self.log_level = logging.INFO
+        self.log_handler = logging.FileHandler(self.run_dir / "run.log", delay = True)
+        self.log_handler.setFormatter(logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT))
+        self.log_handler.setLevel(self.log_level)
+        self.log_handler.addFilter(FlowLogFilter(self))
+        if not quiet:
+            setup_console_logging(self.log_level)
+
+    @staticmethod 
+    def new_run_dir(root_dir : Path, suffix : str = "") -> Path:
+        """
+        Create new timestamped run directory & point runs/last link to it.
+        """
+        runs = root_dir / "runs"
+        run_dir = runs / (datetime.now().strftime("%Y_%m_%d_%H_%M_%S") + suffix)
+        os.makedirs(run_dir, exist_ok=True)
         try:
-            os.unlink(self.last_link)
+            os.unlink(runs / "last")
         except FileNotFoundError:
             pass
-        os.symlink(self.run_dir, self.last_link)
-
-
-        # setup logging
-        if verbose:
-            logging_level = logging.DEBUG
-        else:
-            logging_level = logging.INFO
-        logging.basicConfig(
-            level=logging_level,
-            handlers=[
-                logging.FileHandler(self.run_dir / "run.log"),
-                logging.StreamHandler()
-            ],
-            format="%(asctime)s | %(module)-12s | %(levelname)-8s | %(message)s",
-            datefmt="%d-%b-%Y %H:%M:%S",
-        )
+        os.symlink(run_dir, runs / "last")
+        return run_dir
 
     @staticmethod 
     def regexp_patch(file : str, regex : str, sub : str):
@@ -76,25 +191,25 @@ class EfuseFlow:
     @staticmethod 
     def panic(msg : str):
         """
-        Exit with error message.
+        Stop the flow with error message.
         """
         logging.error(msg)
-        sys.exit(1)
+        raise FlowError(msg)
 
     @staticmethod 
-    def check_in_path(cmd : list):
+    def check_in_path(cmds : list):
         """
-        Check that binary is in path and is runnable.
+        Check that binaries are in path and are runnable, all of them are started concurrently.
         """
-        try:
-            sp.run(cmd, check = True, capture_output = True)
-        except Exception:
-            EfuseFlow.panic(f"{cmd[0]} not found in PATH!")
+        for r in process.run_all([dict(args = c, stdout = sp.PIPE) for c in cmds], check = False):
+            if not r.ok:
+                EfuseFlow.panic(f"{r.args[0]} not found in PATH!")
 
     def run_magic(self, script : str, args : dict = dict(), log = ""):
         """
         Magic call helper.
         """
+        args = dict(args)
         if "GDS" not in args:
             args["GDS"] = self.gds_name
         if "CELL" not in args:
@@ -102,60 +217,84 @@ class EfuseFlow:
         if not log:
             log = f"{script}.log"
         args["MAGIC_SCRIPT_PATH"] = self.scripts_dir / "magic"
-        magic(self.scripts_dir / f"magic/{script}.tcl", args, log)
+        magic(self.scripts_dir / f"magic/{script}.tcl", args, log, self.timeouts.get("magic"), self.run_dir)
 
-    def run(self, args : list, log : str, add_msg : str =""):
+    def run(self, args : list, log : str, add_msg : str ="", timeout : float = None):
         """
-        Run helper.
+        Run helper, tool is run in the run directory & its output is streamed into the log.
         """
+        log = self.run_dir / log
         try:
-            run = sp.run(args, stdout = sp.PIPE, stderr = sp.STDOUT, check = True)
-            with open(log, "a") as f:
-                f.write(run.stdout.decode("utf-8"))
+            with stats.measure(log.stem, cmd = " ".join(str(a) for a in args)):
+                process.run(args, log = log, cwd = self.run_dir, timeout = timeout)
+        except sp.TimeoutExpired as e:
+            logging.error(f"Last lines of {log.name}:\n{e.output}")
+            self.panic(f"{Path(str(args[0])).name} timed out after {e.timeout}s. Please see {log} .")
         except sp.CalledProcessError as e:
-            log = Path(log).absolute()
-            with open(log, "a") as err:
-                print(e.stdout.decode("utf-8"), file=err)
+            logging.error(f"Last lines of {log.name}:\n{e.output}")
             self.panic(f"{add_msg} Please see {log} .")
 
-    def check_environment(self):
+    @staticmethod 
+    def find_pdk() -> Path:
         """
-        Check the environment.
+        Check the PDK environment, returns the PDK path.
         """
         if ("PDK_ROOT" not in os.environ) or ("PDK" not in os.environ):
             os.environ["PDK_ROOT"] = os.environ["HOME"] + "/.ciel"
             os.environ["PDK"] = "gf180mcuD"
             logging.warning(f"PDK_ROOT and/or PDK environment variables are not set, assuming GF180MCU PDK at: {os.environ['PDK_ROOT']}/{os.environ['PDK']}")
         
-        self.pdk_path = Path(os.environ['PDK_ROOT']) / os.environ['PDK']
-        if not Path.is_dir(self.pdk_path/"libs.tech/klayout/tech"):
-            self.panic(f"PDK not found at {self.pdk_path}")
-            sys.exit(1)
+        pdk_path = Path(os.environ['PDK_ROOT']) / os.environ['PDK']
+        if not Path.is_dir(pdk_path/"libs.tech/klayout/tech"):
+            EfuseFlow.panic(f"PDK not found at {pdk_path}")
+        return pdk_path
 
+    def check_pdk(self):
+        """
+        Check the PDK environment.
+        """
+        self.pdk_path = self.find_pdk()
+
+    def check_tools(self):
+        """
+        Check that all the tools are available.
+        """
         # check for KLayout python module
         ks = import_util.find_spec("klayout")
         if not ks:
             self.panic("klayout python module is not installed!")
 
         # check for tools in path
-        self.check_in_path(["klayout", "-b", "-v"])
-        self.check_in_path(["magic", "-d", "null", "--version"])
+        tools = [["klayout", "-b", "-v"], ["magic", "-d", "null", "--version"]]
         if self.xyce_netlist != "none":
-            self.check_in_path(["Xyce", "-v"])
+            tools.append(["Xyce", "-v"])
+        self.check_in_path(tools)
+
+    def stdcells(self) -> StdCellLibrary:
+        """
+        Standard cell library of the PDK, its extract is kept in the flow cache directory or not at all without the cache.
+        """
+        return StdCellLibrary.get(self.cache.dir) if self.cache else StdCellLibrary.get(cache = False)
 
     def generate_gds_lef(self):
         """
         Generate eFuse array GDS with KLayout.
         """
-        self.gds_name = Path(self.name + ".gds").absolute()
-        self.add_cells_json = Path("add_cells.json").absolute()
         logging.info("Generating eFuse array GDS file... ")
-        create_efuse_array(self.gds_name, self.name, self.nwords, self.word_width, flat=False, add_cells = self.add_cells_json)
+        with stats.measure("create_efuse_array", "step", nwords = self.nwords, word_width = self.word_width):
+            array = create_efuse_array(self.gds_name, self.name, self.nwords, self.word_width, flat=False, add_cells = self.add_cells_json, 
+                templates = self.templates, cell_cache = bitline_cache(self.cache.dir) if self.cache else None,
+                columns = self.columns, aspect = self.aspect, centre_tap = self.centre_tap, buf_col_sel = self.bit_sel_buf,
+                ctrl_rows = self.ctrl_buf_rows, stdcells = self.stdcells())
         logging.info(f"eFuse array cell written to {self.gds_name.name}.")
+        if array.bit_sel_drive:
+            strength, drivers = array.bit_sel_drive
+            logging.info(f"Bit select lines are driven by {drivers} x inv_{strength} each.")
+        if self.ctrl_buf_rows:
+            logging.info(f"SENSE & PRESET_N lines are driven by buf_2 for each {self.ctrl_buf_rows} bitlines.")
 
         logging.info("Generating eFuse array LEF file... ")
         self.run_magic("magic_lef")
-        self.lef_name = Path(self.name + ".lef").absolute()
         logging.info(f"eFuse array lef written to {self.lef_name.name}")
 
     def generate_spice(self):
@@ -163,56 +302,66 @@ class EfuseFlow:
         Generate SPICE netlists & test wrappers.
         """
         logging.info("Generating spice netlists for LVS & simulation... ")
-        ret = generate_spices(self.name, self.pdk_path, self.nwords, self.word_width, add_cells = self.add_cells_json)
-        self.spice_name = ret[0]
-        self.klvs_name = ret[1]
-        self.tb_name = ret[2]
+        generate_spices(self.name, self.pdk_path, self.nwords, self.word_width, add_cells = self.add_cells_json, out_dir = self.run_dir,
+                        ctrl_rows = self.ctrl_buf_rows)
 
     def magic_extraction(self):
         """
         Run circuit extraction with Magic.
         """
         logging.info("Performing circuit extraction with Magic... ")
-        self.ext_netlist = Path(self.name + ".magic_ext.spice").absolute()
         self.run_magic("magic_extract", {"SPICE_NAME" : self.ext_netlist})
-        self.pex_netlist = Path(self.name + ".magic_pex.spice").absolute()
         self.run_magic("magic_pex", {"SPICE_NAME" : self.pex_netlist})
 
         # patch extracted netlists (replace 5V models with 6V)
         self.regexp_patch(self.ext_netlist, "_05v0", "_06v0")
         self.regexp_patch(self.pex_netlist, "_05v0", "_06v0")
 
-    def klayout_checks(self):
+    def klayout_drc(self, ncpus : int = 1):
         """
-        Perform DRC & LVS with KLayout.
+        Perform DRC with KLayout.
         """
+        if self.skip_checks:
+            return
+
         logging.info("Performing KLayout DRC...")
         self.run(
             ["python3", self.pdk_path / "libs.tech/klayout/tech/drc/run_drc.py", f"--path={self.gds_name}", 
-                f"--variant={str(self.pdk_path)[-1]}", f"--topcell={self.name}", f"--mp={self.ncpus}"],
-            "drc.log", "DRC run failed, or GDS is not DRC clean"
+                f"--variant={str(self.pdk_path)[-1]}", f"--topcell={self.name}", f"--mp={ncpus}"],
+            "drc.log", "DRC run failed, or GDS is not DRC clean", self.timeouts.get("drc")
         )
         logging.info("GDS is DRC clean.")
-        
+
+    def klayout_lvs(self, ncpus : int = 1):
+        """
+        Perform LVS with KLayout.
+        """
+        if self.skip_checks:
+            return
+
         logging.info("Performing KLayout LVS...")
         self.run(
             ["python3", self.pdk_path / "libs.tech/klayout/tech/lvs/run_lvs.py", f"--layout={self.gds_name}", "--lvs_sub=VSS", "--schematic_simplify",
-                f"--variant={str(self.pdk_path)[-1]}", f"--topcell={self.name}", f"--netlist={self.klvs_name}", f"--thr={self.ncpus}"],
-            "lvs.log", "LVS run failed."
+                f"--variant={str(self.pdk_path)[-1]}", f"--topcell={self.name}", f"--netlist={self.klvs_name}", f"--thr={ncpus}"],
+            "lvs.log", "LVS run failed.", self.timeouts.get("lvs")
         )
-        self.run(["grep", "Congratulations! Netlists match", "lvs.log"], "lvs.err", "GDS does not conform to schematics!")
+        with open(self.run_dir / "lvs.log", errors = "replace") as f:
+            if not any("Congratulations! Netlists match" in l for l in f):
+                self.panic(f"GDS does not conform to schematics! Please see {self.run_dir / 'lvs.log'} .")
         logging.info("GDS is LVS clean.")
 
-    def run_xyce_test(self, name : str, netlist : str, is_flat : bool = True):
+    def run_xyce_test(self, name : str, netlist : str, is_flat : bool = True, ncpus : int = 1):
         """
-        Xyce test helper.
+        Xyce test helper, tests for each netlist are run in their own directory.
         """
         logging.info(f"Running Xyce tests for {name} netlist...")
-        test = EfuseArrayTest(self.nwords, self.word_width, self.tb_name, netlist, self.spice_name, is_flat, 5.0, self.ncpus)
-        if not test.run_tests():
-            self.panic("Xyce test failed, stopping.")
+        with stats.measure(f"xyce_tests {name}", "step", netlist = name, flat = is_flat, ncpus = ncpus):
+            test = EfuseArrayTest(self.nwords, self.word_width, self.tb_name, netlist, self.spice_name.name, is_flat, 5.0, ncpus,
+                self.timeouts.get("xyce"), self.run_dir / f"xyce_{name.lower()}", self.bit_sel_buf)
+            if not test.run_tests():
+                self.panic("Xyce test failed, stopping.")
 
-    def xyce_tests(self):
+    def xyce_tests(self, ncpus : int = 1):
         """
         Perform tests in Xyce simulation.
         """
@@ -221,11 +370,11 @@ class EfuseFlow:
 
         logging.info("Running tests in Xyce simulation...")
         if self.xyce_netlist in ["schematic", "all"]:
-            self.run_xyce_test("schematic", self.spice_name, False)
+            self.run_xyce_test("schematic", self.spice_name, False, ncpus)
         if self.xyce_netlist in ["extracted", "all"]:
-            self.run_xyce_test("extracted", self.ext_netlist)
+            self.run_xyce_test("extracted", self.ext_netlist, True, ncpus)
         if self.xyce_netlist in ["pex", "all"]:
-            self.run_xyce_test("PEX", self.pex_netlist)
+            self.run_xyce_test("PEX", self.pex_netlist, True, ncpus)
 
 
         logging.info("Xyce tests completed succesfully!")
@@ -235,10 +384,8 @@ class EfuseFlow:
         Generate Verilog model & blackbox
         """
         logging.info("Generating Verilog models...")
-        v = EfuseVerilog(self.name, self.nwords, self.word_width)
+        v = EfuseVerilog(self.name, self.nwords, self.word_width, self.run_dir, self.bit_sel_buf)
         v.gen_verilog()
-        self.verilog_bb = v.bb_file
-        self.verilog_model = v.model_file
 
     def gen_digital_wrapper(self):
         """
@@ -247,16 +394,13 @@ class EfuseFlow:
         if self.digital_wrapper[0] != "none":
             logging.info(f"Implementing {self.digital_wrapper[0]} digital wrapper with Librelane...")
 
-            self.digital = EfuseLibrelane(self.digital_wrapper, self.name, self.gds_name, self.lef_name, self.verilog_bb, self.nwords, self.word_width)
-            self.digital.run()
+            self.digital = EfuseLibrelane(self.digital_wrapper, self.name, self.gds_name, self.lef_name, self.verilog_bb, self.nwords, self.word_width,
+                                                self.bit_sel_buf)
+            self.digital.run(self.run_dir / "librelane", self.timeouts.get("librelane"))
             if not self.digital.final:
                 self.panic("Digital wrapper generation failed!")
 
-            self.digital_release_dir = self.release_dir / self.digital.name
-
             logging.info("Digital wrapper generated successfully!")
-        else:
-            self.digital_release_dir = None
 
     def release_files(self):
         """
@@ -264,51 +408,421 @@ class EfuseFlow:
         """
         logging.info(f"Copying resulting files into {self.release_dir}...")
         os.makedirs(self.release_dir, exist_ok=True)
-        copy(self.gds_name, self.release_dir)
-        copy(self.lef_name, self.release_dir)
-        copy(self.spice_name, self.release_dir)
-        copy(self.pex_netlist, self.release_dir)
-        copy(self.verilog_bb, self.release_dir)
-        copy(self.verilog_model, self.release_dir)
-
-        if self.digital_release_dir:
-            os.makedirs(self.digital_release_dir, exist_ok=True)
-            copy(self.digital.gds, self.digital_release_dir)
-            copy(self.digital.lef, self.digital_release_dir)
-            copy(self.digital.nl,  self.digital_release_dir)
-            copy(self.digital.pnl, self.digital_release_dir)
-            copytree(self.digital.lib, self.digital_release_dir, dirs_exist_ok=True)
-            copytree(self.digital.sdf, self.digital_release_dir, dirs_exist_ok=True)
-
-    def run_flow(self):        
-        """
-        Run all stages of the flow.
-        """
-        # change to run directory
+        self.released = []
+        for f in (self.gds_name, self.lef_name, self.spice_name, self.pex_netlist, self.verilog_bb, self.verilog_model):
+            copy(f, self.release_dir)
+            self.released.append(self.release_dir / f.name)
+
+        if self.digital_wrapper[0] != "none":
+            if not self.digital:
+                # wrapper stage was skipped, take results of the previous run
+                self.digital = EfuseLibrelane(self.digital_wrapper, self.name, self.gds_name, self.lef_name, self.verilog_bb, self.nwords, self.word_width,
+                                                self.bit_sel_buf)
+                if not self.digital.collect(self.run_dir / "librelane"):
+                    self.panic("Digital wrapper results not found!")
+            digital_release_dir = self.release_dir / self.digital.name
+            self.released.append(digital_release_dir)
+            os.makedirs(digital_release_dir, exist_ok=True)
+            copy(self.digital.gds, digital_release_dir)
+            copy(self.digital.lef, digital_release_dir)
+            copy(self.digital.nl,  digital_release_dir)
+            copy(self.digital.pnl, digital_release_dir)
+            copytree(self.digital.lib, digital_release_dir, dirs_exist_ok=True)
+            copytree(self.digital.sdf, digital_release_dir, dirs_exist_ok=True)
+
+    def stages(self) -> list:
+        """
+        Flow stages with their input & output artifacts.
+        """
+        src = self.scripts_dir
+        return [
+            Stage("generate_gds_lef",   self.generate_gds_lef,      [],                                 ["gds", "lef", "add_cells"],
+                params = {"columns" : self.columns, "aspect" : self.aspect, "centre_tap" : self.centre_tap, "bit_sel_buf" : self.bit_sel_buf,
+                            "ctrl_buf_rows" : self.ctrl_buf_rows},
+                sources = [src / "efuse_gds_gen", src / "magic"]),
+            Stage("generate_spice",     self.generate_spice,        ["add_cells"],                      ["spice", "klvs", "tb", "ports"],
+                params = {"ctrl_buf_rows" : self.ctrl_buf_rows}, sources = [src / "efuse_spice_gen/generate_spice.py"]),
+            Stage("magic_extraction",   self.magic_extraction,      ["gds", "ports"],                   ["ext", "pex"],
+                sources = [src / "magic"]),
+            Stage("klayout_drc",        self.klayout_drc,           ["gds"],                            ["drc"], self.ncpus,
+                params = {"skip" : self.skip_checks}),
+            Stage("klayout_lvs",        self.klayout_lvs,           ["gds", "klvs"],                    ["lvs"], self.ncpus,
+                params = {"skip" : self.skip_checks}),
+            Stage("xyce_tests",         self.xyce_tests,            ["spice", "tb", "ext", "pex"],      ["xyce"], self.ncpus,
+                params = {"netlist" : self.xyce_netlist}, sources = [src / "efuse_spice_gen"]),
+            Stage("generate_verilog",   self.generate_verilog,      [],                                 ["verilog"],
+                params = {"bit_sel_buf" : self.bit_sel_buf}, sources = [src / "digital/verilog.py", src / "digital/tb/efuse_array.v"]),
+            Stage("gen_digital_wrapper", self.gen_digital_wrapper,  ["gds", "lef", "verilog"],          ["digital"],
+                params = {"wrapper" : self.digital_wrapper}, sources = [src / "digital"], cache = False),
+            Stage("release_files",      self.release_files,         ["gds", "lef", "spice", "pex", "verilog", "digital", "drc", "lvs", "xyce"], []),
+        ]
+
+    def stage_key(self, stage : Stage) -> str:
+        """
+        Cache key of stage results: stage configuration, compiler sources, PDK & contents of stage inputs.
+        """
+        inputs = {i : hash_paths(self.files[i]) for i in stage.inputs}
+        return hash_key("stage", stage.name, self.nwords, self.word_width, stage.params, self.src_hash, self.pdk_id, inputs)
+
+    def stage_params(self, stage : Stage) -> dict:
+        """
+        All the parameters stage results depend on, including its sources.
+        """
+        return dict(stage.params, nwords = self.nwords, word_width = self.word_width, 
+            sources = hash_paths(stage.sources, self.scripts_dir))
+
+    def run_stage(self, stage : Stage, ncpus : int):
+        """
+        Measure resources used by a stage.
+        """
+        with stats.measure(stage.name, "stage", ncpus = ncpus) as m:
+            m.status = self.update_stage(stage, ncpus)
+
+    def update_stage(self, stage : Stage, ncpus : int) -> str:
+        """
+        Run a single stage unless it is up to date in the run directory or its outputs are cached.
+        Returns stage status.
+        """
+        tracked = stage.outputs and all(o in self.files for o in stage.outputs)
+        forced = stage.name in self.forced_stages
+        if stage.name in self.kept_stages:
+            logging.info(f"Stage {stage.name} skipped, using results from {self.run_dir}.")
+            return "kept"
+
+        params = self.stage_params(stage)
+        inputs = snapshot(self.files, stage.inputs)
+        if tracked and not forced and self.manifests.is_current(stage.name, params, inputs, snapshot(self.files, stage.outputs)):
+            logging.info(f"Stage {stage.name} is up to date, skipped.")
+            return "up to date"
+        self.manifests.invalidate(stage.name)
+
+        # skipped checks produce no results, nothing to cache
+        cacheable = self.cache and stage.cache and tracked and not forced and not stage.params.get("skip")
+        if cacheable:
+            key = self.stage_key(stage)
+        status = "ok"
+        if cacheable and self.cache.restore(key, self.run_dir):
+            logging.info(f"Stage {stage.name} results restored from cache.")
+            status = "cached"
+        else:
+            stage.run(ncpus)
+            if cacheable:
+                outputs = [f for o in stage.outputs for f in self.files[o] if f.exists()]
+                self.cache.store(key, outputs, {"stage" : stage.name, "macro" : self.name})
+
+        if tracked:
+            self.manifests.write(stage.name, params, inputs, snapshot(self.files, stage.outputs))
+        return status
+
+    def select_stages(self) -> StageScheduler:
+        """
+        Apply --from-stage & --to-stage selection: stages needed for --to-stage are run, 
+        --from-stage and all stages depending on it are rerun and stages it depends on are kept.
+        """
+        stages = self.stages()
+        sched = StageScheduler(stages, self.ncpus, self.run_stage)
+        for s in (self.from_stage, self.to_stage):
+            if s and s not in sched.stages:
+                self.panic(f"Unknown stage {s}, available stages are: {', '.join(sched.stages)}.")
+
+        if self.to_stage:
+            needed = sched.ancestors(self.to_stage) | {self.to_stage}
+            sched = StageScheduler([s for s in stages if s.name in needed], self.ncpus, self.run_stage)
+
+        self.forced_stages = set()
+        self.kept_stages = set()
+        if self.from_stage:
+            self.forced_stages = {self.from_stage} | sched.descendants(self.from_stage)
+            self.kept_stages = sched.ancestors(self.from_stage)
+        return sched
+
+    def run_flow(self):
+        """
+        Run the flow, resources used by all stages & tools are written to stats.json in the run directory.
+        Raises FlowError on failure.
+        """
+        token = _current_flow.set(self)
+        root = logging.getLogger()
+        root.addHandler(self.log_handler)
+        if root.getEffectiveLevel() > self.log_level:
+            root.setLevel(self.log_level)
+        try:
+            with self.stats.measure(self.name, nwords = self.nwords, word_width = self.word_width, ncpus = self.ncpus):
+                self.run_stages()
+        finally:
+            self.stats.write(self.run_dir / "stats.json")
+            if self.trace:
+                self.stats.write_trace(self.run_dir / "trace.json")
+                logging.info(f"Trace written to {self.run_dir / 'trace.json'}, open it in ui.perfetto.dev or chrome://tracing")
+            self.stats.log_summary()
+            root.removeHandler(self.log_handler)
+            self.log_handler.close()
+            _current_flow.reset(token)
+
+    def run_stages(self):        
+        """
+        Run all stages of the flow. Independent stages run in parallel within --ncpus budget.
+        """
         logging.info(f"Starting eFuse array generation flow, working directory is {self.run_dir}")
-        os.chdir(self.run_dir)
+
+        if not (1 <= self.columns <= self.word_width):
+            self.panic(f"Number of columns should be 1 to {self.word_width}, got {self.columns}.")
+        if self.bit_sel_buf and self.centre_tap:
+            self.panic("Bit select buffers are not supported with centre tapped bitlines.")
+        if self.ctrl_buf_rows < 0:
+            self.panic(f"Number of bitlines per control buffer should not be negative, got {self.ctrl_buf_rows}.")
+        self.check_pdk()
+        if self.bit_sel_buf:
+            capacity = bit_sel_buf_capacity(self.nwords, self.word_width, self.ctrl_buf_rows, bitline_cache(self.cache.dir) if self.cache else None,
+                                            self.stdcells())
+            if capacity < self.nwords:
+                self.panic(f"Bit select buffers of {self.nwords} words do not fit in {self.word_width} bitlines, at most {capacity} fit. "
+                            "Please increase word width or disable --bit-sel-buf.")
+        scheduler = self.select_stages()
+
+        # whole macro could be already in the cache
+        if self.cache:
+            self.src_hash = hash_paths([self.scripts_dir, self.root_dir / "efuse.py"], self.root_dir)
+            self.pdk_id = pdk_id(self.pdk_path)
+            macro_key = hash_key("macro", self.nwords, self.word_width, self.columns, self.aspect, self.centre_tap, self.bit_sel_buf, self.ctrl_buf_rows,
+                self.digital_wrapper, 
+                self.xyce_netlist, self.skip_checks, self.src_hash, self.pdk_id)
+            partial = self.from_stage or self.to_stage
+            if not partial and self.cache.restore(macro_key, self.release_dir):
+                logging.info(f"{self.name} found in cache {self.cache.dir}, release files restored into {self.release_dir}")
+                return
 
         # run all the stages
-        self.check_environment()
+        self.check_tools()
     
-        self.generate_gds_lef()
-        
-        self.generate_spice()
+        scheduler.run()
 
-        self.magic_extraction()
+        if self.cache and self.released:
+            self.cache.store(macro_key, self.released, {"macro" : self.name})
+
+        logging.info("eFuse array generation completed successfully!")
 
-        if not self.skip_checks:
-            self.klayout_checks()
+class Artifacts:
+    """
+    Released files of a compiled macro.
+    """
+    def __init__(self, flow : EfuseFlow):
+        self.name = flow.name
+        self.run_dir = flow.run_dir
+        self.release_dir = flow.release_dir
+        self.gds = flow.release_dir / flow.gds_name.name
+        self.lef = flow.release_dir / flow.lef_name.name
+        self.spice = flow.release_dir / flow.spice_name.name
+        self.pex = flow.release_dir / flow.pex_netlist.name
+        self.verilog_bb = flow.release_dir / flow.verilog_bb.name
+        self.verilog_model = flow.release_dir / flow.verilog_model.name
+        # the wrapper object is not created when the whole macro is restored from the cache
+        self.digital = flow.release_dir / EfuseLibrelane.wrapper_name(flow.digital_wrapper) if flow.digital_wrapper[0] != "none" else None
+        self.stats = flow.run_dir / "stats.json"
+
+    def to_dict(self) -> dict:
+        return {k : str(v) if v else None for k, v in vars(self).items()}
+
+# compile_macro() configuration defaults, same keys are used in batch specification
+DEFAULT_CONFIG = {
+    "xyce_netlist"      : "pex",
+    "digital_wrapper"   : "none",
+    "digital_depth"     : None,
+    "digital_width"     : None,
+    "skip_drclvs"       : False,
+    "ncpus"             : 1,
+    "verbose"           : False,
+    "cache"             : True,
+    "cache_dir"         : None,
+    "trace"             : False,
+    "timeouts"          : {},
+    "release_dir"       : None,
+    "columns"           : 1,
+    "aspect"            : None,
+    "centre_tap"        : False,
+    "bit_sel_buf"       : False,
+    "ctrl_buf_rows"     : 0,
+}
+
+def new_flow(config : dict, workdir : Path, templates : CellTemplates = None, **kwargs) -> EfuseFlow:
+    """
+    Flow for config dict ("nwords", "word_width" & optional DEFAULT_CONFIG keys) working in workdir,
+    kwargs are passed to EfuseFlow.
+    """
+    c = dict(DEFAULT_CONFIG, **config)
+    workdir = Path(workdir).absolute()
+    return EfuseFlow(c["nwords"], c["word_width"], ROOT_DIR, c["xyce_netlist"], 
+        (c["digital_wrapper"], c["digital_depth"] or c["nwords"], c["digital_width"] or c["word_width"]), 
+        c["ncpus"], c["skip_drclvs"], c["verbose"], ArtifactCache(c["cache_dir"]) if c["cache"] else None, 
+        workdir, quiet = True, trace = c["trace"], timeouts = c["timeouts"], release_dir = c["release_dir"] or workdir / "release",
+        templates = templates, columns = c["columns"], aspect = c["aspect"], centre_tap = c["centre_tap"], bit_sel_buf = c["bit_sel_buf"],
+        ctrl_buf_rows = c["ctrl_buf_rows"], **kwargs
+    )
 
-        self.xyce_tests()
+def compile_macro(config : dict, workdir : Path, templates : CellTemplates = None) -> Artifacts:
+    """
+    Compile eFuse array macro described by config dict ("nwords", "word_width" & optional DEFAULT_CONFIG keys).
+    All the flow files are put into workdir and released files into workdir/release unless "release_dir" is set.
+    Nothing depends on the current directory, so several macros could be compiled concurrently in threads
+    of one process. Raises FlowError on failure.
+    """
+    flow = new_flow(config, workdir, templates)
+    flow.run_flow()
+    return Artifacts(flow)
 
-        self.generate_verilog()
+def batch_worker(config : dict, ncpus : int, run_dir : Path) -> dict:
+    """
+    Run the flow for a single configuration of the batch in a worker process.
+    """
+    start = time.time()
+    res = {"run_dir" : str(run_dir), "stats" : str(Path(run_dir) / "stats.json")}
+    try:
+        art = compile_macro(dict(config, ncpus = ncpus, release_dir = ROOT_DIR / "macros" / config["name"]), run_dir)
+        res.update(ok = True, size = macro_size(art.lef))
+    except FlowError as e:
+        res.update(ok = False, error = str(e))
+    res["time"] = time.time() - start
+    return res
+
+def run_batch(args, root_dir : Path):
+    """
+    Compile a list or matrix of configurations from command line and/or spec file.
+    """
+    defaults = {
+        "xyce_netlist"      : args.xyce_netlist,
+        "digital_wrapper"   : args.digital_wrapper,
+        "digital_depth"     : args.digital_depth,
+        "digital_width"     : args.digital_width,
+        "skip_drclvs"       : args.skip_drclvs,
+        "columns"           : args.columns,
+        "aspect"            : args.aspect,
+        "centre_tap"        : args.centre_tap,
+        "bit_sel_buf"       : args.bit_sel_buf,
+        "ctrl_buf_rows"     : args.ctrl_buf_rows,
+    }
+    configs = []
+    if args.number_of_words and args.word_width:
+        configs += expand_configs(dict(defaults, nwords = args.number_of_words, word_width = args.word_width))
+    if args.batch:
+        configs += [dict(defaults, **c) for c in read_spec(args.batch)]
+
+    # same configuration could come from the command line & the spec file, different ones must not share a release dir
+    names = dict()
+    unique = []
+    for c in configs:
+        c["name"] = macro_name(c["nwords"], c["word_width"], c["columns"], c["aspect"], c["centre_tap"], c["bit_sel_buf"], c["ctrl_buf_rows"])
+        if c["name"] in names:
+            if names[c["name"]] != c:
+                EfuseFlow.panic(f"Configuration {c['name']} is requested more than once with different options.")
+            logging.warning(f"Configuration {c['name']} is requested more than once, it is compiled once.")
+            continue
+        names[c["name"]] = dict(c)
+        unique.append(c)
+    configs = unique
+    for c in configs:
+        c.update(verbose = args.verbose, cache = not args.no_cache, cache_dir = args.cache_dir, trace = args.trace,
+            timeouts = dict(args.timeout))
+
+    batch_dir = EfuseFlow.new_run_dir(root_dir, "_batch")
+    setup_console_logging(logging.INFO, batch_dir / "batch.log")
+    results = BatchRunner(batch_worker, configs, batch_dir, args.jobs, args.ncpus).run()
+    if not all(r["ok"] for r in results):
+        EfuseFlow.panic("Some of the configurations failed, see summary above.")
+
+class DaemonRequests:
+    """
+    Requests served by the compiler daemon, building blocks are kept warm in cell templates.
+    All requests take "config" (same keys as compile_macro) & absolute "workdir".
+    """
+    def __init__(self, templates : CellTemplates):
+        self.templates = templates
 
-        self.gen_digital_wrapper()
+    def handlers(self) -> dict:
+        return {"compile" : self.compile, "layout" : self.layout}
 
-        self.release_files()
+    @staticmethod
+    def args(request : dict) -> tuple:
+        if "config" not in request or "workdir" not in request or not Path(request["workdir"]).is_absolute():
+            EfuseFlow.panic("Request should contain config & absolute workdir.")
+        return request["config"], Path(request["workdir"])
 
-        logging.info("eFuse array generation completed successfully!")
+    def run_flow(self, flow : EfuseFlow, emit):
+        """
+        Run the flow streaming its log records to the client.
+        """
+        events = EventHandler(emit, flow.log_level)
+        events.addFilter(FlowLogFilter(flow))
+        root = logging.getLogger()
+        root.addHandler(events)
+        try:
+            flow.run_flow()
+        finally:
+            root.removeHandler(events)
+
+    def compile(self, request : dict, emit) -> dict:
+        """
+        Full flow, returns released files & macro size.
+        """
+        config, workdir = self.args(request)
+        flow = new_flow(config, workdir, self.templates)
+        self.run_flow(flow, emit)
+        art = Artifacts(flow)
+        return dict(art.to_dict(), size = macro_size(art.lef))
+
+    def layout(self, request : dict, emit) -> dict:
+        """
+        GDS only, generated in the daemon process & returned with macro size in microns.
+        With "lef" set the flow runs up to generate_gds_lef stage in workdir to get LEF too.
+        """
+        config, workdir = self.args(request)
+        if request.get("lef"):
+            flow = new_flow(config, workdir, self.templates, to_stage = "generate_gds_lef")
+            self.run_flow(flow, emit)
+            return {"gds" : str(flow.gds_name), "lef" : str(flow.lef_name), "size" : macro_size(flow.lef_name)}
+
+        c = dict(DEFAULT_CONFIG, **config)
+        nwords, word_width = c["nwords"], c["word_width"]
+        name = macro_name(nwords, word_width, c["columns"], c["aspect"], c["centre_tap"], c["bit_sel_buf"], c["ctrl_buf_rows"])
+        os.makedirs(workdir, exist_ok = True)
+        array = create_efuse_array(workdir / f"{name}.gds", name, nwords, word_width, add_cells = workdir / "add_cells.json", 
+            templates = self.templates, columns = c["columns"], aspect = c["aspect"], centre_tap = c["centre_tap"], buf_col_sel = c["bit_sel_buf"],
+            ctrl_rows = c["ctrl_buf_rows"])
+        bbox = array.bbox()
+        return {"gds" : str(workdir / f"{name}.gds"), "size" : (bbox.width() / 1000, bbox.height() / 1000)}
+
+def run_daemon(address : str, verbose : bool):
+    """
+    Serve compile requests until interrupted, cell templates are generated in advance.
+    """
+    setup_console_logging(logging.DEBUG if verbose else logging.INFO)
+    EfuseFlow.find_pdk()
+    templates = CellTemplates()
+    start = time.perf_counter()
+    warm_up(templates)
+    logging.info(f"{len(templates)} cell templates generated in {time.perf_counter() - start:.1f}s")
+    # stop serving (and remove the socket) on kill as on Ctrl-C
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        CompilerDaemon(address, DaemonRequests(templates).handlers()).serve()
+    except KeyboardInterrupt:
+        pass
+
+def int_list(s : str) -> list:
+    """
+    Comma separated list of integers argument.
+    """
+    return [int(i) for i in s.split(",")]
+
+TIMEOUT_TOOLS = ["magic", "drc", "lvs", "xyce", "librelane"]
+
+def timeout_arg(s : str) -> tuple:
+    """
+    TOOL=SECONDS timeout argument.
+    """
+    tool, _, t = s.partition("=")
+    if tool not in TIMEOUT_TOOLS:
+        raise argparse.ArgumentTypeError(f"unknown tool {tool}, should be one of: {', '.join(TIMEOUT_TOOLS)}")
+    return tool, float(t)
 
 def main():
     """
@@ -316,9 +830,15 @@ def main():
     """
     # parse arguments
     parser = argparse.ArgumentParser(description = "A script to generate and verify eFuse array targeting GF180MCU technology.")
-    parser.add_argument("number_of_words", type = int,      help = "Number of words in eFuse array.")
-    parser.add_argument("word_width", type = int,           help = "Width of word in eFuse array.")
-    parser.add_argument("--ncpus", type = int, default = 1, help = "Number of CPU threads to use in KLayout & Xyce, default = 1.")
+    parser.add_argument("number_of_words", type = int_list, nargs = "?",
+        help = "Number of words in eFuse array. Comma separated list compiles all the combinations with word widths.")
+    parser.add_argument("word_width", type = int_list, nargs = "?",
+        help = "Width of word in eFuse array. Comma separated list compiles all the combinations with word numbers.")
+    parser.add_argument("--batch", type = Path, default = None, 
+        help = "JSON file with a list of configurations or a matrix of parameters to compile."
+    )
+    parser.add_argument("--jobs", type = int, default = 1, help = "Number of configurations compiled in parallel in batch mode, default = 1.")
+    parser.add_argument("--ncpus", type = int, default = 1, help = "Number of CPU threads shared by parallel flow stages, KLayout & Xyce, default = 1.")
     parser.add_argument("--skip-drclvs", action="store_true" , help = "Skip DRC & LVS checks.")
     parser.add_argument("--verbose", action="store_true" , help = "Debug level output verbosity.")
     parser.add_argument("--xyce-netlist", type = str, default = "pex", choices=["none", "schematic", "extracted", "pex", "all"],
@@ -329,9 +849,57 @@ def main():
     )
     parser.add_argument("--digital-depth", type = int, default = None, help = "Depth of digital memory block.")
     parser.add_argument("--digital-width", type = int, default = None, help = "Width of digital memory block.")
+    parser.add_argument("--columns", type = int, default = 1, help = "Number of columns array words are folded into, default = 1.")
+    parser.add_argument("--aspect", type = float, default = None, 
+        help = "Target width/height ratio of the array, selects the number of columns automatically."
+    )
+    parser.add_argument("--centre-tap", action="store_true" , help = "Place senseamps & programming PMOSes in the middle of bitlines.")
+    parser.add_argument("--bit-sel-buf", action="store_true" , 
+        help = "Drive bit select lines by inverters inside the array sized for the word width, pins become BIT_SEL_N."
+    )
+    parser.add_argument("--ctrl-buf-rows", type = int, default = 0, metavar = "N",
+        help = "Drive SENSE & PRESET_N lines of each N bitlines by buffers inside the array, default = 0 (no buffers)."
+    )
+    parser.add_argument("--no-cache", action="store_true" , help = "Do not use the artifact cache.")
+    parser.add_argument("--resume", type = Path, default = None, 
+        help = "Continue the flow in existing run directory skipping stages which are up to date."
+    )
+    parser.add_argument("--from-stage", type = str, default = None, help = "Rerun flow starting from this stage, previous stages are kept.")
+    parser.add_argument("--to-stage", type = str, default = None, help = "Stop the flow after this stage.")
+    parser.add_argument("--timeout", type = timeout_arg, action = "append", default = [], metavar = "TOOL=SECONDS",
+        help = f"Kill the tool if a single run takes longer, could be repeated. Tools: {', '.join(TIMEOUT_TOOLS)}."
+    )
+    parser.add_argument("--trace", action="store_true" , help = "Write Chrome/Perfetto trace of all stages & tool calls into trace.json in the run directory.")
+    parser.add_argument("--cache-dir", type = Path, default = None, 
+        help = "Artifact cache directory, default = $EFUSE_CACHE_DIR or ~/.cache/gf180_efuse_compiler."
+    )
+    parser.add_argument("--serve", type = str, default = None, metavar = "ADDRESS",
+        help = "Run compiler daemon keeping cell libraries warm, ADDRESS is unix:PATH for a Unix socket or [localhost:]PORT for HTTP."
+    )
     args = parser.parse_args()
-    
-    root_dir = Path(__file__).parent.absolute() 
+
+    if args.serve:
+        try:
+            run_daemon(args.serve, args.verbose)
+        except (FlowError, ValueError, OSError) as e:
+            logging.error(f"Compiler daemon failed: {e}")
+            sys.exit(1)
+        return
+
+    if not args.batch and not (args.number_of_words and args.word_width):
+        parser.error("either number_of_words & word_width or --batch are required")
+
+    if args.batch or len(args.number_of_words) > 1 or len(args.word_width) > 1:
+        if args.resume or args.from_stage or args.to_stage:
+            parser.error("--resume, --from-stage & --to-stage are not supported in batch mode")
+        try:
+            run_batch(args, ROOT_DIR)
+        except FlowError:
+            sys.exit(1)
+        return
+
+    args.number_of_words = args.number_of_words[0]
+    args.word_width = args.word_width[0]
     
     if not args.digital_width:
         args.digital_width = args.word_width    
@@ -340,11 +908,17 @@ def main():
         args.digital_depth = args.number_of_words
 
     # run the flow
-    flow = EfuseFlow(args.number_of_words, args.word_width, root_dir, args.xyce_netlist, 
+    flow = EfuseFlow(args.number_of_words, args.word_width, ROOT_DIR, args.xyce_netlist, 
         (args.digital_wrapper, args.digital_depth, args.digital_width),
-        args.ncpus, args.skip_drclvs, args.verbose
+        args.ncpus, args.skip_drclvs, args.verbose, None if args.no_cache else ArtifactCache(args.cache_dir),
+        args.resume, from_stage = args.from_stage, to_stage = args.to_stage, trace = args.trace, timeouts = args.timeout,
+        columns = args.columns, aspect = args.aspect, centre_tap = args.centre_tap, bit_sel_buf = args.bit_sel_buf,
+        ctrl_buf_rows = args.ctrl_buf_rows
     )
-    flow.run_flow()
+    try:
+        flow.run_flow()
+    except FlowError:
+        sys.exit(1)
     
     
 if __name__ == '__main__':
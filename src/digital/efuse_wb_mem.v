@@ -87,7 +87,11 @@ module `EFUSE_WBMEM_NAME #(
             )
             `endif
             efuse_array (
+                `ifdef EFUSE_BIT_SEL_N
+                .BIT_SEL_N  (bit_sel),
+                `else
                 .BIT_SEL    (bit_sel),
+                `endif
                 .COL_PROG_N (col_prog_n[EFUSE_WORD_WIDTH*(i+1)-1:EFUSE_WORD_WIDTH*i]),
                 .PRESET_N   (preset_n[i]),
                 .SENSE      (sense[i]),
@@ -122,11 +126,20 @@ module `EFUSE_WBMEM_NAME #(
         end
 
         for (i = 0; i < EFUSE_NWORDS; i = i + 1) begin
+            `ifdef EFUSE_BIT_SEL_N
+            // bit select lines are driven inside the array, its pins are inverted
+            (* keep, dont_touch  *)
+            gf180mcu_fd_sc_mcu7t5v0__inv_1 bitsel_buf_keep_cell (
+                .I(bit_sel_reg[i]),
+                .ZN(bit_sel[i])
+            );
+            `else
             (* keep, dont_touch  *)
             gf180mcu_fd_sc_mcu7t5v0__buf_2 bitsel_buf_keep_cell (
                 .I(bit_sel_reg[i]),
                 .Z(bit_sel[i])
             );
+            `endif
         end
 
         for (i = 0; i < EFUSE_ARRAYS_DPT; i = i + 1) begin
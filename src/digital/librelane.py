@@ -3,7 +3,6 @@
 #
 
 import os
-import sys
 import re
 import json
 from math import log2
@@ -11,6 +10,9 @@ import logging
 import subprocess as sp
 from pathlib import Path
 
+from ..flow import process, stats
+from ..flow.errors import FlowError
+
 class LibrelaneRunner():
     """
     Helper class to run Librelane
@@ -56,55 +58,62 @@ class LibrelaneRunner():
             inst["location"] = [ instances[i][0], instances[i][1] ]
             inst["orientation"] = instances[i][2]
 
-    def run(self):
+    def run(self, run_dir : Path = Path("librelane"), timeout : float = None):
         """
-        Create necessary files and run Librelane with config from dict
+        Create necessary files in run_dir and run Librelane there with config from dict, output is streamed into librelane.log
         """
-        orig_wd = os.getcwd()
-        os.makedirs("librelane", exist_ok=True)
-        os.chdir("librelane")
+        run_dir = Path(run_dir).absolute()
+        os.makedirs(run_dir, exist_ok=True)
 
-        with open("config.json", "w") as f:
+        with open(run_dir / "config.json", "w") as f:
             json.dump(self.config, f, indent = 4)
         
-        log = Path("librelane.log").absolute()
+        log = run_dir / "librelane.log"
         try:
-            run = sp.run(["librelane", "config.json", "--pdk", os.environ["PDK"], "--pdk-root", os.environ["PDK_ROOT"], "--manual-pdk"],
-                stdout = sp.PIPE, stderr = sp.STDOUT, check = True)
-            with open(log, "a") as f:
-                f.write(run.stdout.decode("utf-8"))
-            self.final = list(Path("runs").glob("*/final"))[0].absolute()
-
-            self.gds = self.final / "gds" / f"{self.name}.gds"
-            self.lef = self.final / "lef" / f"{self.name}.lef"
-            self.nl  = self.final / "nl"  / f"{self.name}.nl.v"
-            self.pnl = self.final / "pnl" / f"{self.name}.pnl.v"
-            self.lib = self.final / "lib"
-            self.sdf = self.final / "sdf"
+            with stats.measure("librelane", design = self.config.get("DESIGN_NAME"), pdk = os.environ["PDK"]):
+                process.run(["librelane", "config.json", "--pdk", os.environ["PDK"], "--pdk-root", os.environ["PDK_ROOT"], "--manual-pdk"],
+                    log = log, cwd = run_dir, check = True, timeout = timeout)
+            self.collect(run_dir)
             
-        except sp.CalledProcessError as e:
-            logging.error(f"Librelane run failed! See {log} for log.")
-            with open(log, "w") as f:
-                f.write(e.stdout.decode("utf-8"))
+        except (sp.CalledProcessError, sp.TimeoutExpired) as e:
+            logging.error(f"Librelane run failed! Last lines of the log:\n{e.output}")
+            logging.error(f"See {log} for full log.")
             self.final = None
 
-        os.chdir(orig_wd)
+        return self.final
+
+    def collect(self, run_dir : Path = Path("librelane")):
+        """
+        Find final results of the latest Librelane run.
+        """
+        finals = sorted((run_dir / "runs").glob("*/final"))
+        if not finals:
+            self.final = None
+            return None
+        self.final = finals[-1].absolute()
+
+        self.gds = self.final / "gds" / f"{self.name}.gds"
+        self.lef = self.final / "lef" / f"{self.name}.lef"
+        self.nl  = self.final / "nl"  / f"{self.name}.nl.v"
+        self.pnl = self.final / "pnl" / f"{self.name}.pnl.v"
+        self.lib = self.final / "lib"
+        self.sdf = self.final / "sdf"
         return self.final
 
     @staticmethod 
     def panic(msg : str):
         """
-        Exit with error message.
+        Stop with error message.
         """
         logging.error(msg)
-        sys.exit(1)
+        raise FlowError(msg)
 
 
 class EfuseLibrelane(LibrelaneRunner):
     """
     eFuse memory digital wrapper implementation in Librelane
     """
-    def __init__(self, params : tuple, macro : str, gds : str, lef : str, bb : str, nwords : int, word_width : int):
+    def __init__(self, params : tuple, macro : str, gds : str, lef : str, bb : str, nwords : int, word_width : int, bit_sel_n : bool = False):
 
         super().__init__()
 
@@ -145,7 +154,7 @@ class EfuseLibrelane(LibrelaneRunner):
                     break
 
         # set basic vars
-        self.name = f"efuse_wb_mem_{params[1]}x{params[2]}"
+        self.name = self.wrapper_name(params)
         self.config["DESIGN_NAME"] = self.name
         self.config["VERILOG_FILES"] = [ str(self.cd / "efuse_wb_mem.v") ]
         self.config["PNR_SDC_FILE"] = [ str(self.cd / "constraints.sdc") ]
@@ -156,6 +165,8 @@ class EfuseLibrelane(LibrelaneRunner):
         mask = (params[2] // 8) if params[2] % 8 == 0 else 1
 
         self.config["VERILOG_DEFINES"] = [f"EFUSE_WBMEM_NAME={self.name}", f"EFUSE_ARRAY_NAME={macro}"]
+        if bit_sel_n:
+            self.config["VERILOG_DEFINES"].append("EFUSE_BIT_SEL_N")
         self.config["SYNTH_PARAMETERS"] = [
             f"EFUSE_NWORDS={nwords}", 
             f"EFUSE_WORD_WIDTH={word_width}", 
@@ -209,3 +220,10 @@ class EfuseLibrelane(LibrelaneRunner):
         for x in range(n_arrays_depth):
             array_inst.update({f"efuse_gen_depth[{x}].efuse_array" : [10 + (array_x+array_step_x)*x , cm + 5, "N" if (x%2) else "FN"]})
         self.add_macro(macro, gds, lef, bb, array_inst)
+
+    @staticmethod
+    def wrapper_name(params : tuple) -> str:
+        """
+        Name of the wrapper design for (bus, depth, width) parameters, results are released in a folder of this name.
+        """
+        return f"efuse_wb_mem_{params[1]}x{params[2]}"
@@ -6,11 +6,12 @@ import re
 from pathlib import Path
 
 class EfuseVerilog:
-    def __init__(self, name : str, nwords : int, word_width : int, out_dir : Path = Path(".")):
+    def __init__(self, name : str, nwords : int, word_width : int, out_dir : Path = Path("."), bit_sel_n : bool = False):
         self.name = name
         self.nwords = nwords
         self.word_width = word_width
         self.odir = out_dir
+        self.bit_sel_n = bit_sel_n
 
     @staticmethod 
     def regexp_patch(ifile : Path, ofile : Path, regex : str, sub : str):
@@ -26,6 +27,10 @@ class EfuseVerilog:
         self.regexp_patch(ifname, ofname, "module efuse_array", f"module {self.name}")
         self.regexp_patch(ofname, ofname, "parameter NWORDS = 16", f"parameter NWORDS = {self.nwords}")
         self.regexp_patch(ofname, ofname, "parameter WORD_WIDTH = 1", f"parameter WORD_WIDTH = {self.word_width}")
+        if self.bit_sel_n:
+            # bit select lines are driven by inverters inside the array
+            self.regexp_patch(ofname, ofname, r"^(\s*input\s+\[NWORDS-1:0\]\s+)BIT_SEL,", r"\1BIT_SEL_N,")
+            self.regexp_patch(ofname, ofname, r"^(\s*localparam STATE_IDLE)", r"    wire [NWORDS-1:0] BIT_SEL = ~BIT_SEL_N;\n\n\1")
 
 
     def gen_verilog_blackbox(self, fname : Path):
@@ -38,7 +43,7 @@ module {self.name} #(
     parameter NWORDS = {self.nwords},
     parameter WORD_WIDTH = {self.word_width}
 ) (
-    input  [NWORDS-1:0]     BIT_SEL,
+    input  [NWORDS-1:0]     {"BIT_SEL_N" if self.bit_sel_n else "BIT_SEL"},
     input  [WORD_WIDTH-1:0] COL_PROG_N,
     input                   PRESET_N,
     input                   SENSE,
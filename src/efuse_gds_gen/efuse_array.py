@@ -3,6 +3,7 @@
 from klayout import db
 import sys
 import json
+import math
 from pathlib import Path
 from os import PathLike
 
@@ -12,6 +13,7 @@ from .cells.mos import mos_ld, mos_grw
 
 # Design constants, sizes are in nm
 NFUSES_PER_BLOCK    = 16
+MAX_BITLINE_BLOCKS  = 16
 EFUSE_XSTEP         = 1920
 EFUSE_YOFF          = 590
 
@@ -57,8 +59,33 @@ SENSE_POWER_WDT     = 1000
 
 CELL_RAIL_WDT       = 600
 
+CENTRE_TAP_SPACE    = 5000
+CENTRE_TAP_OVERLAP  = 4000
+
+COLUMN_SPACE        = 5000
+CHANNEL_SPACE       = 1000
+CHANNEL_POWER_WDT   = 4000
+CHANNEL_STEP        = M2_MIN_WDT + M2_DIST + 2*METALVIA_OVERLAP
+
 GATE_EXTEND         = 320
 
+# bit select buffers, load of a line is estimated from the select NMOS gate & the M4 line in each row.
+# No liberty or extraction data is read, the values are first order estimates:
+#   gate cap    - eps_ox / tox = 0.0345 fF/um / 0.015 um, tox of about 15 nm assumed for the 5V gate oxide,
+#                 overlap & junction caps are not counted (they add some 10-20 %, covered by the inverter margin)
+#   wire cap    - rough total of area, fringe & coupling of a narrow M4 line, a bitline adds ~40 um of it per row,
+#                 i.e. 4 fF against 42 fF of the gate, so even 2x error changes the load by less than 10 %
+#   max load    - 600 fF (13 rows) per unit of drive, the Xyce testbench drives the whole unbuffered line
+#                 (up to 64 rows, ~3 pF) by one buf_2 & gives it BITSEL_TIME (10 ns) before SENSE, so a unit inverter
+#                 is sized with ~2.5x margin against the testbench's own assumption
+# Xyce tests of the buffered array (pex netlist has the line RC) read all bits incl. the farthest row after BITSEL_TIME,
+# so undersized buffers fail there.
+BIT_SEL_GATE_CAP    = 2.3   # fF/um^2 of 5V gate
+BIT_SEL_WIRE_CAP    = 0.1   # fF/um of M4 line
+INV_MAX_LOAD        = 600   # fF per unit of inverter drive strength
+MAX_LINE_CS_WIRES   = 6     # bit select wires from inverters of a stdcell line
+INVERTERS           = {1 : Inv1, 2 : Inv2, 4 : Inv4}
+
 class ProgPmos(CellGf180mcu):
     """
     eFuse bitline programming PMOS transistor cell.
@@ -139,9 +166,9 @@ class BitlineBlock(CellGf180mcu):
         TAP_STEP = 6    # each Nth nmos is with bulk tap
         
         # create fuses with bit select transistors
-        efuse_cell = Efuse(l)
-        nmos_cell = BitNmos(l, False)
-        nmos_cell_tie = BitNmos(l, True)
+        efuse_cell = l.leaf(Efuse)
+        nmos_cell = l.leaf(BitNmos, False)
+        nmos_cell_tie = l.leaf(BitNmos, True)
         bitsel_boxes = []
         for i in range(NFUSES_PER_BLOCK):
             odd = i % 2 # even transistors go up, odd go down
@@ -246,24 +273,28 @@ class BitlineBlock(CellGf180mcu):
 # Efuse bitline    
 class EfuseBitline(CellGf180mcu):
     """
-    eFuse bitline cell.
+    eFuse bitline cell. Senseamp & programming PMOS are at the ends of the bitline or, when centre_tap is set,
+    in the middle of it between two halves of fuse blocks (a single block bitline is always tapped at the end).
+    With split_ctrl set PRESET_N & SENSE lines do not reach the next row, the array joins them over ctrl_cuts.
     """
-    def __init__(self, l : LayoutGf180mcu, fuses : int = 16):
+    def __init__(self, l : LayoutGf180mcu, fuses : int = 16, centre_tap : bool = False, split_ctrl : bool = False):
         # create cell
         super().__init__(l, name = "efuse_bitline")
         
-        assert((fuses % NFUSES_PER_BLOCK) == 0 and fuses >= NFUSES_PER_BLOCK and fuses <= NFUSES_PER_BLOCK*4)
+        assert((fuses % NFUSES_PER_BLOCK) == 0 and fuses >= NFUSES_PER_BLOCK and fuses <= NFUSES_PER_BLOCK*MAX_BITLINE_BLOCKS)
         
-        # create basic 16 fuse blocks (up to 4)
+        # create basic 16 fuse blocks, deep bitlines are chained from more blocks sharing senseamp & programming PMOS
         blocks = fuses // NFUSES_PER_BLOCK
+        self.centre_tap = centre_tap and blocks > 1
+        left_blocks = blocks // 2 if self.centre_tap else blocks
         block_cells = []
-        for b in range(blocks):
+        for b in range(left_blocks):
             block_cell = BitlineBlock(l, b * NFUSES_PER_BLOCK)
             block = self.cell_inst(block_cell, b * (block_cell.bbox(l.dualgate).width() + BLOCK_XOFF), 0, 0)
             block_cells.append(block)
                 
         # create programming PMOS
-        pmos_cell = ProgPmos(l)
+        pmos_cell = l.leaf(ProgPmos)
         pmos = self.cell_inst(pmos_cell, block.bbox(l.nplus).p2.x + PMOS_XOFF, block.bbox(l.nplus).center().y - self.bbox().height()//2, 2)
         pmos_bbox = pmos.bbox()
         pmos_m1_bbox = pmos.bbox(l.metal1)
@@ -275,15 +306,38 @@ class EfuseBitline(CellGf180mcu):
         block_dg_bbox = block.bbox(l.dualgate)
         self.create_box(l.dualgate, block_dg_bbox.p2.x, block_dg_bbox.p1.y, pmos_dg_bbox.p1.x, block_dg_bbox.p2.y)
         
-        # create sensamp in stdcell line
-        sensamp_cell = EfuseSenseamp(l)
-        sensamp = self.cell_inst(sensamp_cell, self.bbox(l.metal1).p1.x + SENSAMP_XOFF - sensamp_cell.bbox().height(), SENSAMP_YOFF, 3)
+        # create sensamp in stdcell line, right of the programming PMOS in a centre tapped bitline
+        sensamp_cell = l.leaf(EfuseSenseamp)
+        if self.centre_tap:
+            x = pmos_bbox.p2.x + CENTRE_TAP_SPACE
+        else:
+            x = self.bbox(l.metal1).p1.x + SENSAMP_XOFF - sensamp_cell.bbox().height()
+        sensamp = self.cell_inst(sensamp_cell, x, SENSAMP_YOFF, 3)
         sensamp_bbox = sensamp.bbox()
+
+        # the other half of blocks follows the senseamp as in the bitline tapped at the end
+        for b in range(left_blocks, blocks):
+            block_cell = BitlineBlock(l, b * NFUSES_PER_BLOCK)
+            x = sensamp_bbox.p2.x - SENSAMP_XOFF - block_cell.bbox(l.metal1).p1.x
+            block = self.cell_inst(block_cell, x + (b - left_blocks) * (block_cell.bbox(l.dualgate).width() + BLOCK_XOFF), 0, 0)
+            block_cells.append(block)
         
         # create two metal bit wires connecting all fuses, sensamp & programming pmos
-        bitwire_m2_up   = self.create_box(l.metal2, sensamp_bbox.p2.x - SENSE_BIT_OVERLAP, BITWIRE_UP_YOFF, pmos_bbox.p2.x, BITWIRE_UP_YOFF + BITWIRE_WDT)
-        bitwire_m2_down = self.create_box(l.metal2, sensamp_bbox.p2.x - SENSE_BIT_OVERLAP, BITWIRE_DOWN_YOFF, pmos_bbox.p2.x, BITWIRE_DOWN_YOFF + BITWIRE_WDT)
+        x = block_cells[-1].bbox().p2.x if self.centre_tap else pmos_bbox.p2.x
+        bitwire_m2_up   = self.create_box(l.metal2, sensamp_bbox.p2.x - SENSE_BIT_OVERLAP, BITWIRE_UP_YOFF, x, BITWIRE_UP_YOFF + BITWIRE_WDT)
+        bitwire_m2_down = self.create_box(l.metal2, sensamp_bbox.p2.x - SENSE_BIT_OVERLAP, BITWIRE_DOWN_YOFF, x, BITWIRE_DOWN_YOFF + BITWIRE_WDT)
         bitwire_m2_sense = self.create_box(l.metal2, bitwire_m2_up.p1.x, bitwire_m2_down.p1.y, bitwire_m2_up.p1.x + bitwire_m2_up.height(), bitwire_m2_up.p2.y)
+        self.pvia_inhibit = [bitwire_m2_up, bitwire_m2_down, bitwire_m2_sense]
+        if self.centre_tap:
+            # bit wires of the left half end on the programming PMOS & are joined with the right half over the senseamp on M3,
+            # the joint is wide as it carries programming current of the right half
+            x = block_cells[0].bbox().p1.x
+            bitwire_left_up = self.create_box(l.metal2, x, BITWIRE_UP_YOFF, pmos_bbox.p2.x, BITWIRE_UP_YOFF + BITWIRE_WDT)
+            bitwire_left_down = self.create_box(l.metal2, x, BITWIRE_DOWN_YOFF, pmos_bbox.p2.x, BITWIRE_DOWN_YOFF + BITWIRE_WDT)
+            bitwire_m3 = self.create_box(l.metal3, pmos_bbox.p2.x - CENTRE_TAP_OVERLAP, bitwire_m2_sense.p1.y, bitwire_m2_sense.p2.x, bitwire_m2_sense.p2.y)
+            for bitwire in (bitwire_left_up, bitwire_left_down, bitwire_m2_sense):
+                self.place_via_area(bitwire & bitwire_m3, 2, 3)
+            self.pvia_inhibit += [bitwire_left_up, bitwire_left_down, bitwire_m3]
         
         # generate vias on bitwires
         sense_bitwire_m1 = self.find_boxes_with_text(l.metal1, l.metal1_label, "BITWIRE")[0]
@@ -294,36 +348,36 @@ class EfuseBitline(CellGf180mcu):
             
         # draw PRESET & SENSE connection wires
         bbox = self.bbox()
+        top = bbox.p2.y + BITLINE_YOFF - M2_DIST if split_ctrl else bbox.p2.y
         presets = self.find_boxes_with_text(l.metal2, l.metal2_label, "PRESET_N")
         assert(len(presets) == 1)
-        self.create_box(l.metal2, presets[0].p1.x, bbox.p1.y, presets[0].p1.x + M2_MIN_WDT, bbox.p2.y)
+        self.preset_m2 = self.create_box(l.metal2, presets[0].p1.x, bbox.p1.y, presets[0].p1.x + M2_MIN_WDT, top)
         senses = self.find_boxes_with_text(l.metal2, l.metal2_label, "SENSE")
         assert(len(senses) == 1)
-        self.create_box(l.metal2, senses[0].p1.x, bbox.p1.y, senses[0].p1.x + M2_MIN_WDT, bbox.p2.y)
+        self.sense_m2 = self.create_box(l.metal2, senses[0].p1.x, bbox.p1.y, senses[0].p1.x + M2_MIN_WDT, top)
+        self.ctrl_cuts = [db.Box(b.p1.x, top, b.p2.x, bbox.p2.y) for b in (self.preset_m2, self.sense_m2) if top < bbox.p2.y]
         
         # draw power rails for standard cells (senseamp)
         x = sensamp.bbox(l.metal1).p2.x - CELL_RAIL_WDT
         self.create_box(l.metal1, x, bbox.p1.y, x + CELL_RAIL_WDT, bbox.p2.y)
         x = sensamp.bbox(l.metal1).p1.x
         self.create_box(l.metal1, x, bbox.p1.y, x + CELL_RAIL_WDT, bbox.p2.y)
+        self.stdcell_x = x
             
         # draw VSS stripes on M4
         self.vss_m1 = self.find_boxes_with_text(l.metal1, l.metal1_label, "VSS")
-        vss_m4 = []
+        self.vss_m4 = []
         for block in block_cells:
             x = block.bbox(l.nplus).p1.x + BLOCK_VSS_OFF
             vss = self.create_box(l.metal4, x, bbox.p1.y, x + BLOCK_VSS_WDT, bbox.p2.y)
-            vss_m4.append(vss)
+            self.vss_m4.append(vss)
             self.create_text_p(l.metal4_label, vss.center(), "VSS")
             
-        for m4 in vss_m4:
-            for m1 in self.vss_m1:
-                self.place_via_area(m1 & m4, 1, 4)
+        self.place_power_vias(self.vss_m1, self.vss_m4, 1, 4)
                 
         x = sensamp.bbox(l.metal1).p2.x + METALVIA_OVERLAP
         self.vss_sense = self.create_box(l.metal4, x - SENSE_POWER_WDT, bbox.p1.y, x, bbox.p2.y)
         self.create_text_p(l.metal4_label, self.vss_sense.center(), "VSS")
-        self.pvia_inhibit = [bitwire_m2_up, bitwire_m2_down, bitwire_m2_sense]
 
         # draw VDD stripes on M4
         self.vdd_m4 = []
@@ -334,175 +388,637 @@ class EfuseBitline(CellGf180mcu):
             self.create_text_p(l.metal4_label, vdd.center(), "VDD")
             self.vdd_m4.append(vdd)
 
+class RowContext():
+    """
+    Building blocks shared by all rows of an array & bitline geometry used to wire a row.
+    Bounding boxes are taken once here, before the array cell is filled.
+    """
+    def __init__(self, l : LayoutGf180mcu, make, nfuses : int, centre_tap : bool = False, split_ctrl : bool = False):
+        self.l = l
+        self.endcap = make(Endcap)
+        self.fillcap = make(FillCap)
+        self.filltie = make(FillTie)
+        self.inv = None
+        self.drivers = 0
+        self.ctrl_buf = None
+        self.feeds = []
+        self.bitline = make(EfuseBitline, *((nfuses, centre_tap, True) if split_ctrl else (nfuses, True) if centre_tap else (nfuses,)))
+        bitline = self.bitline
+
+        self.bbox = bitline.bbox()
+        self.height = self.bbox.height()
+        self.m1_bbox = bitline.bbox(l.metal1)
+        self.pr_bbox = bitline.bbox(l.pr_bndry)
+        self.central_area = bitline.bbox(l.efuse_mk)
+        self.fill_m1 = {c : c.bbox(l.metal1) for c in (self.endcap, self.fillcap, self.filltie)}
+        self.fill_bbox = {c : c.bbox() for c in self.fill_m1}
+        self.bit_sel = {k : bitline.find_boxes_with_text(l.metal4, l.metal4_label, f"BIT_SEL[{k}]") for k in range(nfuses)}
+
+        self.label_layers = [l.metal1_label, l.metal2_label, l.metal3_label, l.metal4_label]
+        self.promoted = EfuseArray.promoted_labels(bitline, self.label_layers)
+        out = bitline.find_boxes_with_text(l.metal1, l.metal1_label, "OUT")
+        assert(len(out) == 1)
+        self.out = out[0]
+
+        # power rails & stripes of a bitline, transformed into each row
+        self.vdd_m1, self.vdd_m4 = db.Region(bitline.vdd_m1), db.Region(bitline.vdd_m4)
+        self.vss_m1, self.vss_sense = db.Region(bitline.vss_m1), db.Region(bitline.vss_sense)
+
+        # bitline metals left of the fuses, vias up from stdcell pins keep off them & off the rails
+        column = db.Region(db.Box(self.bbox.p1.x, self.bbox.p1.y, self.central_area.p1.x, self.bbox.p2.y))
+        self.keepout = {m : db.Region(bitline.cell.begin_shapes_rec(l.metals[m])) & column for m in (2, 3)}
+        self.keepout[1] = self.vdd_m1 + self.vss_m1
+        self.pin_keepout = {}
+
+    def add_buffers(self, make, strength : int, drivers : int):
+        """
+        Drive each bit select line by drivers parallel inverters of the given strength placed in stdcell lines,
+        BIT_SEL lines become internal & inverter inputs are BIT_SEL_N pins.
+        """
+        if self.bitline.centre_tap:
+            raise ValueError("Bit select buffers are not supported with centre tapped bitlines")
+        l = self.l
+        self.inv = make(INVERTERS[strength])
+        self.drivers = drivers
+        self.fill_m1[self.inv] = self.inv.bbox(l.metal1)
+        self.fill_bbox[self.inv] = self.inv.bbox()
+        inv_out = self.inv.find_boxes_with_text(l.metal1, l.metal1_label, "ZN")
+        inv_in = self.inv.find_boxes_with_text(l.metal1, l.metal1_label, "I")
+        assert(len(inv_out) == 1 and len(inv_in) == 1)
+        self.inv_out = inv_out[0]
+        self.inv_in = inv_in[0]
+        self.promoted = [p for p in self.promoted if not p[1].startswith("BIT_SEL")]
+
+    def add_ctrl_buffers(self, make):
+        """
+        Drive SENSE & PRESET_N lines of groups of rows by buffers placed in stdcell lines, the lines of a split_ctrl bitline
+        are joined within a group & buffer inputs are fed by vertical M4 SENSE & PRESET_N lines between the bitline power stripes.
+        """
+        l = self.l
+        assert(self.bitline.ctrl_cuts)
+        self.ctrl_buf = make(Buf2)
+        self.fill_m1[self.ctrl_buf] = self.ctrl_buf.bbox(l.metal1)
+        self.fill_bbox[self.ctrl_buf] = self.ctrl_buf.bbox()
+        buf_out = self.ctrl_buf.find_boxes_with_text(l.metal1, l.metal1_label, "Z")
+        buf_in = self.ctrl_buf.find_boxes_with_text(l.metal1, l.metal1_label, "I")
+        assert(len(buf_out) == 1 and len(buf_in) == 1)
+        self.buf_out = buf_out[0]
+        self.buf_in = buf_in[0]
+        self.promoted = [p for p in self.promoted if p[1] not in ("SENSE", "PRESET_N")]
+
+        # feeds are spread evenly over the free gap between sense side VDD & VSS stripes
+        bitline = self.bitline
+        x0, x1 = bitline.vdd_m4[0].p2.x, bitline.vss_sense.p1.x
+        step = (x1 - x0) // 3
+        self.feeds = [(net, db.Box(x0 + step*(n+1) - M2_MIN_WDT//2, self.bbox.p1.y, x0 + step*(n+1) + M2_MIN_WDT//2, self.bbox.p2.y))
+                        for n, net in enumerate(("PRESET_N", "SENSE"))]
+        self.ctrl_lines = {"PRESET_N" : bitline.preset_m2, "SENSE" : bitline.sense_m2}
+        self.keepout[2] += db.Region(bitline.ctrl_cuts)
+
+    def fill_line(self, rail_y0 : int, rail_ye : int, sense_y0 : int, sense_ye : int, ctrl_nets : list, buffers : int) -> list:
+        """
+        Plan a stdcell line from rail_y0 to rail_ye around the senseamp (sense_y0 to sense_ye) with ties, caps, SENSE & PRESET_N
+        buffers of ctrl_nets & up to buffers groups of parallel bit select inverters. Returns (cell, y, item) for each cell,
+        item is the bit select wire of an inverter, the net of a control buffer or None.
+        """
+        site_size = self.endcap.wdt
+        tap_dist = MAX_TAP_DIST - self.fillcap.wdt - site_size # fillcap is the largest and senseamp has ties inside
+        cap_dist = 10000 # arbitrary
+        line = []
+        cs_wire = 0
+        rail_y = last_tap = last_cap = rail_y0
+
+        while (rail_y + site_size < rail_ye):
+            if (rail_y+site_size > sense_y0) and (rail_y < sense_ye):
+                rail_y = sense_ye - 430
+
+            if (rail_y < sense_y0):
+                free = sense_y0 - rail_y
+            else:
+                free = rail_ye - rail_y
+
+            # select cell to put
+            if (rail_y == rail_y0) or (rail_y + 2*site_size > rail_ye):
+                cell = self.endcap
+            elif (rail_y - last_tap > tap_dist) or (free < self.fillcap.wdt):
+                cell = self.filltie
+                last_tap = rail_y
+            elif ctrl_nets and (len(ctrl_nets)*self.ctrl_buf.wdt <= free) and (rail_y + len(ctrl_nets)*self.ctrl_buf.wdt - last_tap <= tap_dist + self.fillcap.wdt):
+                # SENSE & PRESET_N buffers of a group are placed together in its first row
+                cell = self.ctrl_buf
+            elif buffers and (cs_wire + self.drivers <= MAX_LINE_CS_WIRES) and (rail_y - last_cap < cap_dist) \
+                    and (self.drivers*self.inv.wdt <= free) and (rail_y + self.drivers*self.inv.wdt - last_tap <= tap_dist + self.fillcap.wdt):
+                # parallel inverters of a line are placed together
+                cell = self.inv
+                buffers -= 1
+            else:
+                cell = self.fillcap
+                last_cap = rail_y
+
+            for n in range(self.drivers if cell is self.inv else len(ctrl_nets) if cell is self.ctrl_buf else 1):
+                if cell is self.inv:
+                    line.append((cell, rail_y, cs_wire))
+                    cs_wire += 1
+                else:
+                    line.append((cell, rail_y, ctrl_nets[n] if cell is self.ctrl_buf else None))
+                rail_y += cell.wdt
+            if cell is self.ctrl_buf:
+                ctrl_nets = []
+
+        if ctrl_nets:
+            raise RuntimeError("Failed to fit SENSE & PRESET_N buffers. Please disable control buffering.")
+        return line
+
+    def buffer_capacity(self, word_width : int, ctrl_rows : int = 0) -> int:
+        """
+        Number of bit select lines the inverters in stdcell lines of word_width rows can drive,
+        the first row of each group of ctrl_rows has the control buffers too.
+        """
+        def groups(ctrl_nets : list) -> int:
+            line = self.fill_line(self.m1_bbox.p1.y, self.m1_bbox.p2.y, self.pr_bbox.p1.y, self.pr_bbox.p2.y, ctrl_nets, MAX_LINE_CS_WIRES)
+            return sum(1 for cell, *_ in line if cell is self.inv) // self.drivers
+
+        ctrl_lines = -(-word_width // ctrl_rows) if ctrl_rows else 0
+        return (word_width - ctrl_lines) * groups([]) + (ctrl_lines * groups(["SENSE", "PRESET_N"]) if ctrl_lines else 0)
+
+    def is_clear(self, boxes : list, metal : int, trans : db.Trans, wires : dict, own : list = []) -> bool:
+        """
+        Check boxes on metal 2 or 3 keep spacing from bitline metals of the row placed with trans
+        & from wires already drawn in the row (metal -> list of boxes) except own ones.
+        """
+        keepout = self.keepout[metal].transformed(trans) + db.Region([w for w in wires[metal] if w not in own])
+        return db.Region([b.enlarged(M2_DIST - 1) for b in boxes]).interacting(keepout).is_empty()
+
+    def pin_via(self, target : CellGf180mcu, cell : CellGf180mcu, pin : db.Box, cell_trans : db.Trans, offset : db.Point,
+                    trans : db.Trans, wires : dict) -> db.Box:
+        """
+        Via tower from M1 pin of a stdcell placed with cell_trans up to metal 3, returns the metal box.
+        The tower is placed at the pin center moved by offset when its pads are clear (see is_clear()), otherwise it is slid
+        along the pin & past the pin ends on an M1 stub, M1 keeps off other shapes of the cell & the bitline rails.
+        """
+        l = self.l
+        if (cell, pin) not in self.pin_keepout:
+            m1 = db.Region(cell.cell.begin_shapes_rec(l.metal1))
+            m1.merge()
+            self.pin_keepout[(cell, pin)] = m1.not_interacting(db.Region(pin))
+        m1_keepout = self.pin_keepout[(cell, pin)].transformed(cell_trans) + self.keepout[1].transformed(trans)
+
+        # sites along the pin axis, the nearest to the preferred one first
+        pin = pin.transformed(cell_trans)
+        prefer = pin.center() + offset
+        span = cell.bbox(l.metal1).transformed(cell_trans)
+        h = VIA_SIZE//2 + METALVIA_OVERLAP
+        along = pin.width() >= pin.height()
+        if along:
+            sites = [db.Point(x, prefer.y) for x in range(span.p1.x + h, span.p2.x - h, 2*l.grid)]
+        else:
+            sites = [db.Point(prefer.x, y) for y in range(span.p1.y + h, span.p2.y - h, 2*l.grid)]
+        sites.sort(key = lambda p : p.distance(prefer))
+        for p in [prefer] + sites:
+            pad = db.Box(p.x - h, p.y - h, p.x + h, p.y + h)
+            cut = pad.enlarged(-METALVIA_OVERLAP)
+            # the stub overlaps the pin end by its minimal width
+            if along:
+                x0, x1 = (pin.p2.x - M1_MIN_WDT, pad.p2.x) if p.x > pin.center().x else (pad.p1.x, pin.p1.x + M1_MIN_WDT)
+                stub = db.Box(x0, pin.p1.y, x1, pin.p2.y)
+                on_pin = pin.p1.x <= cut.p1.x and cut.p2.x <= pin.p2.x
+            else:
+                y0, y1 = (pin.p2.y - M1_MIN_WDT, pad.p2.y) if p.y > pin.center().y else (pad.p1.y, pin.p1.y + M1_MIN_WDT)
+                stub = db.Box(pin.p1.x, y0, pin.p2.x, y1)
+                on_pin = pin.p1.y <= cut.p1.y and cut.p2.y <= pin.p2.y
+            m1 = [pad] if on_pin else [pad, stub]
+            if not db.Region([b.enlarged(M1_DIST - 1) for b in m1]).interacting(m1_keepout).is_empty():
+                continue
+            if not (self.is_clear([pad], 2, trans, wires) and self.is_clear([pad], 3, trans, wires)):
+                continue
+            if not on_pin:
+                target.create_box_p(l.metal1, stub.p1, stub.p2)
+            return target.place_via_tower(p, 1, 3, True)
+        raise RuntimeError(f"No clear via site on {cell.name} pin at {pin}, please disable in-array buffering")
+
+    def wire_row(self, target : CellGf180mcu, i : int, trans : db.Trans, invs : list, ctrls : list = [], bridge : bool = False):
+        """
+        Draw wiring of row i (bitline placed with trans) into target cell: bit select & control buffer wires, power vias, output vias & labels.
+        invs is a list of (inverter transformation, rail y, BIT_SEL index, wire index in the row), ctrls is a list of
+        (control buffer transformation, driven net), bridge joins split control lines of the row with the next row.
+        """
+        l = self.l
+        inhibit = []
+
+        # control feeds, buffers & split lines
+        for net, feed in self.feeds:
+            feed = target.create_box_p(l.metal4, feed.transformed(trans).p1, feed.transformed(trans).p2)
+            target.create_text_p(l.metal4_label, feed.center(), net)
+            inhibit.append(feed.enlarged(M2_DIST*2))
+        if bridge:
+            for cut in self.bitline.ctrl_cuts:
+                target.create_box_p(l.metal2, cut.transformed(trans).p1, cut.transformed(trans).p2)
+        feeds = dict(self.feeds)
+        wires = {2 : [], 3 : []}
+        for buf_trans, net in ctrls:
+            # input from the feed over an M3 stub
+            feed = feeds[net].transformed(trans)
+            via = self.pin_via(target, self.ctrl_buf, self.buf_in, buf_trans, db.Point(200, -30), trans, wires)
+            stub = db.Box(feed.p1.x, via.p1.y, via.p2.x, via.p2.y)
+            if not self.is_clear([stub], 3, trans, wires):
+                raise RuntimeError(f"{net} buffer input wire in row {i} collides with other wires")
+            target.create_box_p(l.metal3, stub.p1, stub.p2)
+            target.place_via_tower(db.Point(feed.center().x, via.center().y), 3, 4, True)
+            wires[2].append(via)
+            wires[3] += [via, stub]
+            inhibit.append(stub.enlarged(M2_DIST*2))
+
+            # output to the split line on an M3 stub over the other line & a via down to the line
+            line = self.ctrl_lines[net].transformed(trans)
+            via = self.pin_via(target, self.ctrl_buf, self.buf_out, buf_trans, db.Point(200, 30), trans, wires)
+            stub = db.Box(line.p1.x, via.p1.y, via.p2.x, via.p2.y)
+            if not self.is_clear([stub], 3, trans, wires):
+                raise RuntimeError(f"{net} buffer output wire in row {i} collides with other wires")
+            target.create_box_p(l.metal3, stub.p1, stub.p2)
+            target.place_via_tower(db.Point(line.center().x, via.center().y), 2, 3, True)
+            wires[2].append(via)
+            wires[3] += [via, stub]
+            inhibit.append(stub.enlarged(M2_DIST*2))
+
+        inputs = {}
+        for inv_trans, rail_y, k, cs_wire in invs:
+            # inverter input via, parallel inverters of a line are strapped below
+            via = self.pin_via(target, self.inv, self.inv_in, inv_trans, db.Point(200, -30), trans, wires)
+            inputs.setdefault(k, []).append(via)
+            wires[2].append(via)
+            wires[3].append(via)
+
+            # add inv buf to bit_sel line connection
+            bit_sel = [b.transformed(trans) for b in self.bit_sel[k]]
+            assert(len(bit_sel) > 0)
+            bit_sel_m = db.Box()
+            for b in bit_sel:
+                bit_sel_m = bit_sel_m + b
+
+            central_area = self.central_area.transformed(trans)
+
+            wdt = M2_MIN_WDT
+            step = wdt + M2_DIST
+            step2 = step + 2*METALVIA_OVERLAP
+            upper = (central_area.p1.y < rail_y)
+            if upper:
+                off = CS_WIRE_MAX_OFF - step*5 + step*cs_wire
+            else:
+                off = CS_WIRE_MAX_OFF - step*cs_wire
+            via = self.pin_via(target, self.inv, self.inv_out, inv_trans, db.Point(200, 30), trans, wires)
+            w0 = target.create_box(l.metal3, via.p1.x, via.p1.y, central_area.p1.x + off, via.p1.y + wdt)
+            w1 = target.create_box(l.metal3, w0.p2.x - wdt, w0.p1.y, w0.p2.x, central_area.p1.y + step2*cs_wire)
+            if upper:
+                sp = w1.p1
+            else:
+                sp = w1.p2
+            w2 = target.create_box(l.metal3, sp.x, sp.y - wdt, bit_sel[0].p2.x, sp.y)
+            target.place_via_tower((w2 & bit_sel_m).center(), 3, 4, True)
+            if not self.is_clear([w0, w1, w2], 3, trans, wires):
+                raise RuntimeError(f"Bit select buffer wire of BIT_SEL[{k}] in row {i} collides with other wires")
+            wires[2].append(via)
+            wires[3] += [via, w0, w1, w2]
+            # keep power vias off the buffer wires
+            for w in (w0, w1, w2):
+                inhibit.append(w.enlarged(M2_DIST*2))
+
+        # BIT_SEL_N pins on inverter inputs, a pin is extended to the left or to the right where it is clear
+        for k, vias in inputs.items():
+            if len(vias) == 1:
+                v = vias[0]
+                pins = [db.Box(v.p1 - db.Point(500, 0), v.p2), db.Box(v.p1, v.p2 + db.Point(500, 0)), v]
+                pin = next(p for p in pins if self.is_clear([p], 3, trans, wires, vias))
+                target.create_box_p(l.metal3, pin.p1, pin.p2)
+            else:
+                # strap of parallel inverters on the left or on the right of their vias
+                y0, y1 = min(v.p1.y for v in vias), max(v.p2.y for v in vias)
+                x0, x1 = min(v.p1.x for v in vias) - M2_DIST, max(v.p2.x for v in vias) + M2_DIST
+                for strap in (db.Box(x0 - M2_MIN_WDT, y0, x0, y1), db.Box(x1, y0, x1 + M2_MIN_WDT, y1)):
+                    stubs = [db.Box(min(strap.p1.x, v.p1.x), v.p1.y, max(strap.p2.x, v.p2.x), v.p2.y) for v in vias]
+                    if self.is_clear([strap] + stubs, 3, trans, wires, vias):
+                        break
+                else:
+                    raise RuntimeError(f"No clear track for the BIT_SEL_N[{k}] strap in row {i}")
+                pin = strap
+                for b in [strap] + stubs:
+                    target.create_box_p(l.metal3, b.p1, b.p2)
+                wires[3] += stubs
+            wires[3].append(pin)
+            target.create_text_p(l.metal3_label, pin.center(), f"BIT_SEL_N[{k}]")
+            inhibit.append(pin.enlarged(M2_DIST*2))
+            for v in vias:
+                inhibit.append(v.enlarged(M2_DIST*2))
+
+        # create power vias
+        for p in self.bitline.pvia_inhibit:
+            inhibit.append(p.transformed(trans))
+        inhibit = db.Region(inhibit)
+        target.place_power_vias(self.vdd_m1.transformed(trans), self.vdd_m4.transformed(trans), 1, 4, VIA_STEP, 3000, inhibit, False, True)
+        target.place_power_vias(self.vss_m1.transformed(trans), self.vss_sense.transformed(trans), 1, 4, VIA_STEP, 3000, inhibit, False)
+
+        # create output access vias
+        out = target.place_via_tower(self.out.transformed(trans).center() + db.Point(100, -100), 1, 3, True)
+        target.create_box_p(l.metal3, out.p1, out.p2 + db.Point(500, 500))
+        target.create_text_p(l.metal3_label, out.center(), f"OUT[{i}]")
+
+        # move labels to upper level adding postfixes
+        for layer, s, box, indexed in self.promoted:
+            p = box.transformed(trans).p1
+            target.create_text(layer, p.x, p.y, f"{s}[{i}]" if indexed else s)
+
 class EfuseArray(CellGf180mcu):
     """
     Parametrizable eFuse array cell.
     """
-    def __init__(self, l : LayoutGf180mcu, name : str = "efuse_array", nwords : int = 32, word_width : int = 2, nfuses : int = 32, buf_col_sel : bool = False):
+    def __init__(self, l : LayoutGf180mcu, name : str = "efuse_array", nwords : int = 32, word_width : int = 2, nfuses : int = 32, buf_col_sel : bool = False,
+                    templates : CellTemplates = None, cell_cache : CellCache = None, columns : int = 1, aspect : float = None,
+                    centre_tap : bool = False, ctrl_rows : int = 0):
         super().__init__(l, name = name)
         layout = l.layout
         assert(nfuses == nwords) # the only supported mode for now  
         
+        def make(cls, *args):
+            # building blocks are copied from templates when they are kept warm, bitlines could be read from
+            # the disk cache (standard cells depend on the PDK, they have their own extract)
+            if templates:
+                return templates.get(l, cls, *args)
+            if cell_cache and cls is EfuseBitline:
+                return cell_cache.get(l, cls, *args)
+            return l.leaf(cls, *args)
+
         # generate bitlines
-        endcap_cell = Endcap(l)
-        fillcap_cell = FillCap(l)
-        filltie_cell = FillTie(l)
-        if buf_col_sel:
-            inv_cell = Inv1(l)
+        if ctrl_rows < 0:
+            raise ValueError(f"Number of rows per control buffer should not be negative, got {ctrl_rows}")
+        ctx = RowContext(l, make, nfuses, centre_tap, ctrl_rows > 0)
+        self.bit_sel_drive = self.bit_sel_load_drive(ctx, word_width) if buf_col_sel else None
+        if self.bit_sel_drive:
+            ctx.add_buffers(make, *self.bit_sel_drive)
+        if ctrl_rows:
+            ctx.add_ctrl_buffers(make)
         self.add_cells = {}
-
-        site_size = endcap_cell.wdt
-        tap_dist = MAX_TAP_DIST - fillcap_cell.wdt - site_size # fillcap is the largest and senseamp has ties inside
-        cap_dist = 10000 # arbitrary
         col_sel_invs = 0
         req_buffers = nwords if buf_col_sel else 0
+        if buf_col_sel:
+            capacity = ctx.buffer_capacity(word_width, ctrl_rows)
+            if capacity < req_buffers:
+                raise ValueError(f"Bit select buffers of {nwords} words do not fit in {word_width} rows, at most {capacity} fit. "
+                                    "Please increase word_width or disable buffering.")
 
-        bitline_cell = EfuseBitline(l, nfuses)
+        # rows are folded into columns, bit i is in column i // col_rows, groups of rows sharing control buffers do not cross columns
+        if aspect:
+            columns = self.fold_columns(ctx, word_width, nfuses, aspect)
+        if not (1 <= columns <= word_width):
+            raise ValueError(f"Number of columns should be 1 to {word_width}, got {columns}")
+        col_rows = -(-word_width // columns)
+        if ctrl_rows:
+            col_rows = -(-col_rows // ctrl_rows) * ctrl_rows
+        self.columns = -(-word_width // col_rows)
 
+        # plan stdcell lines of all rows first, each line starts left of metal1 of all previous rows in the column,
+        # the bounding boxes are tracked here so instance insertions are not interleaved with bbox queries
+        rows = []
+        column = []
+        array_bbox = db.Box()
+        tops = []
         for i in range(word_width):
-            bitline = self.cell_inst(bitline_cell, 0, i * (bitline_cell.bbox().height() + BITLINE_YOFF), 0)
-            pr_bbox = bitline.bbox(l.pr_bndry)
+            if i % col_rows == 0:
+                m1_bbox = db.Box()
+                col_bbox = db.Box()
+            trans = ctx.bitline.trans_llc(0, (i % col_rows) * (ctx.height + BITLINE_YOFF), 0)
+            m1_bbox += ctx.m1_bbox.transformed(trans)
+            col_bbox += ctx.bbox.transformed(trans)
+            pr_bbox = ctx.pr_bbox.transformed(trans)
             sense_y0 = pr_bbox.p1.y
             sense_ye = pr_bbox.p2.y
-            cs_wire = 0
-            MAX_CS_WIRES_PER_LINE = 6
-            inhibit = []
-
-            # fill stdcell line with buffering invertors, ties and caps
-            rail_x = self.bbox(l.metal1).p1.x - 130
-            rail_y = rail_y0 = last_tap = last_cap = bitline_cell.bbox(l.metal1).transformed(bitline.trans).p1.y
-            rail_ye = self.bbox(l.metal1).p2.y
-            
-            while (rail_y + site_size < rail_ye):
-                if (rail_y+site_size > sense_y0) and (rail_y < sense_ye):
-                    rail_y = sense_ye - 430
-
-                if (rail_y < sense_y0):
-                    free = sense_y0 - rail_y
-                else:
-                    free = rail_ye - rail_y
-
-                # select cell to put
-                if (rail_y == rail_y0) or (rail_y + 2*site_size > rail_ye):
-                    cell = endcap_cell
-                elif (rail_y - last_tap > tap_dist) or (free < fillcap_cell.wdt):
-                    cell = filltie_cell
-                    last_tap = rail_y
-                elif (col_sel_invs < req_buffers) and (cs_wire < MAX_CS_WIRES_PER_LINE) and (rail_y - last_cap < cap_dist):
-                    cell = inv_cell
-                    
-                    # add inv buf to bit_sel line connection
-                    inv_out = inv_cell.find_boxes_with_text(l.metal1, l.metal1_label, "ZN")
-                    bit_sel = self.find_boxes_with_text(l.metal4, l.metal4_label, f"BIT_SEL[{col_sel_invs}]")
-                    assert((len(inv_out) == 1) and (len(bit_sel) > 0))
-                    bit_sel_m = db.Box()
-                    for b in bit_sel:
-                        bit_sel_m = bit_sel_m + b
-                    inv_out_bb = inv_out[0].transformed(cell.trans_llc(rail_x, rail_y, 1)).bbox()
-
-                    central_area = bitline_cell.bbox(l.efuse_mk).transformed(bitline.trans)
-                    
-                    wdt = M2_MIN_WDT
-                    step = wdt + M2_DIST
-                    step2 = step + 2*METALVIA_OVERLAP
-                    upper = (central_area.p1.y < rail_y)
-                    if upper:
-                        off = CS_WIRE_MAX_OFF - step*5 + step*cs_wire
-                    else:
-                        off = CS_WIRE_MAX_OFF - step*cs_wire
-                    via = self.place_via_tower(inv_out_bb.center() + db.Point(200, 30), 1, 3, True)
-                    w0 = self.create_box(l.metal3, via.p1.x, via.p1.y, central_area.p1.x + off, via.p1.y + wdt)
-                    w1 = self.create_box(l.metal3, w0.p2.x - wdt, w0.p1.y, w0.p2.x, central_area.p1.y + step2*cs_wire)
-                    if upper:
-                        sp = w1.p1
-                    else:
-                        sp = w1.p2
-                    w2 = self.create_box(l.metal3, sp.x, sp.y - wdt, bit_sel[0].p2.x, sp.y)
-                    self.place_via_tower((w2 & bit_sel_m).center(), 3, 4, True)
-                    inhibit.append(w0.enlarged(M2_DIST*2))
+            invs = []
+            ctrls = []
+            ctrl_nets = ["SENSE", "PRESET_N"] if ctrl_rows and (i % col_rows) % ctrl_rows == 0 else []
+            bridge = bool(ctrl_rows) and ((i % col_rows) % ctrl_rows != ctrl_rows - 1) and (i != word_width - 1)
 
-                    col_sel_invs += 1
-                    cs_wire += 1
-                else:
-                    cell = fillcap_cell
-                    last_cap = rail_y
-                
-                max_y = rail_y + cell.wdt
-                
-                self.cell_inst(cell, rail_x, rail_y, 1)
+            # fill stdcell line with buffering invertors, ties and caps, a centre tapped bitline has the line around its senseamp
+            rail_x = (ctx.bitline.stdcell_x if ctx.bitline.centre_tap else m1_bbox.p1.x) - 130
+            line = ctx.fill_line(ctx.m1_bbox.transformed(trans).p1.y, m1_bbox.p2.y, sense_y0, sense_ye, ctrl_nets, req_buffers - col_sel_invs)
+            fills = []
+            for cell, rail_y, item in line:
+                cell_trans = cell.trans_llc(rail_x, rail_y, 1)
+                if cell is ctx.inv:
+                    invs.append((cell_trans, rail_y, col_sel_invs + item // ctx.drivers, item))
+                elif cell is ctx.ctrl_buf:
+                    ctrls.append((cell_trans, item))
+                fills.append((cell, cell_trans))
+                m1_bbox += ctx.fill_m1[cell].transformed(cell_trans)
+                col_bbox += ctx.fill_bbox[cell].transformed(cell_trans)
                 if cell.name not in self.add_cells:
                     self.add_cells[cell.name] = 1
                 else:
                     self.add_cells[cell.name] += 1
-                rail_y = max_y
-
-            # create power vias
-            for p in bitline_cell.pvia_inhibit:
-                inhibit.append(p.transformed(bitline.trans))
-            for m4 in bitline_cell.vdd_m4:
-                for m1 in bitline_cell.vdd_m1:
-                    m1t = m1.transformed(bitline.trans)
-                    m4t = m4.transformed(bitline.trans)
-                    self.place_via_area_step(m1t & m4t, 1, 4, VIA_STEP, 3000, inhibit, False, True)
-            vss_sense = bitline_cell.vss_sense.transformed(bitline.trans)
-            for m1 in bitline_cell.vss_m1:
-                m1 = m1.transformed(bitline.trans)
-                self.place_via_area_step(m1 & vss_sense, 1, 4, VIA_STEP, 3000, inhibit, False)
-            
-            # create output access vias
-            out = bitline_cell.find_boxes_with_text(l.metal1, l.metal1_label, "OUT")
-            assert(len(out) == 1)
-            out = self.place_via_tower(out[0].transformed(bitline.trans).center() + db.Point(100, -100), 1, 3, True)
-            self.create_box_p(l.metal3, out.p1, out.p2 + db.Point(500, 500))
-            self.create_text_p(l.metal3_label, out.center(), f"OUT[{i}]")
-
-
-            # move labels to upper level adding postfixes
-            label_layers = [l.metal1_label, l.metal2_label, l.metal3_label, l.metal4_label]
-            it = db.RecursiveShapeIterator(layout, self.cell, label_layers, bitline.bbox(l.metal1_label))
-            it.shape_flags = db.Shapes.STexts
-            for t in it.each():
-                shape = t.shape()
-                s = shape.text.string
-                box = t.shape().bbox().transformed(t.trans())
-                labels_to_replace = ["COL_PROG_N"]
-                labels_to_keep = ["BIT_SEL", "PRESET_N", "SENSE"]
-                labels_to_keep_m4 = ["VSS", "VDD"]
-                if s in labels_to_replace:
-                    self.create_text(it.layer(), box.p1.x, box.p1.y, s+"["+str(i)+"]")
-                for lab in labels_to_keep:
-                    if lab == s[:len(lab)]:
-                        self.create_text(it.layer(), box.p1.x, box.p1.y, s)
-                if (it.layer() == l.metal4_label) and (s in labels_to_keep_m4):
-                    self.create_text(it.layer(), box.p1.x, box.p1.y, s)
+            col_sel_invs += len(invs) // ctx.drivers if invs else 0
+
+            column.append((trans, fills, invs, ctrls, bridge))
+
+            # place the finished column right of the previous ones
+            if len(column) == col_rows or i == word_width - 1:
+                shift = db.Trans(0 if array_bbox.empty() else array_bbox.p2.x + COLUMN_SPACE - col_bbox.p1.x, 0)
+                for trans, fills, invs, ctrls, bridge in column:
+                    rows.append((shift * trans, [(c, shift * t) for c, t in fills], [(shift * t, y, k, w) for t, y, k, w in invs],
+                                    [(shift * t, net) for t, net in ctrls], bridge))
+                array_bbox += col_bbox.transformed(shift)
+                tops.append(rows[-1][0])
+                column = []
 
         if (col_sel_invs != req_buffers):
             raise RuntimeError("Failed to fit all bit select inverting buffers. Please increase word_width or disable buffering.")
-        
+
+        for trans, fills, *_ in rows:
+            self.insert_inst(ctx.bitline, trans)
+            for cell, cell_trans in fills:
+                self.insert_inst(cell, cell_trans)
+
+        # wire rows
+        with self.batch():
+            for i, (trans, fills, invs, ctrls, bridge) in enumerate(rows):
+                ctx.wire_row(self, i, trans, invs, ctrls, bridge)
+            if len(tops) > 1:
+                self.join_columns(ctx, tops, array_bbox.p2.y + CHANNEL_SPACE)
+
+
         # remove all labels not on top
-        it = db.RecursiveShapeIterator(layout, self.cell, label_layers)
-        it.shape_flags = db.Shapes.STexts
-        it.min_depth = 1
-        for t in it.each():
-            shape = t.shape()
-            shape.delete()  
+        for ci in self.cell.called_cells():
+            for layer in ctx.label_layers:
+                layout.cell(ci).shapes(layer).clear(db.Shapes.STexts)
+
+        # pins of in-array buffers are wired next to other nets, check them on the extracted metals
+        if buf_col_sel or ctrl_rows:
+            self.check_pins((["BIT_SEL_N["] if buf_col_sel else []) + (["SENSE", "PRESET_N"] if ctrl_rows else []))
 
         # mark whole array with PR_BNDRY
         self.dup_box(l.pr_bndry, self.bbox())
 
         self.zero_origin()
+
+    def check_pins(self, prefixes : list):
+        """
+        Extract connectivity of metals 1-4 with top labels & check each pin starting with one of prefixes is a single net
+        without other labels. Raises RuntimeError listing shorted & split pins.
+        """
+        l = self.l
+        l2n = db.LayoutToNetlist(db.RecursiveShapeIterator(l.layout, self.cell, []))
+        metals = [l2n.make_layer(l.metals[m], f"metal{m}") for m in range(1, 5)]
+        for m, metal in enumerate(metals, 1):
+            l2n.connect(metal)
+            l2n.connect(metal, l2n.make_text_layer(l.labels[m], f"label{m}"))
+        for m in range(1, 4):
+            via = l2n.make_layer(l.vias[m], f"via{m}")
+            l2n.connect(via)
+            l2n.connect(metals[m-1], via)
+            l2n.connect(via, metals[m])
+        l2n.extract_netlist()
+
+        nets = {}
+        shorts = set()
+        for net in l2n.netlist().circuit_by_name(self.cell.name).each_net():
+            names = set((net.name or "").split(",")) - {""}
+            checked = {n for n in names if n.startswith(tuple(prefixes))}
+            for n in checked:
+                nets[n] = nets.get(n, 0) + 1
+            if checked and len(names) > 1:
+                shorts.add(", ".join(sorted(names)))
+        split = sorted(n for n, cnt in nets.items() if cnt > 1)
+        if shorts or split:
+            raise RuntimeError(f"Broken in-array buffer pins, shorted: {'; '.join(sorted(shorts)) or 'none'}, split: {', '.join(split) or 'none'}")
+
+    @staticmethod
+    def bit_sel_load_drive(ctx : RowContext, word_width : int) -> tuple:
+        """
+        Strength of bit select inverters & number of parallel inverters per line for the load of word_width rows,
+        the smallest inverter carrying the load is selected.
+        """
+        wire = max(sum(b.height() for b in boxes) for boxes in ctx.bit_sel.values())
+        load = word_width * (NMOS_WDT*NMOS_LEN*1e-6*BIT_SEL_GATE_CAP + wire*1e-3*BIT_SEL_WIRE_CAP)
+        for strength in sorted(INVERTERS):
+            if load <= strength*INV_MAX_LOAD:
+                return strength, 1
+        strength = max(INVERTERS)
+        return strength, math.ceil(load / (strength*INV_MAX_LOAD))
+
+    @staticmethod
+    def fold_columns(ctx : RowContext, word_width : int, nfuses : int, aspect : float) -> int:
+        """
+        Number of columns giving the array width/height ratio closest to aspect, estimated from the bitline size.
+        """
+        def ratio(columns : int) -> float:
+            rows = -(-word_width // columns)
+            width = columns * ctx.bbox.width() + (columns - 1) * COLUMN_SPACE
+            height = rows * (ctx.height + BITLINE_YOFF)
+            if columns > 1:
+                height += CHANNEL_SPACE + 2 * CHANNEL_POWER_WDT + (nfuses + 4) * CHANNEL_STEP
+            return width / height
+        return min(range(1, word_width + 1), key = lambda c : abs(math.log(ratio(c) / aspect)))
+
+    def join_columns(self, ctx : RowContext, tops : list, y : int):
+        """
+        Connect columns with horizontal M3 tracks above the array starting at y: power straps, SENSE, PRESET_N & BIT_SEL lines.
+        Vertical lines of the top bitline of each column (placed with transformations from tops) are extended up to their tracks.
+        """
+        l = self.l
+        bitline = ctx.bitline
+        nets = [(bitline.vss_m4 + [bitline.vss_sense], 4, CHANNEL_POWER_WDT), (bitline.vdd_m4, 4, CHANNEL_POWER_WDT)]
+        if ctx.feeds:
+            # split control lines are driven from the feeds
+            feeds = dict(ctx.feeds)
+            nets += [([feeds["SENSE"]], 4, M2_MIN_WDT), ([feeds["PRESET_N"]], 4, M2_MIN_WDT)]
+        else:
+            nets += [([bitline.sense_m2], 2, M2_MIN_WDT), ([bitline.preset_m2], 2, M2_MIN_WDT)]
+        nets += [(ctx.bit_sel[k], 4, M2_MIN_WDT) for k in sorted(ctx.bit_sel)]
+        for boxes, metal, wdt in nets:
+            lines = [b.transformed(t) for t in tops for b in boxes]
+            track = self.create_box(l.metal3, min(b.p1.x for b in lines) - METALVIA_OVERLAP, y, max(b.p2.x for b in lines) + METALVIA_OVERLAP, y + wdt)
+            for b in lines:
+                self.create_box(l.metals[metal], b.p1.x, b.p2.y, b.p2.x, track.p2.y)
+                cross = db.Box(b.p1.x, track.p1.y, b.p2.x, track.p2.y)
+                if wdt > M2_MIN_WDT:
+                    self.place_via_area(cross, 3, metal)
+                else:
+                    self.place_via_tower(cross.center(), min(metal, 3), max(metal, 3), True)
+            y = track.p2.y + CHANNEL_STEP - M2_MIN_WDT
+
+    @staticmethod
+    def promoted_labels(bitline_cell : EfuseBitline, label_layers : list) -> list:
+        """
+        Bitline labels to be copied to the array top for each row: (layer, text, box, add row index postfix).
+        """
+        labels_to_replace = ["COL_PROG_N"]
+        labels_to_keep = ["BIT_SEL", "PRESET_N", "SENSE"]
+        labels_to_keep_m4 = ["VSS", "VDD"]
+        promoted = []
+        for layer in label_layers:
+            for s, boxes in bitline_cell.labels(layer).items():
+                for box in boxes:
+                    if s in labels_to_replace:
+                        promoted.append((layer, s, box, True))
+                    for lab in labels_to_keep:
+                        if lab == s[:len(lab)]:
+                            promoted.append((layer, s, box, False))
+                    if (layer == bitline_cell.l.metal4_label) and (s in labels_to_keep_m4):
+                        promoted.append((layer, s, box, False))
+        return promoted
         
 
+def warm_up(templates : CellTemplates, depths : list = (16, 32, 64)):
+    """
+    Generate templates of standard cells & bitlines for the given array depths in advance.
+    """
+    for cls in (Endcap, FillCap, FillTie, Inv1, Inv2, Inv4, Buf2):
+        templates.template(cls)
+    for nfuses in depths:
+        templates.template(EfuseBitline, nfuses)
+
+def bitline_cache(cache_dir : Path = None) -> CellCache:
+    """
+    Disk cache of bitlines keyed on the generator sources, in "cells" subdirectory of the cache directory.
+    """
+    return CellCache([Path(__file__).parent], cache_dir)
+
+def bit_sel_buf_capacity(nwords : int, word_width : int, ctrl_rows : int = 0, cell_cache : CellCache = None,
+                            stdcells : StdCellLibrary = None) -> int:
+    """
+    Number of bit select lines the in-array inverters sized for word_width rows of nwords deep bitlines can drive,
+    estimated on a scratch layout before the array is generated.
+    """
+    l = LayoutGf180mcu(stdcells = stdcells)
+
+    def make(cls, *args):
+        if cell_cache and cls is EfuseBitline:
+            return cell_cache.get(l, cls, *args)
+        return l.leaf(cls, *args)
+
+    ctx = RowContext(l, make, nwords, False, ctrl_rows > 0)
+    ctx.add_buffers(make, *EfuseArray.bit_sel_load_drive(ctx, word_width))
+    if ctrl_rows:
+        ctx.add_ctrl_buffers(make)
+    return ctx.buffer_capacity(word_width, ctrl_rows)
+
 def create_efuse_array(layout : PathLike | str = "efuse_array.gds", cellname : str = "efuse_array", 
-    nwords : int = 32, word_width : int = 2, flat : bool = False, add_cells : PathLike | str = ""):
+    nwords : int = 32, word_width : int = 2, flat : bool = False, add_cells : PathLike | str = "", 
+    templates : CellTemplates = None, cell_cache : CellCache = None, columns : int = 1, aspect : float = None,
+    centre_tap : bool = False, buf_col_sel : bool = False, ctrl_rows : int = 0, stdcells : StdCellLibrary = None) -> EfuseArray:
     """
     Create eFuse array cell with defined parameters and write it to GDS or add it to an existing layout.
+    Returns the array cell.
     
         layout      : could be either a string/PathLike object (a name of GDS file to write) or a klayout.db.Layout object
         cellname    : name for the array cell
         nwords      : total number of words in array
         word_width  : number of bits per word
         flat        : if True the cell will be flattened
+        templates   : warm building blocks (bitlines & standard cells) to copy instead of generating them
+        cell_cache  : disk cache to read the bitline from (see bitline_cache()), it is generated on a cache miss
+        columns     : number of columns the words are folded into, columns are joined by a routing channel above the array
+        aspect      : target width/height ratio of the array, selects the number of columns instead of columns argument
+        centre_tap  : place senseamps & programming PMOSes in the middle of bitlines deeper than 16 words
+        buf_col_sel : drive bit select lines by inverters inside the array sized for the word width, pins become BIT_SEL_N
+        ctrl_rows   : drive SENSE & PRESET_N lines of each ctrl_rows rows by buffers inside the array, 0 disables them
+        stdcells    : standard cell library (see StdCellLibrary.get()), the one with the default cache directory if not set
     """
     
     gdsname = ""
@@ -511,20 +1027,26 @@ def create_efuse_array(layout : PathLike | str = "efuse_array.gds", cellname : s
         layout = db.Layout()
     elif type(layout) is not db.Layout:
         raise TypeError("layout argument should be either a pathlike or a klayout.db.Layout object!")
-    l = LayoutGf180mcu(layout)
+    l = LayoutGf180mcu(layout, stdcells)
         
     nfuses = nwords # the only supported mode for now  
-    array = EfuseArray(l, cellname, nwords, word_width, nfuses)
+    array = EfuseArray(l, cellname, nwords, word_width, nfuses, buf_col_sel, templates = templates, cell_cache = cell_cache,
+                        columns = columns, aspect = aspect, centre_tap = centre_tap, ctrl_rows = ctrl_rows)
     
     if flat:
         array.flatten()
     
     if gdsname:
-        l.layout.write(gdsname)
+        # no timestamps to get the same GDS for the same configuration
+        opts = db.SaveLayoutOptions()
+        opts.gds2_write_timestamps = False
+        l.layout.write(gdsname, opts)
 
     if add_cells:
         with open(add_cells, "w") as f:
             json.dump(array.add_cells, f)
+
+    return array
     
 # Main
 if __name__ == '__main__':
@@ -3,9 +3,17 @@
 #
 
 import os
+import json
+import importlib
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
 from pathlib import Path
 from klayout import db
 
+from ..flow.cache import default_cache_dir, hash_key, hash_paths
+
 # Tech parameters, all sizes in nm
 CONTACT_POLY_OVERLAP= 70
 CONTACT_SIZE        = 220
@@ -28,11 +36,18 @@ COMP_CONT_DIST      = 170
 
 MAX_TAP_DIST        = 20000
 
+STDCELL_LIB         = "gf180mcu_fd_sc_mcu7t5v0"
+# standard cells used by the compiler, kept in the library extract
+STDCELLS            = ["endcap", "filltie", "fillcap_4", "inv_1", "inv_2", "inv_4", "buf_2"]
+
 class LayoutGf180mcu():
     """
     Small wrapper for KLayout Layout class with definitions for GF180MCU.
     """
-    def __init__(self, layout : db.Layout = None):
+    def __init__(self, layout : db.Layout = None, stdcells = None):
+        # standard cells are copied from stdcells library, StdCellLibrary.get() if not set
+        self.stdcells = stdcells
+
         # create KLayout layout & set some parameters
         if layout:
             self.layout = layout
@@ -72,12 +87,25 @@ class LayoutGf180mcu():
         self.labels = {1: self.metal1_label, 2: self.metal2_label, 3: self.metal3_label, 4: self.metal4_label, 5: self.metal5_label}
         self.vias = {1: self.via1, 2: self.via2, 3: self.via3, 4: self.via4}
         
+        # leaf cells shared by all their users
+        self.leaf_cells = {}
+
     def to_dbu(self, m : float):
         """
         Convert microns to db units
         """
         return int(round(m / self.layout.dbu))
         
+    def leaf(self, cls, *args):
+        """
+        Leaf cell cls(self, *args) of this layout, it is created on the first request
+        and the same cell is returned for the same parameters afterwards.
+        """
+        key = (cls, args)
+        if key not in self.leaf_cells:
+            self.leaf_cells[key] = cls(self, *args)
+        return self.leaf_cells[key]
+        
     def grid_allign(self, x : int):
         """
         Allign to grid
@@ -91,6 +119,10 @@ class CellGf180mcu():
     def __init__(self, layout_wrapper : LayoutGf180mcu, parent = None, name : str = "", single_cell : bool = False):
         self.layout = layout_wrapper.layout
         self.l = layout_wrapper
+        # label layer -> {text : label boxes in cell coordinates}, built on the first lookup & kept up to date
+        self.label_index = {}
+        # shapes are collected here while batch() is active
+        self.pending = None
         
         if type(parent) is db.Cell:
             self.cell = parent
@@ -115,17 +147,61 @@ class CellGf180mcu():
             self.cell = self.layout.cell(index)
             self.name = name
             
+    def clone(self, l : LayoutGf180mcu):
+        """
+        Copy of this cell (with all its hierarchy & attributes) in another layout.
+        """
+        c = self.rebind(l, l.layout.create_cell(self.cell.name))
+        c.copy_cell_tree(self.cell, {leaf.cell.cell_index() : (key, leaf) for key, leaf in self.l.leaf_cells.items()})
+        return c
+
+    def rebind(self, l : LayoutGf180mcu, cell : db.Cell):
+        """
+        Wrapper of cell in layout l with the same attributes as this one.
+        """
+        c = object.__new__(type(self))
+        c.__dict__.update(self.__dict__)
+        c.layout = l.layout
+        c.l = l
+        c.label_index = {}
+        c.pending = None
+        c.cell = cell
+        return c
+
+    def copy_cell_tree(self, source : db.Cell, leafs : dict = {}):
+        """
+        Copy contents & hierarchy of a cell from another layout into this cell. leafs maps cell indexes of the source
+        layout to (leaf() key, leaf cell wrapper): these cells are shared with leaf() of this layout instead of being duplicated.
+        """
+        cm = db.CellMapping()
+        cm.for_single_cell_full(self.cell, source)
+        self.cell.copy_tree_shapes(source, cm)
+        for src, dst in cm.table().items():
+            if src not in leafs:
+                continue
+            key, leaf = leafs[src]
+            if key not in self.l.leaf_cells:
+                self.l.leaf_cells[key] = leaf.rebind(self.l, self.layout.cell(dst))
+                continue
+            # the same leaf cell is already there, move instances of the copy to it
+            cell = self.l.leaf_cells[key].cell.cell_index()
+            for parent in list(self.layout.cell(dst).each_parent_inst()):
+                parent.inst().cell_index = cell
+            self.layout.delete_cell(dst)
+
     def flatten(self, depth : int = -1, prune : bool = True):
         """
         Flatten cell.
         """
         self.cell.flatten(depth, prune)
+        self.label_index = {}
         
     def zero_origin(self):
         """
         Move cell origin to zero.
         """
         self.cell = self.cell.transform(db.Trans(-self.cell.bbox().p1))
+        self.label_index = {}
 
     def clear_labels(self):
         """
@@ -133,6 +209,7 @@ class CellGf180mcu():
         """
         for k in self.l.labels:
             self.cell.shapes(self.l.labels[k]).clear()
+        self.label_index = {}
         
     def trans_llc(self, x : int, y : int, r : int) -> db.Trans:
         """
@@ -151,7 +228,10 @@ class CellGf180mcu():
         """
         Draw a box on a layer inside this cell. Returns the box.
         """
-        self.cell.shapes(layer).insert(box)
+        if self.pending is not None and not box.empty():
+            self.pending.box(layer, box.left, box.bottom, box.right, box.top)
+        else:
+            self.cell.shapes(layer).insert_box(box)
         return box
     
     def create_box(self, layer : int, x0 : int, x1 : int, y0 : int, y1 : int):
@@ -172,7 +252,12 @@ class CellGf180mcu():
         """
         Add a text object to coordinates.
         """
-        self.cell.shapes(layer).insert(db.Text(text, x, y))
+        if self.pending is not None:
+            self.pending.text(layer, x, y, text)
+        else:
+            self.cell.shapes(layer).insert_text(db.Text(text, x, y))
+        if layer in self.label_index:
+            self.label_index[layer].setdefault(text, []).append(db.Box(x, y, x, y))
         
     def create_text_p(self, layer : int, p : db.Point, text : str):
         """
@@ -182,12 +267,31 @@ class CellGf180mcu():
         
     def bbox(self, layer : int = -1):
         """
-        Boundary box of this cell.
+        Boundary box of this cell, including shapes of the active batch.
         """
+        if self.pending is not None:
+            return self.pending.bbox(layer)
         if layer < 0:
             return self.cell.bbox()
         else:
             return self.cell.bbox(layer)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect boxes & texts drawn in this context and insert them into the cell in one pass per layer on exit.
+        bbox() includes the collected shapes, but they are not visible to KLayout queries (find_boxes_with_text) 
+        until the end of the context.
+        """
+        if self.pending is not None:
+            yield self.pending
+            return
+        self.pending = ShapeBatch(self.cell)
+        try:
+            yield self.pending
+        finally:
+            pending, self.pending = self.pending, None
+            pending.commit()
         
     def place_contact(self, x : int, y : int):
         """
@@ -197,22 +301,19 @@ class CellGf180mcu():
         
     def place_via_tower(self, point: db.Point, bottom_metal: int, top_metal: int, center : bool = False):
         """
-        Generate a via stack & metals connecting a point on bottom_metal to the same point on top_metal. 
+        Place a via stack cell connecting a point on bottom_metal to the same point on top_metal. Returns the metal box.
         """
         if not center:
             point.x += VIA_SIZE/2
             point.y += VIA_SIZE/2
-        via_box = db.Box(point.x-VIA_SIZE/2, point.y-VIA_SIZE/2, point.x+VIA_SIZE/2, point.y+VIA_SIZE/2)
-        metal_box = db.Box(point.x-VIA_SIZE/2-METALVIA_OVERLAP, point.y-VIA_SIZE/2-METALVIA_OVERLAP, point.x+VIA_SIZE/2+METALVIA_OVERLAP, point.y+VIA_SIZE/2+METALVIA_OVERLAP)
-        self.dup_box(self.l.metals[bottom_metal], metal_box)
-        for i in range(bottom_metal, top_metal):
-            self.dup_box(self.l.vias[i], via_box)
-            self.dup_box(self.l.metals[i+1], metal_box)
-        return metal_box
+        via = self.l.leaf(ViaStack, bottom_metal, top_metal)
+        self.cell.insert(db.CellInstArray(via.cell.cell_index(), db.Trans(point.x, point.y)))
+        return via.metal_box.moved(point.x, point.y)
         
-    def place_via_area_step(self, box : db.Box, bottom_metal : int, top_metal : int, stepx : int, stepy : int, inhibit_boxes : list = [], fill = True, enlarge = False):
+    def place_via_area_step(self, box : db.Box, bottom_metal : int, top_metal : int, stepx : int, stepy : int, inhibit_boxes = [], fill = True, enlarge = False):
         """
-        Fill the box with vias controlling distance between vias. Do not place vias touching any box from inhibit_boxes list.
+        Fill the box with vias controlling distance between vias. Do not place vias touching any box from inhibit_boxes
+        (a list of boxes or a db.Region, which is faster to query when called many times with the same boxes).
         """
         if box.empty():
             return
@@ -225,28 +326,64 @@ class CellGf180mcu():
         x0 = box.p1.x + self.l.grid_allign((box.width() - xvias*stepx + VIA_DIST) // 2)
         y0 = box.p1.y + self.l.grid_allign((box.height() - yvias*stepy + VIA_DIST) // 2)
         
+        points = [db.Point(x0 + i*stepx, y0 + j*stepy) for i in range(xvias) for j in range(yvias)]
+        inhibit = inhibit_boxes if isinstance(inhibit_boxes, db.Region) else db.Region(inhibit_boxes)
+        inhibited = set()
+        if points and not inhibit.is_empty():
+            # check all via sites against inhibit boxes at once, sites are kept separate
+            sites = db.Region()
+            sites.merged_semantics = False
+            for p in points:
+                sites.insert(db.Box(p.x-VIA_SIZE, p.y-VIA_SIZE, p.x+VIA_SIZE, p.y+VIA_SIZE))
+            inhibited = {(s.bbox().center().x, s.bbox().center().y) for s in sites.interacting(inhibit).each()}
+
+        # place via columns as arrays, columns are split around inhibited sites
+        via = self.l.leaf(ViaStack, bottom_metal, top_metal)
         boxes = []
         for i in range(xvias):
-            for j in range(yvias):
+            run = []
+            for j in range(yvias + 1):
                 point = db.Point(x0 + i*stepx, y0 + j*stepy)
-                no_via = False
-                for ib in inhibit_boxes:
-                    if ib.touches(db.Box(point.x-VIA_SIZE, point.y-VIA_SIZE, point.x+VIA_SIZE, point.y+VIA_SIZE)):
-                        no_via = True
-                        break
-                if not no_via:
-                    boxes.append(self.place_via_tower(point, bottom_metal, top_metal))
+                if j < yvias and (point.x, point.y) not in inhibited:
+                    run.append(point)
+                    continue
+                if run:
+                    self.place_via_array(via, run[0], len(run), stepy)
+                    boxes += [via.metal_box.moved(p.x + VIA_SIZE//2, p.y + VIA_SIZE//2) for p in (run[0], run[-1])]
+                    run = []
         # fill metals inbetween vias
         if (len(boxes) > 1) and fill:
             for i in range(bottom_metal, top_metal+1):
                 self.create_box_p(self.l.metals[i], boxes[0].p1, boxes[len(boxes)-1].p2)
+
+    def place_via_array(self, via, point : db.Point, n : int, stepy : int):
+        """
+        Place a column of n via stack cells, point is the lower left corner of the first via.
+        """
+        trans = db.Trans(point.x + VIA_SIZE//2, point.y + VIA_SIZE//2)
+        if n == 1:
+            self.cell.insert(db.CellInstArray(via.cell.cell_index(), trans))
+        else:
+            self.cell.insert(db.CellInstArray(via.cell.cell_index(), trans, db.Vector(0, stepy), db.Vector(), n, 1))
                 
     def place_via_area(self, box: db.Box, bottom_metal: int, top_metal: int):
         """
         Fill the box with vias with minimal distance step.
         """
         self.place_via_area_step(box, bottom_metal, top_metal, VIA_STEP, VIA_STEP)
-        
+
+    def place_power_vias(self, bottom_boxes, top_boxes, bottom_metal : int, top_metal : int, stepx : int = VIA_STEP, stepy : int = VIA_STEP,
+                            inhibit_boxes = [], fill = True, enlarge = False):
+        """
+        Connect power rails on bottom_metal with stripes on top_metal of the same net (lists of boxes or db.Region).
+        All overlap areas are found with one boolean, each area is filled with vias once even if rails are found twice.
+        """
+        bottom, top, inhibit = [r if isinstance(r, db.Region) else db.Region(r) for r in (bottom_boxes, top_boxes, inhibit_boxes)]
+        overlaps = bottom & top
+        # overlapping rails give non-rectangular areas, fill them by horizontal slices
+        for area in overlaps.decompose_trapezoids_to_region().each():
+            self.place_via_area_step(area.bbox(), bottom_metal, top_metal, stepx, stepy, inhibit, fill, enlarge)
+
     def cell_inst(self, cell, x : int, y : int, r : int, center : bool = False):
         """
         Instance a cell inside this cell.
@@ -254,33 +391,342 @@ class CellGf180mcu():
         if center:
             x -= cell.bbox().width() // 2
             y -= cell.bbox().height() // 2
-        ciarray = db.CellInstArray(cell.cell, cell.trans_llc(x, y, r))
-        inst = self.cell.insert(ciarray)
+        return self.insert_inst(cell, cell.trans_llc(x, y, r))
+
+    def insert_inst(self, cell, trans : db.Trans):
+        """
+        Instance a cell with a transformation inside this cell.
+        """
+        inst = self.cell.insert(db.CellInstArray(cell.cell, trans))
+        for layer, index in self.label_index.items():
+            for text, boxes in cell.labels(layer).items():
+                index.setdefault(text, []).extend(b.transformed(trans) for b in boxes)
         return inst
 
+    def labels(self, label_layer : int) -> dict:
+        """
+        Index of labels on a layer in the cell hierarchy: text -> list of label boxes in cell coordinates.
+        """
+        if label_layer not in self.label_index:
+            index = {}
+            tit = self.cell.begin_shapes_rec(label_layer)
+            tit.shape_flags = db.Shapes.STexts
+            for t in tit.each():
+                index.setdefault(t.shape().text.string, []).append(t.shape().bbox().transformed(t.trans()))
+            self.label_index[label_layer] = index
+        return self.label_index[label_layer]
+
     def find_boxes_with_text(self, box_layer : int, label_layer : int, label : str):
         """
         Find all boxes on a layer in this cell intersecting with specific text label.
         """
         boxes = []
-        tit = self.cell.begin_shapes_rec(label_layer)
-        tit.shape_flags = db.Shapes.STexts
-        for t in tit.each():
-            if t.shape().text.string == label:
-                it = self.cell.begin_shapes_rec_touching(box_layer, t.shape().bbox().transformed(t.trans()))
-                for s in it.each():
-                    if s.shape().is_box():
-                        b = s.shape().box.transformed(s.trans())
-                        boxes.append(b)
+        for lb in self.labels(label_layer).get(label, []):
+            it = self.cell.begin_shapes_rec_touching(box_layer, lb)
+            for s in it.each():
+                if s.shape().is_box():
+                    b = s.shape().box.transformed(s.trans())
+                    boxes.append(b)
         return boxes
         
+class ShapeBatch():
+    """
+    Boxes & texts for a cell collected per layer in compact integer buffers & inserted in one pass.
+    Avoids a KLayout call per shape and layout updates between shape insertions & bbox queries.
+    """
+    def __init__(self, cell : db.Cell):
+        self.cell = cell
+        self.boxes = {}     # layer -> array of x0, y0, x1, y1
+        self.texts = {}     # layer -> (array of x, y, list of strings)
+
+    def box(self, layer : int, x0 : int, y0 : int, x1 : int, y1 : int):
+        """
+        Add a box given by normalized coordinates.
+        """
+        if layer not in self.boxes:
+            self.boxes[layer] = array("i")
+        self.boxes[layer].extend((x0, y0, x1, y1))
+
+    def text(self, layer : int, x : int, y : int, text : str):
+        """
+        Add a text object.
+        """
+        if layer not in self.texts:
+            self.texts[layer] = (array("i"), [])
+        self.texts[layer][0].extend((x, y))
+        self.texts[layer][1].append(text)
+
+    def pending_bbox(self, layer : int) -> db.Box:
+        """
+        Bounding box of the collected shapes on a layer.
+        """
+        bbox = db.Box()
+        b = self.boxes.get(layer)
+        if b:
+            bbox += db.Box(min(b[0::4]), min(b[1::4]), max(b[2::4]), max(b[3::4]))
+        if layer in self.texts:
+            t = self.texts[layer][0]
+            bbox += db.Box(min(t[0::2]), min(t[1::2]), max(t[0::2]), max(t[1::2]))
+        return bbox
+
+    def bbox(self, layer : int = -1) -> db.Box:
+        """
+        Bounding box of the cell & the collected shapes on a layer or on all layers.
+        """
+        if layer >= 0:
+            return self.cell.bbox(layer) + self.pending_bbox(layer)
+        bbox = self.cell.bbox()
+        for l in set(self.boxes) | set(self.texts):
+            bbox += self.pending_bbox(l)
+        return bbox
+
+    def bboxes(self, layers : list) -> list:
+        """
+        Bounding boxes for several layers at once.
+        """
+        return [self.bbox(l) for l in layers]
+
+    def commit(self):
+        """
+        Insert all collected shapes into the cell.
+        """
+        for layer, b in self.boxes.items():
+            insert, box = self.cell.shapes(layer).insert_box, db.Box
+            for i in range(0, len(b), 4):
+                insert(box(b[i], b[i+1], b[i+2], b[i+3]))
+        for layer, (xy, strings) in self.texts.items():
+            insert, text = self.cell.shapes(layer).insert_text, db.Text
+            for i, s in enumerate(strings):
+                insert(text(s, xy[2*i], xy[2*i+1]))
+        self.boxes = {}
+        self.texts = {}
+
+class ViaStack(CellGf180mcu):
+    """
+    Via stack cell with metal landing pads connecting bottom_metal to top_metal, centered at the origin.
+    """
+    def __init__(self, l : LayoutGf180mcu, bottom_metal : int, top_metal : int):
+        super().__init__(l, name = f"via_stack_{bottom_metal}_{top_metal}")
+        h = VIA_SIZE//2
+        via_box = db.Box(-h, -h, h, h)
+        self.metal_box = via_box.enlarged(METALVIA_OVERLAP, METALVIA_OVERLAP)
+        self.dup_box(l.metals[bottom_metal], self.metal_box)
+        for i in range(bottom_metal, top_metal):
+            self.dup_box(l.vias[i], via_box)
+            self.dup_box(l.metals[i+1], self.metal_box)
+
+class CellTemplates():
+    """
+    Cells generated once, each in its own private layout, & copied into new layouts on request.
+    Keeps building blocks warm between compilations in a long-lived process, thread safe.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cells = {}
+
+    def template(self, cls, *args) -> CellGf180mcu:
+        """
+        Template cell cls(layout, *args), generated on the first request.
+        """
+        key = (cls, args)
+        with self.lock:
+            if key not in self.cells:
+                self.cells[key] = cls(LayoutGf180mcu(), *args)
+            return self.cells[key]
+
+    def get(self, l : LayoutGf180mcu, cls, *args) -> CellGf180mcu:
+        """
+        Copy of cls(layout, *args) cell in layout l.
+        """
+        return self.template(cls, *args).clone(l)
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+class CellCache():
+    """
+    Generated cells kept on disk: GDS with the cell hierarchy & JSON with its attributes (boxes, numbers, strings),
+    keyed on the cell class, its parameters & a hash of the generator sources. A building block is generated once
+    for all compilations & processes sharing the cache directory, thread safe.
+    """
+    # attributes of every cell wrapper, set up by loading the cell
+    BASE_ATTRS = ["layout", "l", "cell", "label_index", "pending"]
+
+    def __init__(self, sources : list, cache_dir : Path = None):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.dir = self.cache_dir / "cells"
+        self.sources = hash_paths(sources)
+        self.lock = threading.Lock()
+
+    def get(self, l : LayoutGf180mcu, cls, *args) -> CellGf180mcu:
+        """
+        Copy of cls(layout, *args) cell in layout l, the cell is generated & stored on a cache miss.
+        """
+        key = hash_key(cls.__module__, cls.__qualname__, args, self.sources)
+        gds = self.dir / f"{cls.__name__}_{key[:16]}.gds"
+        attrs = gds.with_suffix(".json")
+        with self.lock:
+            if not attrs.is_file():
+                self.store(cls(LayoutGf180mcu(stdcells = StdCellLibrary.get(self.cache_dir)), *args), gds, attrs)
+            # a new cell is read back too, to get the same layout on cache hits & misses
+            try:
+                return self.load(l, cls, gds, attrs)
+            except (OSError, ValueError, KeyError, RuntimeError, ImportError, AttributeError) as e:
+                logging.debug(f"Failed to load cached cell {gds}: {e}")
+        return cls(l, *args)
+
+    def load(self, l : LayoutGf180mcu, cls, gds : Path, attrs : Path) -> CellGf180mcu:
+        with open(attrs) as f:
+            meta = json.load(f)
+        layout = db.Layout()
+        layout.read(str(gds))
+        leafs = {}
+        for leaf in meta["leafs"]:
+            module, name = leaf["class"]
+            leaf_cls = getattr(importlib.import_module(module), name)
+            w = object.__new__(leaf_cls)
+            w.__dict__.update({k : self.decode(v) for k, v in leaf["attrs"].items()})
+            leafs[layout.cell(leaf["cell"]).cell_index()] = ((leaf_cls, tuple(leaf["args"])), w)
+        c = object.__new__(cls)
+        CellGf180mcu.__init__(c, l, name = meta["cell"])
+        c.copy_cell_tree(layout.cell(meta["cell"]), leafs)
+        c.__dict__.update({k : self.decode(v) for k, v in meta["attrs"].items()})
+        return c
+
+    def store(self, cell : CellGf180mcu, gds : Path, attrs : Path):
+        """
+        Write the cell with its hierarchy, attributes & leaf cells, the JSON file is written last & marks a complete entry.
+        """
+        try:
+            meta = {"cell" : cell.cell.name, "attrs" : self.encode_attrs(cell), "leafs" : []}
+            for (leaf_cls, args), leaf in cell.l.leaf_cells.items():
+                meta["leafs"].append({"cell" : leaf.cell.name, "class" : [leaf_cls.__module__, leaf_cls.__qualname__],
+                    "args" : self.encode(args), "attrs" : self.encode_attrs(leaf)})
+        except TypeError as e:
+            logging.debug(f"Cell {cell.cell.name} could not be cached: {e}")
+            return
+        opts = db.SaveLayoutOptions()
+        opts.gds2_write_timestamps = False
+        opts.select_cell(cell.cell.cell_index())
+        tmp_gds = gds.with_name(f".{os.getpid()}.{gds.name}")
+        tmp_attrs = attrs.with_name(f".{os.getpid()}.{attrs.name}")
+        try:
+            os.makedirs(self.dir, exist_ok = True)
+            cell.layout.write(str(tmp_gds), opts)
+            with open(tmp_attrs, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp_gds, gds)
+            os.replace(tmp_attrs, attrs)
+        except (OSError, RuntimeError) as e:
+            # the cache is optional
+            logging.debug(f"Failed to store cached cell {gds}: {e}")
+
+    @classmethod
+    def encode_attrs(cls, cell : CellGf180mcu) -> dict:
+        return {k : cls.encode(v) for k, v in cell.__dict__.items() if k not in cls.BASE_ATTRS}
+
+    @classmethod
+    def encode(cls, v):
+        if isinstance(v, db.Box):
+            return {"box" : v.to_s()}
+        if isinstance(v, (list, tuple)):
+            return [cls.encode(i) for i in v]
+        if v is None or isinstance(v, (bool, int, float, str)):
+            return v
+        raise TypeError(f"attribute of type {type(v).__name__} is not supported")
+
+    @classmethod
+    def decode(cls, v):
+        if isinstance(v, dict):
+            return db.Box.from_s(v["box"])
+        if isinstance(v, list):
+            return [cls.decode(i) for i in v]
+        return v
+
+class StdCellLibrary():
+    """
+    Standard cells of the PDK library shared by all layouts of the process. The library GDS is read once
+    and the cells used by the compiler are kept in a small extract in the cache directory, keyed on
+    the library path & modification time, so later processes do not read the whole library at all.
+    """
+    _libs = {}
+    _libs_lock = threading.Lock()
+
+    def __init__(self, gds : Path, cache_dir : Path = None):
+        """
+        Library of gds with the extract in cache_dir, the cells are read from gds on each run if cache_dir is not set.
+        """
+        self.gds = Path(gds)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.lock = threading.Lock()
+        self.layout = db.Layout()
+        self.extract = None
+        if self.cache_dir:
+            st = self.gds.stat()
+            key = hash_key(str(self.gds.resolve()), st.st_mtime_ns, st.st_size)
+            self.extract = self.cache_dir / "stdcells" / f"{STDCELL_LIB}_{key[:16]}.gds"
+            if self.extract.is_file():
+                try:
+                    self.layout.read(str(self.extract))
+                except RuntimeError as e:
+                    logging.debug(f"Broken standard cell extract {self.extract}: {e}")
+                    self.layout = db.Layout()
+
+    @classmethod
+    def get(cls, cache_dir : Path = None, cache : bool = True):
+        """
+        Library of the PDK set by PDK_ROOT & PDK environment variables with the extract in cache_dir
+        (default cache directory if not set), no extract is kept if cache is False.
+        """
+        gds = Path(os.environ['PDK_ROOT']) / os.environ['PDK'] / f"libs.ref/{STDCELL_LIB}/gds/{STDCELL_LIB}.gds"
+        if cache:
+            cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        else:
+            cache_dir = None
+        with cls._libs_lock:
+            if (gds, cache_dir) not in cls._libs:
+                cls._libs[(gds, cache_dir)] = cls(gds, cache_dir)
+            return cls._libs[(gds, cache_dir)]
+
+    def copy(self, cell : db.Cell, name : str):
+        """
+        Copy library cell into cell, the whole library is read only if the cell is not in the extract yet.
+        """
+        with self.lock:
+            if not self.layout.has_cell(name):
+                self.load([name] + [f"{STDCELL_LIB}__{c}" for c in STDCELLS])
+            cell.copy_tree(self.layout.cell(name))
+
+    def load(self, names : list):
+        """
+        Copy cells from the library GDS into the extract & save it.
+        """
+        lib = db.Layout()
+        lib.read(str(self.gds))
+        for name in names:
+            if lib.has_cell(name) and not self.layout.has_cell(name):
+                self.layout.create_cell(name).copy_tree(lib.cell(name))
+        if not self.layout.has_cell(names[0]):
+            raise ValueError(f"No cell {names[0]} in {self.gds}")
+        if not self.extract:
+            return
+
+        tmp = self.extract.with_name(f".{os.getpid()}.{self.extract.name}")
+        try:
+            os.makedirs(self.extract.parent, exist_ok = True)
+            self.layout.write(str(tmp))
+            os.replace(tmp, self.extract)
+        except (OSError, RuntimeError) as e:
+            # the extract is just a cache
+            logging.debug(f"Failed to write standard cell extract {self.extract}: {e}")
+
 class StdCellGf180mcu(CellGf180mcu):
     """
     Standard cell helper.
     """
     def __init__(self, l : LayoutGf180mcu, cell_name : str):
-        super().__init__(l, parent = Path(os.environ['PDK_ROOT']) / os.environ['PDK'] / 
-            "libs.ref/gf180mcu_fd_sc_mcu7t5v0/gds/gf180mcu_fd_sc_mcu7t5v0.gds", name = cell_name, single_cell = True)
+        super().__init__(l, name = cell_name)
+        (l.stdcells or StdCellLibrary.get()).copy(self.cell, cell_name)
         self.zero_origin()
         self.wdt = self.bbox(l.metal1).width()
 
@@ -289,25 +735,46 @@ class Endcap(StdCellGf180mcu):
     Endcap.
     """
     def __init__(self, l : LayoutGf180mcu):
-        super().__init__(l, "gf180mcu_fd_sc_mcu7t5v0__endcap")
+        super().__init__(l, f"{STDCELL_LIB}__endcap")
 
 class FillTie(StdCellGf180mcu):
     """
     Filler with well tap.
     """
     def __init__(self, l : LayoutGf180mcu):
-        super().__init__(l, "gf180mcu_fd_sc_mcu7t5v0__filltie")
+        super().__init__(l, f"{STDCELL_LIB}__filltie")
 
 class FillCap(StdCellGf180mcu):
     """
     Filler with capacitor.
     """
     def __init__(self, l : LayoutGf180mcu):
-        super().__init__(l, "gf180mcu_fd_sc_mcu7t5v0__fillcap_4")
+        super().__init__(l, f"{STDCELL_LIB}__fillcap_4")
 
 class Inv1(StdCellGf180mcu):
     """
     Smallest inverter.
     """
     def __init__(self, l : LayoutGf180mcu):
-        super().__init__(l, "gf180mcu_fd_sc_mcu7t5v0__inv_1")
+        super().__init__(l, f"{STDCELL_LIB}__inv_1")
+
+class Inv2(StdCellGf180mcu):
+    """
+    Inverter with double drive strength.
+    """
+    def __init__(self, l : LayoutGf180mcu):
+        super().__init__(l, f"{STDCELL_LIB}__inv_2")
+
+class Inv4(StdCellGf180mcu):
+    """
+    Inverter with quadruple drive strength.
+    """
+    def __init__(self, l : LayoutGf180mcu):
+        super().__init__(l, f"{STDCELL_LIB}__inv_4")
+
+class Buf2(StdCellGf180mcu):
+    """
+    Buffer with double drive strength.
+    """
+    def __init__(self, l : LayoutGf180mcu):
+        super().__init__(l, f"{STDCELL_LIB}__buf_2")
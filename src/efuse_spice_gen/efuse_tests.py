@@ -1,7 +1,10 @@
 """Xyce eFuse tests generators reside here."""
 
+import os
 import random
+import shutil
 import logging
+from pathlib import Path
 from .xyce_test_runner import XyceTestRunner
 
 TRANSITION_TIME     = 0.5e-9
@@ -17,21 +20,28 @@ class EfuseArrayTest(XyceTestRunner):
     """
     Class based on XyceTestRunner to run the tests on eFuse array netlists.
     """
-    def __init__(self, nwords : int, word_width : int, tb : str, netlist : str, uut_file : str, is_flat : bool, vdd : float, ncpus : int = 1):
+    def __init__(self, nwords : int, word_width : int, tb : str, netlist : str, uut_file : str, is_flat : bool, vdd : float, ncpus : int = 1,
+                    timeout : float = None, work_dir = None, bit_sel_n : bool = False):
         self.nwords = nwords
         self.word_width = word_width
         self.max_word_val = 2**self.word_width - 1
         self.is_flat = is_flat
+        # bit select pins of arrays with internal buffers are active low
+        self.bit_sel_mask = 2**self.nwords - 1 if bit_sel_n else 0
+        self.bit_sel_name = "BIT_SEL_N" if bit_sel_n else "BIT_SEL"
 
-        super().__init__(tb, netlist, uut_file, vdd, TRANSITION_TIME, ncpus)
+        super().__init__(tb, netlist, uut_file, vdd, TRANSITION_TIME, ncpus, timeout, work_dir)
         logging.getLogger(__name__)
 
         # create test memory array and empty blown map
         self.memory = [0] * self.nwords
         self.blown_map = {0 : 0}
 
-        # patch flat netlist with parameters
+        # patch flat netlist with parameters, a copy in the work dir is patched as the netlist is a result of the extraction stage
         if is_flat:
+            os.makedirs(self.work_dir, exist_ok = True)
+            self.netlist = self.work_dir / f"{Path(netlist).stem}.params{Path(netlist).suffix}"
+            shutil.copy(netlist, self.netlist)
             self.regexp_patch(self.netlist, r"^X(\d+)( .* efuse)", r"X\1\2 PARAMS: NUM=\1")
 
     def new_test_run(self, test_name : str):
@@ -45,7 +55,7 @@ class EfuseArrayTest(XyceTestRunner):
         self.preset_n = self.create_driver("PRESET_N", True)
         self.sense = self.create_driver("SENSE", False)
         self.col_prog_n = self.create_bus_driver("COL_PROG_N", self.word_width, self.max_word_val)
-        self.bit_sel = self.create_bus_driver("BIT_SEL", self.nwords, 0)
+        self.bit_sel = self.create_bus_driver(self.bit_sel_name, self.nwords, self.bit_sel_mask)
 
         self.write_table_include("blown.map", self.blown_map)
 
@@ -59,10 +69,10 @@ class EfuseArrayTest(XyceTestRunner):
         self.set(self.sense, True)
         self.wait_for(SENSE_TIME)
         self.set(self.preset_n, True)
-        self.set(self.bit_sel, 1<<word_addr)
+        self.set(self.bit_sel, self.bit_sel_mask ^ (1<<word_addr))
         self.wait_for(BITSEL_TIME)
         self.set(self.sense, False)
-        self.set(self.bit_sel, 0)
+        self.set(self.bit_sel, self.bit_sel_mask)
 
         # check read val after simulation
         self.add_check("OUT", self.word_width, self.memory[word_addr])
@@ -74,11 +84,11 @@ class EfuseArrayTest(XyceTestRunner):
         Generate PWL sequence for eFuse write.
         """
         # create pwl data
-        self.set(self.bit_sel, 1<<word_addr)
+        self.set(self.bit_sel, self.bit_sel_mask ^ (1<<word_addr))
         self.wait_for(PROG_TO_SEL_TIME)
         self.set(self.col_prog_n, self.max_word_val - data)  # binary negated data
         self.wait_for(PROG_TIME)
-        self.set(self.bit_sel, 0)
+        self.set(self.bit_sel, self.bit_sel_mask)
         self.set(self.col_prog_n, self.max_word_val)
         
         self.wait_for(sleep)
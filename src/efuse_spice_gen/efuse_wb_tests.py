@@ -43,7 +43,7 @@ class EfuseWbTest(XyceTestRunner):
 
         # patch flat netlist with parameters
         if self.is_flat:
-            self.regexp_patch(self.uut_file, r"^X(\d+)( .* efuse)", r"X\1\2 PARAMS: NUM=\1")
+            self.regexp_patch(self.test_dir / self.uut_file, r"^X(\d+)( .* efuse)", r"X\1\2 PARAMS: NUM=\1")
 
         # create tb drivers
         self.preset_n = self.create_driver("write_enable_i", True)
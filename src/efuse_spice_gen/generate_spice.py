@@ -8,7 +8,7 @@ import sys
 import json
 from pathlib import Path
 
-def write_magic_ports(filename : str, ports : str):
+def write_magic_ports(filename : Path, ports : str):
     port_list = ports.split(" ")
     with open(filename, "w") as f:
         for i,p in enumerate(port_list):
@@ -24,12 +24,15 @@ def subcircuit(name : str, ports : str, body : str, params : str = "") -> str:
 .ends
     """
 
-def efuse_bitline(n_fuses : int, device_naming : list) -> str:
+def efuse_bitline_ports(n_fuses : int) -> str:
     bitline_ports = "VSS VDD SENSE PRESET_N "
     for i in range(n_fuses):
         bitline_ports += f"BIT_SEL[{i}] "
     bitline_ports += "COL_PROG_N OUT"
-    write_magic_ports("efuse_bitline_ports.tcl", bitline_ports)
+    return bitline_ports
+
+def efuse_bitline(n_fuses : int, device_naming : list) -> str:
+    bitline_ports = efuse_bitline_ports(n_fuses)
     body = ""
     for i in range(n_fuses):
         body += f"X{i} VSS VDD BIT_SEL[{i}] bitline efuse_bitcell NUM={{LNUM*1000+{i}}}\n"
@@ -45,23 +48,49 @@ def efuse_bitline(n_fuses : int, device_naming : list) -> str:
     
     return subcircuit("efuse_bitline", bitline_ports, body, "LNUM=0")
 
-def efuse_array(cellname : str, word_width : int, n_fuses : int, add_cells : str = "") -> str:
-    common_ports = "VSS VDD SENSE PRESET_N " + "".join([f'BIT_SEL[{j}] ' for j in range(n_fuses)])
+def bit_sel_buffers(add_cells_dict : dict, n_fuses : int) -> tuple:
+    """
+    Bit select inverters placed into the array: (cell name, parallel inverters per line) or None.
+    """
+    for c in add_cells_dict:
+        if "__inv_" in c:
+            return c, add_cells_dict[c] // n_fuses
+    return None
+
+def efuse_array(cellname : str, word_width : int, n_fuses : int, add_cells : str = "", buffers : tuple = None, ctrl_rows : int = 0) -> str:
+    bit_sel_ports = "".join([f'BIT_SEL[{j}] ' for j in range(n_fuses)])
+    common_ports = "VSS VDD SENSE PRESET_N " + bit_sel_ports
     array_ports = common_ports
     sel_ports = ""
 
     body = add_cells
 
+    # bit select lines driven by inverters, array pins are inverter inputs
+    if buffers:
+        array_ports = "VSS VDD SENSE PRESET_N " + "".join([f'BIT_SEL_N[{j}] ' for j in range(n_fuses)])
+        for j in range(n_fuses):
+            for k in range(buffers[1]):
+                body += f"Xbuf{j}_{k} BIT_SEL_N[{j}] BIT_SEL[{j}] VDD VDD VSS VSS {buffers[0]}\n"
+
+    # SENSE & PRESET_N lines of each ctrl_rows bitlines are driven by buffers
+    for g in range(-(-word_width // ctrl_rows) if ctrl_rows else 0):
+        body += f"Xsense_buf{g} SENSE SENSE_SEG[{g}] VDD VDD VSS VSS gf180mcu_fd_sc_mcu7t5v0__buf_2\n"
+        body += f"Xpreset_buf{g} PRESET_N PRESET_N_SEG[{g}] VDD VDD VSS VSS gf180mcu_fd_sc_mcu7t5v0__buf_2\n"
+
     for i in range(word_width):
         bitline_ports = f"COL_PROG_N[{i}] OUT[{i}] "
-        body += f"X{i} {common_ports} {sel_ports} {bitline_ports} efuse_bitline LNUM={i}\n"
+        if ctrl_rows:
+            row_ports = f"VSS VDD SENSE_SEG[{i // ctrl_rows}] PRESET_N_SEG[{i // ctrl_rows}] " + bit_sel_ports
+        else:
+            row_ports = common_ports
+        body += f"X{i} {row_ports} {sel_ports} {bitline_ports} efuse_bitline LNUM={i}\n"
         array_ports += bitline_ports
 
-    write_magic_ports("efuse_array_ports.tcl", array_ports)
     
     return subcircuit(cellname, array_ports, body), array_ports
 
-def generate_netlist(cellname : str, filename : str, nwords : int, word_width : int, klayout_lvs : bool = False, add_cells_dict : dict = {}):
+def generate_netlist(cellname : str, filename : str, nwords : int, word_width : int, klayout_lvs : bool = False, add_cells_dict : dict = {},
+                        buffers : tuple = None, ctrl_rows : int = 0):
 
     device_naming = ["X", "fet_06v0", "X0 ANODE CATHODE efuse NUM={NUM}"]
         
@@ -74,10 +103,24 @@ def generate_netlist(cellname : str, filename : str, nwords : int, word_width :
     add_cells = ""
     acnt = 0
     for c in add_cells_dict:
-        if all(x not in c for x in ["filltie", "endcap"]):
+        if all(x not in c for x in ["filltie", "endcap", "__inv_", "__buf_"]):
             for i in range(add_cells_dict[c]):
                 add_cells += f"Xfill{acnt} VDD VDD VSS VSS {c}\n"
                 acnt += 1
+
+    # control line buffers
+    ctrl_buf = ""
+    if ctrl_rows:
+        ctrl_buf = f"""
+
+.SUBCKT gf180mcu_fd_sc_mcu7t5v0__buf_2 I Z VDD VNW VPW VSS
+{device_naming[0]}2 VSS I Z_neg VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}00 Z Z_neg VSS VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}01 VSS Z_neg Z VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}3 VDD I Z_neg VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+{device_naming[0]}10 Z Z_neg VDD VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+{device_naming[0]}11 VDD Z_neg Z VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+.ENDS"""
                 
     netlist = f"""* eFuse array netlist with word_width={word_width}, nwords={nwords}
 
@@ -93,6 +136,17 @@ def generate_netlist(cellname : str, filename : str, nwords : int, word_width :
 {device_naming[0]}11 VDD I ZN VNW p{device_naming[1]} W=1.22e-06 L=5e-07
 .ENDS
 
+.SUBCKT gf180mcu_fd_sc_mcu7t5v0__inv_4 I ZN VDD VNW VPW VSS
+{device_naming[0]}00 ZN I VSS VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}01 VSS I ZN VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}02 ZN I VSS VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}03 VSS I ZN VPW n{device_naming[1]} W=8.2e-07 L=6e-07
+{device_naming[0]}10 ZN I VDD VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+{device_naming[0]}11 VDD I ZN VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+{device_naming[0]}12 ZN I VDD VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+{device_naming[0]}13 VDD I ZN VNW p{device_naming[1]} W=1.22e-06 L=5e-07
+.ENDS{ctrl_buf}
+
 .SUBCKT gf180mcu_fd_sc_mcu7t5v0__fillcap_4 VDD VNW VPW VSS
 {device_naming[0]}17 net_1 net_0 VSS VPW n{device_naming[1]} W=8.2e-07 L=1e-06
 {device_naming[0]}19 VDD net_1 net_0 VNW p{device_naming[1]} W=1.22e-06 L=1e-06
@@ -112,7 +166,7 @@ X3 net2 net1 VDD VDD VPW VSS gf180mcu_fd_sc_mcu7t5v0__inv_1
 .ends
 
 {efuse_bitline(nwords, device_naming)}
-{efuse_array(cellname, word_width, nwords, add_cells)[0]}
+{efuse_array(cellname, word_width, nwords, add_cells, buffers, ctrl_rows)[0]}
 .end
     """
 
@@ -121,7 +175,7 @@ X3 net2 net1 VDD VDD VPW VSS gf180mcu_fd_sc_mcu7t5v0__inv_1
 
 def pwl_from_file(name : str, buf : int):
     return f"""V{name} {name}_prebuf 0 PWL FILE "{name}.pwl"
-X{name}_buf {name}_prebuf {name} VDD VDD VSS VSS gf180mcu_fd_sc_mcu7t5v0__buf_{buf}
+X{name}_buf {name}_prebuf {name} VDD VDD VSS VSS efuse_tb_buf_{buf}
 """
     
 def constant_driver(name : str, value : float):
@@ -130,8 +184,12 @@ def constant_driver(name : str, value : float):
 def gen_pwl_bus(name : str, size : int, buf : int):
     return "".join([pwl_from_file(f'{name}[{i}]', buf) for i in range(0, size)])
 
-def generate_xyce_test(cellname : str, filename : str, spice_name : str, xyce_models_path : str, nwords : int, word_width : int, time : float = 100, vdd : float = 5.0):
-    array_ports = efuse_array(cellname, word_width, nwords)[1]
+def generate_xyce_test(cellname : str, filename : str, spice_name : str, xyce_models_path : str, nwords : int, word_width : int, time : float = 100, vdd : float = 5.0,
+                        buffers : tuple = None):
+    """
+    Xyce testbench, it is run from the test directory so included netlist & outputs are relative.
+    """
+    array_ports = efuse_array(cellname, word_width, nwords, buffers = buffers)[1]
     netlist = f"""* Xyce testbench for {cellname}
 .option TEMP=25.0
 .include "blown.map"
@@ -147,19 +205,20 @@ def generate_xyce_test(cellname : str, filename : str, spice_name : str, xyce_mo
 Rfuse ANODE CATHODE R='200*(1-BLOWN) + 10000*BLOWN'
 .ENDS efuse
 
-.include {spice_name}
+.include {Path(spice_name).name}
 
 Xefuse_array {array_ports} {cellname}
 
-* buffers to model drive strength
-.SUBCKT gf180mcu_fd_sc_mcu7t5v0__buf_1 I Z VDD VNW VPW VSS
+* buffers to model drive strength, named apart from standard cells of the array netlist
+* (extracted netlists are flat & the LVS one has buf_2 when control lines are buffered)
+.SUBCKT efuse_tb_buf_1 I Z VDD VNW VPW VSS
 X_i_2 VSS I Z_neg VPW nfet_06v0 W=3.6e-07 L=6e-07
 X_i_0 Z Z_neg VSS VPW nfet_06v0 W=8.2e-07 L=6e-07
 X_i_3 VDD I Z_neg VNW pfet_06v0 W=5.65e-07 L=5e-07
 X_i_1 Z Z_neg VDD VNW pfet_06v0 W=1.22e-06 L=5e-07
 .ENDS
 
-.SUBCKT gf180mcu_fd_sc_mcu7t5v0__buf_2 I Z VDD VNW VPW VSS
+.SUBCKT efuse_tb_buf_2 I Z VDD VNW VPW VSS
 X_i_2 VSS I Z_neg VPW nfet_06v0 W=8.2e-07 L=6e-07
 X_i_0_0 Z Z_neg VSS VPW nfet_06v0 W=8.2e-07 L=6e-07
 X_i_0_1 VSS Z_neg Z VPW nfet_06v0 W=8.2e-07 L=6e-07
@@ -168,7 +227,7 @@ X_i_1_0 Z Z_neg VDD VNW pfet_06v0 W=1.22e-06 L=5e-07
 X_i_1_1 VDD Z_neg Z VNW pfet_06v0 W=1.22e-06 L=5e-07
 .ENDS
 
-.SUBCKT gf180mcu_fd_sc_mcu7t5v0__buf_8 I Z VDD VNW VPW VSS
+.SUBCKT efuse_tb_buf_8 I Z VDD VNW VPW VSS
 X_i_2_0 Z_neg I VSS VPW nfet_06v0 W=8.2e-07 L=6e-07
 X_i_2_1 VSS I Z_neg VPW nfet_06v0 W=8.2e-07 L=6e-07
 X_i_2_2 Z_neg I VSS VPW nfet_06v0 W=8.2e-07 L=6e-07
@@ -196,7 +255,7 @@ X_i_1_7 VDD Z_neg Z VNW pfet_06v0 W=1.22e-06 L=5e-07
 .ENDS
 
 {gen_pwl_bus("COL_PROG_N", word_width, 8)}
-{gen_pwl_bus("BIT_SEL", nwords, 2)}
+{gen_pwl_bus("BIT_SEL_N" if buffers else "BIT_SEL", nwords, 2)}
 
 {pwl_from_file("SENSE", 8)}
 {pwl_from_file("PRESET_N", 8)}
@@ -205,31 +264,36 @@ X_i_1_7 VDD Z_neg Z VNW pfet_06v0 W=1.22e-06 L=5e-07
 * serial solver is more efficient even for large arrays
 .OPTIONS LINSOL TYPE=KLU
 
-.print tran format=csv file={filename}.csv V(PRESET_N) V(SENSE) V(OUT*) V(COL_PROG_N*) V(BIT_SEL*) I(Xefuse_array:X*:RFUSE)
+.print tran format=csv file={Path(filename).name}.csv V(PRESET_N) V(SENSE) V(OUT*) V(COL_PROG_N*) V(BIT_SEL*) I(Xefuse_array:X*:RFUSE)
     """
     
     with open(filename, "w") as f:
         f.write(netlist)
 
-def generate_spices(base_name : str, pdk_path : str, nwords : int, word_width : int, time : float = 100e-9, add_cells : Path | str = ""):
+def generate_spices(base_name : str, pdk_path : str, nwords : int, word_width : int, time : float = 100e-9, add_cells : Path | str = "",
+                        out_dir : Path = Path("."), ctrl_rows : int = 0):
     """
-    Generate a basic set of SPICE files - simulation & LVS netlists and Xyce test wrapper.
+    Generate a basic set of SPICE files - simulation & LVS netlists, Xyce test wrapper and magic port order scripts in out_dir.
+    ctrl_rows is the number of bitlines sharing SENSE & PRESET_N buffers of the array, 0 if there are none.
     """
     xyce_models_path = f"{pdk_path}/libs.tech/xyce/"
 
-    spice_name = base_name + ".spice"
-    lvs_name = base_name + ".klvs.spice"
-    tb_name = base_name + "_test.xyce"
+    spice_name = Path(out_dir) / (base_name + ".spice")
+    lvs_name = Path(out_dir) / (base_name + ".klvs.spice")
+    tb_name = Path(out_dir) / (base_name + "_test.xyce")
 
     if add_cells:
         with open(add_cells, "r") as f:
             add_cells_dict = json.load(f)
     else:
         add_cells_dict = {}
+    buffers = bit_sel_buffers(add_cells_dict, nwords)
 
-    generate_netlist(base_name, spice_name, nwords, word_width, False)
-    generate_netlist(base_name, lvs_name, nwords, word_width, True, add_cells_dict)
-    generate_xyce_test(base_name, tb_name, spice_name, xyce_models_path, nwords, word_width, time)
+    generate_netlist(base_name, spice_name, nwords, word_width, False, buffers = buffers, ctrl_rows = ctrl_rows)
+    generate_netlist(base_name, lvs_name, nwords, word_width, True, add_cells_dict, buffers, ctrl_rows)
+    generate_xyce_test(base_name, tb_name, spice_name, xyce_models_path, nwords, word_width, time, buffers = buffers)
+    write_magic_ports(Path(out_dir) / "efuse_bitline_ports.tcl", efuse_bitline_ports(nwords))
+    write_magic_ports(Path(out_dir) / "efuse_array_ports.tcl", efuse_array(base_name, word_width, nwords, buffers = buffers)[1])
 
     return spice_name, lvs_name, tb_name
 
@@ -7,6 +7,8 @@ import csv
 import subprocess as sp
 from pathlib import Path
 
+from ..flow import process, stats
+
 class DigitalPwlDriver:
     """
     Create PWL file to drive "digital" inputs in Xyce.
@@ -33,8 +35,8 @@ class DigitalPwlDriver:
             self.state = new_state
             self.last_switch_time = ttime
 
-    def write_pwl(self):
-        with open(f"{self.name}.pwl", "w") as f:
+    def write_pwl(self, out_dir : Path = Path(".")):
+        with open(Path(out_dir) / f"{self.name}.pwl", "w") as f:
             f.write(self.pwl_data)
 
 
@@ -54,23 +56,25 @@ class DigitalPwlBus:
         for i in range(self.wdt):
             self.bits[i].set(bool(state & (1<<i)), time)
 
-    def write_pwl(self):
+    def write_pwl(self, out_dir : Path = Path(".")):
         for b in self.bits:
-            b.write_pwl()
+            b.write_pwl(out_dir)
 
 class XyceTestRunner:
     """
     Base class to create test sequences in PWL files, run Xyce simulation 
-    and analize simulation waveforms afterwards.
+    and analize simulation waveforms afterwards. Each test run is done in its own directory inside work_dir.
     """
-    def __init__(self, tb : str, netlist : str, uut_file : str, vdd : float, transition : float, ncpus : int = 1):
+    def __init__(self, tb : str, netlist : str, uut_file : str, vdd : float, transition : float, ncpus : int = 1, timeout : float = None,
+                    work_dir : Path = None):
         self.vdd = vdd
         self.tb = tb
         self.netlist = netlist
         self.uut_file = uut_file
         self.transition = transition
         self.ncpus = ncpus
-        self.orig_wd = os.getcwd()
+        self.timeout = timeout
+        self.work_dir = Path(work_dir if work_dir else os.getcwd()).absolute()
         self.reset()
 
     @staticmethod 
@@ -92,19 +96,17 @@ class XyceTestRunner:
         self.simlog_dict = {}
         self.drivers = []
 
-        os.chdir(self.orig_wd)
-
     def new_test_run(self, test_name : str):
         """
         Prepare new test run.
         """
         self.reset()
         self.test_name = test_name
-        os.makedirs(self.test_name, exist_ok=True)
-        shutil.copy(self.tb, self.test_name)
-        shutil.copy(self.netlist, Path(self.test_name) / self.uut_file)
-        self.run_tb = (Path(self.test_name) / Path(self.tb).name).absolute()
-        os.chdir(self.test_name)
+        self.test_dir = self.work_dir / test_name
+        os.makedirs(self.test_dir, exist_ok=True)
+        shutil.copy(self.tb, self.test_dir)
+        shutil.copy(self.netlist, self.test_dir / self.uut_file)
+        self.run_tb = self.test_dir / Path(self.tb).name
 
     def create_driver(self, name : str, initial : bool):
         """
@@ -140,7 +142,7 @@ class XyceTestRunner:
         """
         # write all PWL files
         for d in self.drivers:
-            d.write_pwl()
+            d.write_pwl(self.test_dir)
 
         # patch simulation time in testbench
         self.regexp_patch(self.run_tb, r"^\.tran (\d+)ps (?:\d+([.]\d*)?(?:e[+-]?\d+)?|[.]\d+(?:e[+-]?\d+)?)(.*)", f".tran \\1ps {self.time} \\2")
@@ -149,20 +151,22 @@ class XyceTestRunner:
         """
         Run current test in Xyce simulator.
         """
-        with open("xyce.log", "w") as log:
-            try:
-                run_list = ["Xyce", self.run_tb]
-                if self.ncpus != 1:
-                    run_list = ["mpirun", "-np", str(self.ncpus)] + run_list
-                sp.run(run_list, stdout = log, stderr = sp.STDOUT, check = True)
-            except Exception:
-                raise AssertionError("Xyce run failed!")
+        run_list = ["Xyce", self.run_tb]
+        if self.ncpus != 1:
+            run_list = ["mpirun", "-np", str(self.ncpus)] + run_list
+        try:
+            with stats.measure(f"xyce {self.test_name}", test = self.test_name, netlist = Path(self.netlist).name, ncpus = self.ncpus):
+                process.run(run_list, log = self.test_dir / "xyce.log", append = False, cwd = self.test_dir, check = True, timeout = self.timeout)
+        except sp.TimeoutExpired as e:
+            raise AssertionError(f"Xyce run timed out after {e.timeout}s, last lines of xyce.log:\n{e.output}")
+        except sp.CalledProcessError as e:
+            raise AssertionError(f"Xyce run failed, last lines of xyce.log:\n{e.output}")
 
     def read_simlog(self):
         """
         Read the simulation log in the csv format.
         """
-        with open(Path(f"{self.run_tb}.csv")) as tb_csv:
+        with stats.measure("read_simlog", "step", test = self.test_name) as m, open(Path(f"{self.run_tb}.csv")) as tb_csv:
             reader = csv.reader(tb_csv)
             header = next(reader)
             # construct simlog dict (TIME is always 0)
@@ -172,6 +176,7 @@ class XyceTestRunner:
             # read whole simlog
             for row in reader:
                 self.simlog.append(row)
+            m.args.update(rows = len(self.simlog), columns = len(header))
 
     def cur_simlog(self, i : int):
         """
@@ -225,7 +230,7 @@ class XyceTestRunner:
         Write Xyce-format include containing a table for single parameter dependedn on other parameter.
         Quiet ugly, but tablefile supports only time parameter for some reason.
         """
-        with open(fname, "w") as f:
+        with open(self.test_dir / fname, "w") as f:
             f.write(".PARAM BLOWN_MAP(X)='table(X\n")
             for i in sorted(table.items()):
                 f.write(f"+, {i[0]}, {i[1]}\n")
@@ -264,7 +269,8 @@ class XyceTestRunner:
         """
         Run simulation and checks after it.
         """
-        self.prepare_sim()
-        self.run_xyce_sim()
-        self.read_simlog()
-        self.run_checks()
+        with stats.measure(f"test {self.test_name}", "step", test = self.test_name, ncpus = self.ncpus):
+            self.prepare_sim()
+            self.run_xyce_sim()
+            self.read_simlog()
+            self.run_checks()
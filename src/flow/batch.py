@@ -0,0 +1,99 @@
+#
+# Batch compilation of several eFuse array configurations
+#
+
+import json
+import logging
+import itertools
+import multiprocessing as mp
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+def expand_configs(spec) -> list:
+    """
+    Expand batch specification into a list of configurations. Specification is either a list of
+    configuration dicts or a dict where any list value is a matrix dimmension, for example:
+        {"nwords" : [16, 32, 64], "word_width" : [1, 8, 16, 32, 64], "xyce_netlist" : "none"}
+    """
+    if isinstance(spec, list):
+        configs = []
+        for s in spec:
+            configs += expand_configs(s)
+        return configs
+
+    keys = list(spec.keys())
+    values = [v if isinstance(v, list) else [v] for v in spec.values()]
+    return [dict(zip(keys, c)) for c in itertools.product(*values)]
+
+def read_spec(fname : Path) -> list:
+    """
+    Read batch specification JSON file.
+    """
+    with open(fname) as f:
+        return expand_configs(json.load(f))
+
+def macro_size(lef : Path) -> tuple:
+    """
+    Macro size in microns from LEF or None.
+    """
+    try:
+        with open(lef) as f:
+            for l in f:
+                l = l.split()
+                if len(l) >= 4 and l[0] == "SIZE" and l[2] == "BY":
+                    return float(l[1]), float(l[3].rstrip(";"))
+    except OSError:
+        pass
+    return None
+
+class BatchRunner:
+    """
+    Run flow for a list of configurations in a process pool.
+    Each of jobs concurrent flows gets its share of ncpus CPU threads.
+
+        worker  : picklable callable(config : dict, ncpus : int, run_dir : Path) -> dict with at least "ok" key
+        configs : list of configuration dicts with unique "name" keys
+    """
+    def __init__(self, worker, configs : list, batch_dir : Path, jobs : int = 1, ncpus : int = 1):
+        self.worker = worker
+        self.configs = configs
+        self.batch_dir = Path(batch_dir)
+        self.jobs = max(1, min(jobs, len(configs)))
+        self.flow_cpus = max(1, ncpus // self.jobs)
+
+    def run(self) -> list:
+        """
+        Run all configurations, write summary & return list of results.
+        """
+        logging.info(f"Running {len(self.configs)} configurations in {self.jobs} parallel flows with {self.flow_cpus} CPU(s) each...")
+        results = []
+        # spawn to get clean interpreter state (logging, KLayout) in each worker
+        with ProcessPoolExecutor(max_workers = self.jobs, mp_context = mp.get_context("spawn")) as pool:
+            futures = {pool.submit(self.worker, c, self.flow_cpus, self.batch_dir / c["name"]): c for c in self.configs}
+            for f in as_completed(futures):
+                try:
+                    r = f.result()
+                except Exception as e:
+                    r = {"ok" : False, "error" : repr(e)}
+                r["name"] = futures[f]["name"]
+                r["config"] = futures[f]
+                results.append(r)
+                logging.info(f"{r['name']}: {'done' if r['ok'] else 'FAILED'} in {r.get('time', 0):.1f}s")
+
+        results.sort(key = lambda r: self.configs.index(r["config"]))
+        self.write_summary(results)
+        return results
+
+    def write_summary(self, results : list):
+        """
+        Write JSON summary & log a summary table.
+        """
+        with open(self.batch_dir / "summary.json", "w") as f:
+            json.dump(results, f, indent = 4, default = str)
+
+        logging.info(f"{'Macro':<32} {'Status':<8} {'Time, s':>10} {'Size, um':>20}")
+        for r in results:
+            size = r.get("size")
+            size = f"{size[0]:.2f} x {size[1]:.2f}" if size else "-"
+            logging.info(f"{r['name']:<32} {'ok' if r['ok'] else 'FAILED':<8} {r.get('time', 0):>10.1f} {size:>20}")
+        logging.info(f"Batch summary written to {self.batch_dir / 'summary.json'}")
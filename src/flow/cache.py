@@ -0,0 +1,131 @@
+#
+# Content addressed cache for eFuse flow artifacts
+#
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+def default_cache_dir() -> Path:
+    """
+    Default cache location, could be overridden with EFUSE_CACHE_DIR environment variable.
+    """
+    if "EFUSE_CACHE_DIR" in os.environ:
+        return Path(os.environ["EFUSE_CACHE_DIR"])
+    return Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "gf180_efuse_compiler"
+
+def hash_paths(paths : list, base : Path = None) -> str:
+    """
+    Hash contents of files & directories (recursively). Names are hashed relative to base if set.
+    """
+    h = hashlib.sha256()
+    files = []
+    for p in paths:
+        p = Path(p)
+        if p.is_dir():
+            files += [f for f in p.rglob("*") if f.is_file() and "__pycache__" not in f.parts]
+        elif p.is_file():
+            files.append(p)
+        else:
+            h.update(f"missing:{p.name}".encode())
+    for f in sorted(files):
+        name = f.relative_to(base) if base else f.name
+        h.update(str(name).encode() + b"\0")
+        with open(f, "rb") as fd:
+            for chunk in iter(lambda: fd.read(1 << 20), b""):
+                h.update(chunk)
+        h.update(b"\0")
+    return h.hexdigest()
+
+def hash_key(*parts) -> str:
+    """
+    Hash any JSON serializable key parts.
+    """
+    return hashlib.sha256(json.dumps(parts, sort_keys = True, default = str).encode()).hexdigest()
+
+def pdk_id(pdk_path : Path) -> dict:
+    """
+    PDK identification: variant name, resolved install path (ciel keeps versions in separate dirs) & SOURCES file.
+    """
+    pdk_path = Path(pdk_path)
+    ident = {"variant" : pdk_path.name, "path" : str(pdk_path.resolve())}
+    sources = pdk_path / "SOURCES"
+    if sources.is_file():
+        ident["sources"] = sources.read_text()
+    return ident
+
+class ArtifactCache:
+    """
+    Cache storing sets of files under content hash keys. Entries are published atomically,
+    so several flows could share the cache directory.
+    """
+    def __init__(self, cache_dir : Path = None):
+        self.dir = Path(cache_dir) if cache_dir else default_cache_dir()
+
+    def entry(self, key : str) -> Path:
+        """
+        Entry directory for the key.
+        """
+        return self.dir / key[:2] / key
+
+    def lookup(self, key : str) -> Path:
+        """
+        Returns cache entry directory or None.
+        """
+        e = self.entry(key)
+        if (e / "meta.json").is_file():
+            return e
+        return None
+
+    def meta(self, key : str) -> dict:
+        """
+        Metadata stored with the entry.
+        """
+        with open(self.entry(key) / "meta.json") as f:
+            return json.load(f)
+
+    def store(self, key : str, paths : list, meta : dict = dict()):
+        """
+        Copy files & directories into a new cache entry.
+        """
+        e = self.entry(key)
+        if e.is_dir():
+            return
+        tmp = e.parent / f".{key}.{os.getpid()}"
+        shutil.rmtree(tmp, ignore_errors = True)
+        try:
+            os.makedirs(tmp / "files")
+            names = []
+            for p in paths:
+                p = Path(p)
+                if p.is_dir():
+                    shutil.copytree(p, tmp / "files" / p.name, symlinks = True)
+                else:
+                    shutil.copy2(p, tmp / "files" / p.name)
+                names.append(p.name)
+            with open(tmp / "meta.json", "w") as f:
+                json.dump(dict(meta, files = names), f, indent = 4)
+            os.rename(tmp, e)
+        except OSError as err:
+            # entry published by someone else or cache is not writable, cache is optional anyway
+            logging.debug(f"Failed to store cache entry {key}: {err}")
+            shutil.rmtree(tmp, ignore_errors = True)
+
+    def restore(self, key : str, dest : Path) -> bool:
+        """
+        Copy entry contents into dest directory. Returns False on cache miss.
+        """
+        e = self.lookup(key)
+        if not e:
+            return False
+        os.makedirs(dest, exist_ok = True)
+        for name in self.meta(key)["files"]:
+            src = e / "files" / name
+            if src.is_dir():
+                shutil.copytree(src, Path(dest) / name, symlinks = True, dirs_exist_ok = True)
+            else:
+                shutil.copy2(src, Path(dest) / name)
+        return True
@@ -0,0 +1,255 @@
+#
+# Long-lived compiler daemon serving requests over a Unix socket or localhost HTTP
+#
+
+import os
+import json
+import time
+import socket
+import logging
+import threading
+import http.client
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+from .errors import FlowError
+
+LOCAL_HOSTS = ["localhost", "127.0.0.1"]
+
+def parse_address(address : str) -> tuple:
+    """
+    Daemon address: "unix:PATH" or a path containing "/" for a Unix socket, "[HOST:]PORT" for localhost HTTP.
+    Returns ("unix", path) or ("tcp", (host, port)).
+    """
+    if address.startswith("unix:"):
+        return "unix", Path(address[5:]).absolute()
+    if "/" in address:
+        return "unix", Path(address).absolute()
+    host, _, port = address.rpartition(":")
+    host = host or "127.0.0.1"
+    if host not in LOCAL_HOSTS:
+        raise ValueError(f"daemon should listen on localhost, got {host}")
+    return "tcp", (host, int(port))
+
+class EventHandler(logging.Handler):
+    """
+    Forward log records as progress events of a request.
+    """
+    def __init__(self, emit, level : int = logging.INFO):
+        super().__init__(level)
+        self.emit_event = emit
+
+    def emit(self, record):
+        self.emit_event({"event" : "log", "level" : record.levelname, "time" : record.created, "message" : record.getMessage()})
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    POST /KIND with JSON request body is answered with a stream of JSON lines: progress events
+    {"event" : "log", ...} and the final {"event" : "done", "result" : {...}} or {"event" : "error", "error" : "..."}.
+    GET /status returns daemon status.
+    """
+    def log_message(self, format, *args):
+        logging.debug(f"Daemon request: {format % args}")
+
+    def send_json(self, code : int, obj : dict):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.strip("/") != "status":
+            return self.send_json(404, {"error" : f"unknown path {self.path}"})
+        self.send_json(200, self.server.daemon.status())
+
+    def do_POST(self):
+        kind = self.path.strip("/")
+        daemon = self.server.daemon
+        # the body is read first, the client could still be sending it when an error is answered
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if kind not in daemon.handlers:
+            return self.send_json(404, {"error" : f"unknown request {kind}, available: {', '.join(daemon.handlers)}"})
+        try:
+            request = json.loads(body or b"{}")
+        except ValueError as e:
+            return self.send_json(400, {"error" : f"bad JSON request: {e}"})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        lock = threading.Lock()
+        connected = True
+
+        def emit(event : dict):
+            # called from flow stage threads too, a gone client does not stop the request
+            nonlocal connected
+            with lock:
+                if not connected:
+                    return
+                try:
+                    self.wfile.write(json.dumps(event, default = str).encode() + b"\n")
+                    self.wfile.flush()
+                except OSError:
+                    connected = False
+
+        emit({"event" : "started", "request" : kind})
+        emit(daemon.handle(kind, request, emit))
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    """
+    HTTP server on a Unix socket.
+    """
+    daemon_threads = True
+
+    def get_request(self):
+        # no peer address for Unix sockets, BaseHTTPRequestHandler expects a tuple
+        request, _ = super().get_request()
+        return request, ("unix", 0)
+
+class CompilerDaemon:
+    """
+    Server keeping compiler state (imported modules, warm cell templates) between requests.
+    Each request is served in its own thread.
+
+        handlers : dict of request kind -> callable(request : dict, emit) -> result dict,
+                   emit(event : dict) streams progress events to the client, FlowError fails the request
+    """
+    def __init__(self, address : str, handlers : dict):
+        self.address = address
+        self.handlers = dict(handlers)
+        self.started = time.time()
+        self.lock = threading.Lock()
+        self.served = 0
+        self.active = 0
+
+        kind, addr = parse_address(address)
+        if kind == "unix":
+            try:
+                os.unlink(addr)
+            except FileNotFoundError:
+                pass
+            self.server = UnixHTTPServer(str(addr), RequestHandler)
+        else:
+            self.server = ThreadingHTTPServer(addr, RequestHandler)
+        self.server.daemon = self
+        self.kind = kind
+        self.addr = addr
+
+    def status(self) -> dict:
+        with self.lock:
+            return {"pid" : os.getpid(), "uptime" : time.time() - self.started, "served" : self.served,
+                "active" : self.active, "requests" : list(self.handlers)}
+
+    def handle(self, kind : str, request : dict, emit) -> dict:
+        """
+        Run a request handler, returns the final event.
+        """
+        with self.lock:
+            self.active += 1
+        start = time.perf_counter()
+        try:
+            event = {"event" : "done", "result" : self.handlers[kind](request, emit)}
+        except FlowError as e:
+            event = {"event" : "error", "error" : str(e)}
+        except Exception as e:
+            logging.exception(f"Daemon {kind} request failed")
+            event = {"event" : "error", "error" : repr(e)}
+        event["time"] = time.perf_counter() - start
+        with self.lock:
+            self.active -= 1
+            self.served += 1
+        logging.info(f"Daemon {kind} request {'done' if event['event'] == 'done' else 'FAILED'} in {event['time']:.2f}s")
+        return event
+
+    def serve(self):
+        """
+        Serve requests until interrupted.
+        """
+        logging.info(f"Compiler daemon listening on {self.address}")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            if self.kind == "unix":
+                try:
+                    os.unlink(self.addr)
+                except FileNotFoundError:
+                    pass
+
+    def shutdown(self):
+        """
+        Stop serve() from another thread.
+        """
+        self.server.shutdown()
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """
+    HTTP client connection over a Unix socket.
+    """
+    def __init__(self, path : Path, timeout : float = None):
+        super().__init__("localhost", timeout = timeout)
+        self.socket_path = str(path)
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+class DaemonClient:
+    """
+    Client of the compiler daemon, e.g. for floorplanning scripts:
+
+        client = DaemonClient("unix:/tmp/efuse.sock")
+        res = client.call("layout", {"config" : {"nwords" : 32, "word_width" : 8}, "workdir" : "work/efuse_32x8"})
+    """
+    def __init__(self, address : str, timeout : float = None):
+        self.kind, self.addr = parse_address(address)
+        self.timeout = timeout
+
+    def connect(self) -> http.client.HTTPConnection:
+        if self.kind == "unix":
+            return UnixHTTPConnection(self.addr, self.timeout)
+        return http.client.HTTPConnection(*self.addr, timeout = self.timeout)
+
+    def status(self) -> dict:
+        conn = self.connect()
+        try:
+            conn.request("GET", "/status")
+            return json.loads(conn.getresponse().read())
+        finally:
+            conn.close()
+
+    def events(self, kind : str, request : dict):
+        """
+        Send a request & yield its progress events, the last one is "done" or "error".
+        Relative workdir is resolved against the current directory of the client.
+        """
+        request = dict(request)
+        if "workdir" in request:
+            request["workdir"] = str(Path(request["workdir"]).absolute())
+        conn = self.connect()
+        try:
+            conn.request("POST", f"/{kind}", json.dumps(request), {"Content-Type" : "application/json"})
+            resp = conn.getresponse()
+            if resp.status != 200:
+                raise FlowError(json.loads(resp.read()).get("error", resp.reason))
+            for line in resp:
+                yield json.loads(line)
+        finally:
+            conn.close()
+
+    def call(self, kind : str, request : dict, progress = None) -> dict:
+        """
+        Send a request & return its result, progress(event) gets all other events. Raises FlowError on failure.
+        """
+        for e in self.events(kind, request):
+            if e["event"] == "done":
+                return e["result"]
+            if e["event"] == "error":
+                raise FlowError(e["error"])
+            if progress:
+                progress(e)
+        raise FlowError("Daemon connection closed before the request was finished")
@@ -0,0 +1,9 @@
+#
+# Exceptions of the eFuse flow
+#
+
+class FlowError(Exception):
+    """
+    Flow failure with a message already written to the log, raised instead of exiting the process
+    so the flow could be used as a library.
+    """
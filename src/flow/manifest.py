@@ -0,0 +1,78 @@
+#
+# Per-stage manifests allowing to resume the flow in an existing run directory
+#
+
+import os
+import json
+import time
+from pathlib import Path
+
+from .cache import hash_paths
+
+def snapshot(files : dict, artifacts : list) -> dict:
+    """
+    Content hashes of files for each artifact, None for missing files.
+    """
+    snap = {}
+    for a in artifacts:
+        snap[a] = {}
+        for f in files.get(a, []):
+            f = Path(f)
+            snap[a][f.name] = hash_paths([f]) if f.exists() else None
+    return snap
+
+class ManifestStore:
+    """
+    Manifests of finished stages in run directory: stage parameters, inputs & outputs with content hashes.
+    """
+    def __init__(self, run_dir : Path):
+        self.dir = Path(run_dir) / "manifests"
+
+    def path(self, stage : str) -> Path:
+        """
+        Manifest file of a stage.
+        """
+        return self.dir / f"{stage}.json"
+
+    def read(self, stage : str) -> dict:
+        """
+        Read stage manifest, returns None if there is no valid one.
+        """
+        try:
+            with open(self.path(stage)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, stage : str, params : dict, inputs : dict, outputs : dict):
+        """
+        Write manifest of a successfully finished stage.
+        """
+        os.makedirs(self.dir, exist_ok = True)
+        manifest = {"stage" : stage, "time" : time.strftime("%Y-%m-%d %H:%M:%S"), "params" : params, "inputs" : inputs, "outputs" : outputs}
+        tmp = self.path(stage).with_suffix(".tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent = 4, default = str)
+        os.replace(tmp, self.path(stage))
+
+    def invalidate(self, stage : str):
+        """
+        Remove stage manifest before rerunning it.
+        """
+        try:
+            os.unlink(self.path(stage))
+        except FileNotFoundError:
+            pass
+
+    def is_current(self, stage : str, params : dict, inputs : dict, outputs : dict) -> bool:
+        """
+        True if stage was finished with the same parameters & inputs and its outputs are untouched.
+        """
+        m = self.read(stage)
+        if not m:
+            return False
+        if json.loads(json.dumps(params, default = str)) != m["params"]:
+            return False
+        if any(h is None for o in outputs.values() for h in o.values()):
+            return False
+        return (m["inputs"] == inputs) and (m["outputs"] == outputs)
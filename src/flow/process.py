@@ -0,0 +1,360 @@
+#
+# Asyncio based runner of external tools shared by all flow stages
+#
+
+import os
+import sys
+import time
+import shutil
+import signal
+import asyncio
+import threading
+import contextvars
+import subprocess as sp
+import concurrent.futures
+from contextlib import contextmanager
+from collections import deque
+from pathlib import Path
+
+from . import stats
+
+# number of last output lines kept for error messages
+TAIL_LINES = 50
+
+# time given to a stopped process tree to exit after SIGTERM
+KILL_DELAY = 10
+
+# time given to read the rest of the output after the tool exited, grandchildren could keep it open
+DRAIN_DELAY = 1
+
+_lock = threading.Lock()
+_loop = None
+_tasks = set()
+_cancelled = threading.Event()
+_group = contextvars.ContextVar("efuse_tool_group", default = None)
+_tail_stream = None
+_tail_time = 0.0
+
+class ToolResult:
+    """
+    Result of a tool run: exit code, last lines of output & resources used by the process tree.
+    """
+    def __init__(self, args : list, log : Path = None):
+        self.args = [str(a) for a in args]
+        self.log = log
+        self.returncode = None
+        self.output = ""
+        self.timed_out = False
+        self.cancelled = False
+        self.timeout = None
+        self.wall = 0.0
+        self.rusage = None
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0 and not self.timed_out and not self.cancelled
+
+    @property
+    def stdout(self) -> str:
+        """
+        Same as output, for compatibility with subprocess.CompletedProcess.
+        """
+        return self.output
+
+    def check(self):
+        """
+        Raise TimeoutExpired or CalledProcessError (with result attached) if the run failed.
+        """
+        if self.timed_out:
+            e = sp.TimeoutExpired(self.args, self.timeout, self.output)
+        elif not self.ok:
+            e = sp.CalledProcessError(self.returncode if self.returncode is not None else -signal.SIGTERM, self.args, self.output)
+        else:
+            return self
+        e.result = self
+        raise e
+
+    def to_dict(self) -> dict:
+        ru = self.rusage
+        return {
+            "args"          : self.args,
+            "log"           : str(self.log) if self.log else None,
+            "returncode"    : self.returncode,
+            "timed_out"     : self.timed_out,
+            "cancelled"     : self.cancelled,
+            "wall"          : self.wall,
+            "user"          : ru.ru_utime if ru else None,
+            "sys"           : ru.ru_stime if ru else None,
+            "max_rss"       : ru.ru_maxrss * 1024 if ru else None,
+        }
+
+class ToolGroup:
+    """
+    Tool runs which are cancelled together, e.g. all tools of a single flow.
+    """
+    def __init__(self):
+        self.tasks = set()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """
+        Stop all running tools of the group and refuse to start new ones.
+        """
+        self.cancelled.set()
+        if _loop:
+            _loop.call_soon_threadsafe(lambda: [t.cancel() for t in list(self.tasks)])
+
+@contextmanager
+def group():
+    """
+    Tools started in this context (including threads & tasks created with copy of it) belong to a new group.
+    """
+    g = ToolGroup()
+    token = _group.set(g)
+    try:
+        yield g
+    finally:
+        _group.reset(token)
+
+def live_tail(stream = sys.stderr) -> bool:
+    """
+    Show the last output line of running tools in the terminal, None disables it.
+    Returns True if the stream is a terminal and the tail is shown.
+    """
+    global _tail_stream
+    _tail_stream = stream if stream and stream.isatty() else None
+    return _tail_stream is not None
+
+def _show_tail(name : str, line : str):
+    """
+    Update live progress line, at most 10 times per second.
+    """
+    global _tail_time
+    now = time.monotonic()
+    if now - _tail_time < 0.1:
+        return
+    _tail_time = now
+    width = shutil.get_terminal_size().columns - 1
+    _tail_stream.write("\r\x1b[K" + f"{name}: {line.strip()}"[:width] + "\r")
+    _tail_stream.flush()
+
+def _kill(pid : int, sig : int = signal.SIGTERM):
+    """
+    Signal the whole process group of a child, it includes MPI ranks & other grandchildren.
+    """
+    try:
+        os.killpg(pid, sig)
+    except ProcessLookupError:
+        pass
+
+async def _terminate(pid : int, waiter):
+    """
+    Stop the process tree: SIGTERM first, SIGKILL if it is still alive after KILL_DELAY.
+    A reaped child is not signalled, its pid could be already reused.
+    """
+    if waiter.done():
+        return waiter.result()
+    _kill(pid)
+    try:
+        return await asyncio.wait_for(asyncio.shield(waiter), KILL_DELAY)
+    except asyncio.TimeoutError:
+        if not waiter.done():
+            _kill(pid, signal.SIGKILL)
+        return await waiter
+
+def _reaped(proc : sp.Popen, waiter):
+    """
+    Record exit code of a child reaped by wait4 in its Popen object.
+    """
+    if not waiter.cancelled() and not waiter.exception():
+        proc.returncode = os.waitstatus_to_exitcode(waiter.result()[1])
+
+async def _pump(pipe, log : Path, append : bool, lines : deque, name : str):
+    """
+    Stream child output into the log keeping only the last lines in memory.
+    """
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    f = open(log, "ab" if append else "wb") if log else None
+    partial = b""
+    try:
+        while True:
+            chunk = await reader.read(1 << 16)
+            if not chunk:
+                break
+            if f:
+                f.write(chunk)
+            chunk = (partial + chunk).split(b"\n")
+            partial = chunk.pop()[-(1 << 16):]
+            lines.extend(chunk[-lines.maxlen:])
+            if _tail_stream and chunk:
+                _show_tail(name, chunk[-1].decode("utf-8", errors = "replace"))
+        if partial:
+            lines.append(partial)
+    finally:
+        transport.close()
+        if f:
+            f.close()
+
+async def run_async(args : list, log : Path = None, append : bool = True, stdout = None, stdin = sp.DEVNULL,
+            env : dict = None, cwd = None, check : bool = True, timeout : float = None, tail : int = TAIL_LINES) -> ToolResult:
+    """
+    Run a tool in its own session, so cancellation or timeout kills the whole process tree.
+    Several runs could be awaited concurrently, each with its own env & cwd.
+
+    With log set stdout & stderr are streamed into the log file and only the last tail lines are
+    kept in memory (stdout = PIPE keeps just the tail). Child resource usage is accounted
+    in the current stats measurement.
+    Returns ToolResult, with check set TimeoutExpired or CalledProcessError is raised on failure.
+    """
+    res = ToolResult(args, log)
+    res.timeout = timeout
+    g = _group.get()
+    if _cancelled.is_set() or (g and g.cancelled.is_set()):
+        res.cancelled = True
+        return res.check() if check else res
+
+    loop = asyncio.get_running_loop()
+    capture = log or stdout == sp.PIPE
+    t0 = time.perf_counter()
+    # children are reaped with wait4 to get their resource usage, so asyncio subprocess transport is not used
+    try:
+        proc = sp.Popen(args, stdout = sp.PIPE if capture else stdout, stderr = sp.STDOUT if capture else None, stdin = stdin,
+                            env = env, cwd = cwd, start_new_session = True)
+    except OSError as e:
+        # not found or not executable, same exit code as shell
+        res.returncode = 127
+        res.output = str(e)
+        return res.check() if check else res
+    waiter = loop.run_in_executor(None, os.wait4, proc.pid, 0)
+    lines = deque(maxlen = tail)
+    task = asyncio.current_task()
+    tasks = [_tasks] + ([g.tasks] if g else [])
+    for t in tasks:
+        t.add(task)
+
+    async def finish():
+        if not capture:
+            return await asyncio.shield(waiter)
+        # output is pumped until EOF or for DRAIN_DELAY after the child is reaped
+        pump = asyncio.ensure_future(_pump(proc.stdout, log, append, lines, Path(res.args[0]).name))
+        try:
+            await asyncio.wait([pump, waiter], return_when = asyncio.FIRST_COMPLETED)
+            await asyncio.wait([pump], timeout = DRAIN_DELAY)
+            if pump.done():
+                pump.result()
+            return await asyncio.shield(waiter)
+        finally:
+            if not pump.done():
+                pump.cancel()
+                await asyncio.wait([pump])
+
+    try:
+        _, _, res.rusage = await asyncio.wait_for(finish(), timeout)
+    except asyncio.TimeoutError:
+        res.timed_out = True
+        _, _, res.rusage = await _terminate(proc.pid, waiter)
+    except asyncio.CancelledError:
+        res.cancelled = True
+        await asyncio.shield(_terminate(proc.pid, waiter))
+        raise
+    finally:
+        # the child is reaped by wait4, Popen should not wait for its pid later (it could be reused by then)
+        if waiter.done():
+            _reaped(proc, waiter)
+        else:
+            waiter.add_done_callback(lambda w: _reaped(proc, w))
+        for t in tasks:
+            t.discard(task)
+        if _tail_stream:
+            _tail_stream.write("\r\x1b[K")
+        if proc.stdout:
+            proc.stdout.close()
+        res.wall = time.perf_counter() - t0
+        res.output = b"\n".join(lines).decode("utf-8", errors = "replace")
+        if res.rusage:
+            stats.child_finished(args, res.wall, res.rusage)
+
+    res.returncode = proc.returncode
+    return res.check() if check else res
+
+def _event_loop():
+    """
+    Event loop running in a background thread, it serves run() calls from stage threads.
+    """
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target = _loop.run_forever, name = "process", daemon = True).start()
+    return _loop
+
+def submit(coro) -> concurrent.futures.Future:
+    """
+    Schedule a coroutine in the background event loop in the caller context (stats measurement).
+    """
+    loop = _event_loop()
+    ctx = contextvars.copy_context()
+    fut = concurrent.futures.Future()
+
+    def start():
+        if not fut.set_running_or_notify_cancel():
+            coro.close()
+            return
+        task = ctx.run(loop.create_task, coro)
+
+        def done(t):
+            if t.cancelled():
+                fut.set_exception(sp.CalledProcessError(-signal.SIGTERM, "cancelled"))
+            elif t.exception():
+                fut.set_exception(t.exception())
+            else:
+                fut.set_result(t.result())
+        task.add_done_callback(done)
+
+    loop.call_soon_threadsafe(start)
+    return fut
+
+def run(args : list, log : Path = None, append : bool = True, stdout = None, stdin = sp.DEVNULL,
+            env : dict = None, cwd = None, check : bool = True, timeout : float = None, tail : int = TAIL_LINES) -> ToolResult:
+    """
+    Blocking run_async for stage threads.
+    """
+    return submit(run_async(args, log, append, stdout, stdin, env, cwd, check, timeout, tail)).result()
+
+def run_all(jobs : list, check : bool = True) -> list:
+    """
+    Run several tools concurrently, jobs are dicts of run_async arguments.
+    With check set the first failure stops the others & is raised.
+    """
+    async def gather():
+        tasks = [asyncio.ensure_future(run_async(**j, check = check)) for j in jobs]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            raise
+    return submit(gather()).result()
+
+def cancel_all():
+    """
+    Stop all running tools and refuse to start new ones until reset().
+    """
+    _cancelled.set()
+    if _loop:
+        _loop.call_soon_threadsafe(lambda: [t.cancel() for t in list(_tasks)])
+
+def cancelled() -> bool:
+    """
+    True if cancel_all() was called.
+    """
+    return _cancelled.is_set()
+
+def reset():
+    """
+    Allow starting new tools after cancel_all().
+    """
+    _cancelled.clear()
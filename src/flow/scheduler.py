@@ -0,0 +1,178 @@
+#
+# Stage dependency graph scheduler for the eFuse flow
+#
+
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import process
+
+class Stage:
+    """
+    Flow stage with declared input & output artifacts.
+
+        name        : stage name
+        func        : callable doing the work, gets granted number of CPUs if max_cpus > 1
+        inputs      : names of artifacts required by the stage
+        outputs     : names of artifacts produced by the stage
+        max_cpus    : maximum number of CPU threads the stage could use
+        exclusive   : stage should run alone, e.g. it needs the whole machine
+        params      : configuration values the stage results depend on
+        sources     : source files & directories the stage results depend on
+        cache       : stage outputs could be stored in the artifact cache
+    """
+    def __init__(self, name : str, func, inputs : list = [], outputs : list = [], max_cpus : int = 1, exclusive : bool = False, 
+                    params : dict = {}, sources : list = [], cache : bool = True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.max_cpus = max(1, max_cpus)
+        self.exclusive = exclusive
+        self.params = dict(params)
+        self.sources = list(sources)
+        self.cache = cache
+        self.deps = set()
+
+    def run(self, ncpus : int = 1):
+        """
+        Call the stage function.
+        """
+        if self.max_cpus > 1:
+            self.func(ncpus)
+        else:
+            self.func()
+
+class StageScheduler:
+    """
+    Run stages as soon as all their inputs are produced, keeping the total number
+    of granted CPU threads within the budget. Stops everything on the first failure.
+    Optional runner(stage, ncpus) could wrap stage execution (caching etc.).
+    """
+    def __init__(self, stages : list, ncpus : int = 1, runner = None):
+        self.stages = {}
+        self.ncpus = max(1, ncpus)
+        self.runner = runner
+
+        producers = {}
+        for s in stages:
+            assert(s.name not in self.stages), f"Duplicate stage {s.name}"
+            self.stages[s.name] = s
+            for o in s.outputs:
+                assert(o not in producers), f"Artifact {o} is produced by several stages"
+                producers[o] = s.name
+
+        for s in stages:
+            for i in s.inputs:
+                if i not in producers:
+                    raise ValueError(f"No stage produces artifact {i} required by {s.name}")
+                s.deps.add(producers[i])
+        self.check_cycles()
+
+    def check_cycles(self):
+        """
+        Make sure the stage graph is acyclic.
+        """
+        done = set()
+        path = set()
+        def visit(name : str):
+            if name in done:
+                return
+            if name in path:
+                raise ValueError(f"Stage dependency cycle through {name}")
+            path.add(name)
+            for d in self.stages[name].deps:
+                visit(d)
+            path.discard(name)
+            done.add(name)
+        for name in self.stages:
+            visit(name)
+
+    def ancestors(self, name : str) -> set:
+        """
+        All stages the stage depends on.
+        """
+        res = set()
+        for d in self.stages[name].deps:
+            res |= {d} | self.ancestors(d)
+        return res
+
+    def descendants(self, name : str) -> set:
+        """
+        All stages depending on the stage.
+        """
+        res = set()
+        for s in self.stages.values():
+            if name in s.deps:
+                res |= {s.name} | self.descendants(s.name)
+        return res
+
+    def grant(self, stage : Stage, free : int, nready : int) -> int:
+        """
+        Number of CPU threads given to a stage: a fair share of the free budget among ready stages.
+        """
+        return max(1, min(stage.max_cpus, free // max(1, nready)))
+
+    def call(self, stage : Stage, ncpus : int):
+        """
+        Stage worker.
+        """
+        logging.debug(f"Stage {stage.name} started with {ncpus} CPU(s)")
+        if self.runner:
+            self.runner(stage, ncpus)
+        else:
+            stage.run(ncpus)
+        logging.debug(f"Stage {stage.name} finished")
+
+    def run(self):
+        """
+        Run all stages, raise the first stage failure after stopping the others.
+        """
+        pending = dict(self.stages)
+        finished = set()
+        running = {}
+        free = self.ncpus
+        failure = None
+
+        with process.group() as tools, ThreadPoolExecutor(max_workers = len(self.stages)) as pool:
+            while pending or running:
+                if failure is None:
+                    # start all stages which are ready and fit into the budget, single threaded stages first
+                    ready = sorted([s for s in pending.values() if s.deps <= finished], key = lambda s: s.max_cpus)
+                    for i, s in enumerate(ready):
+                        busy = len(running) > 0
+                        if s.exclusive and busy:
+                            continue
+                        if busy and (free < 1 or any(r.exclusive for r,_ in running.values())):
+                            break
+                        n = self.grant(s, free, len(ready) - i)
+                        free -= n
+                        del pending[s.name]
+                        running[pool.submit(contextvars.copy_context().run, self.call, s, n)] = (s, n)
+                        if s.exclusive:
+                            break
+
+                if not running:
+                    break
+
+                try:
+                    done, _ = wait(running, return_when = FIRST_COMPLETED)
+                except KeyboardInterrupt:
+                    # children are in their own sessions and do not get the signal
+                    tools.cancel()
+                    raise
+                for f in done:
+                    s, n = running.pop(f)
+                    free += n
+                    try:
+                        f.result()
+                        finished.add(s.name)
+                    except BaseException as e:
+                        if failure is None:
+                            failure = e
+                            logging.error(f"Stage {s.name} failed, stopping all running stages...")
+                            tools.cancel()
+
+        if failure is not None:
+            raise failure
@@ -0,0 +1,201 @@
+#
+# Resource usage instrumentation of flow stages & external tools
+#
+
+import os
+import json
+import time
+import logging
+import resource
+import threading
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+
+# innermost active measurement of the current thread / task
+_current = contextvars.ContextVar("efuse_stats_current", default = None)
+
+# ru_inblock & ru_oublock are counted in 512 byte blocks
+BLOCK_SIZE = 512
+
+def _thread_usage() -> tuple:
+    """
+    CPU times & block I/O of the calling thread.
+    """
+    ru = resource.getrusage(resource.RUSAGE_THREAD)
+    return ru.ru_utime, ru.ru_stime, ru.ru_inblock, ru.ru_oublock
+
+class Measurement:
+    """
+    Resources used by a stage or a tool call: wall time, user & system CPU time,
+    peak RSS of child processes and bytes read & written from the storage.
+    Includes own thread usage, all child processes & measurements done in other threads.
+    """
+    def __init__(self, name : str, kind : str, parent = None, collector = None, args : dict = {}):
+        self.name = name
+        self.kind = kind
+        self.args = dict(args)
+        self.parent = parent
+        self.collector = collector
+        self.thread = threading.get_ident()
+        self.status = "ok"
+        self.lock = threading.Lock()
+        self.children = [0.0, 0.0, 0, 0, 0]         # user, sys, max_rss, read, written
+        self.wall = 0.0
+        self.start = time.time()
+        self.t0 = time.perf_counter()
+        self.u0 = _thread_usage()
+
+    def add(self, user : float, sys : float, max_rss : int, read : int, written : int):
+        """
+        Account resources of a child process or of a measurement done in another thread.
+        """
+        with self.lock:
+            c = self.children
+            self.children = [c[0] + user, c[1] + sys, max(c[2], max_rss), c[3] + read, c[4] + written]
+
+    def finish(self):
+        """
+        Stop the measurement & propagate usage to the parent.
+        """
+        self.wall = time.perf_counter() - self.t0
+        u1 = _thread_usage()
+        self.own = [u1[0] - self.u0[0], u1[1] - self.u0[1], (u1[2] - self.u0[2]) * BLOCK_SIZE, (u1[3] - self.u0[3]) * BLOCK_SIZE]
+        if self.parent:
+            if self.parent.thread == self.thread:
+                # own thread usage is already seen by the parent
+                self.parent.add(*self.children)
+            else:
+                self.parent.add(*self.totals())
+
+    def totals(self) -> tuple:
+        """
+        (user, sys, max_rss, read, written) including children.
+        """
+        c = self.children
+        return self.own[0] + c[0], self.own[1] + c[1], c[2], self.own[2] + c[3], self.own[3] + c[4]
+
+    def to_dict(self) -> dict:
+        user, sys, max_rss, read, written = self.totals()
+        return {
+            "name"          : self.name,
+            "kind"          : self.kind,
+            "parent"        : self.parent.name if self.parent else None,
+            "status"        : self.status,
+            "start"         : self.start,
+            "wall"          : round(self.wall, 4),
+            "user"          : round(user, 4),
+            "sys"           : round(sys, 4),
+            "child_max_rss" : max_rss,
+            "read_bytes"    : read,
+            "write_bytes"   : written,
+            "args"          : self.args,
+        }
+
+@contextmanager
+def measure(name : str, kind : str = "tool", collector = None, **args):
+    """
+    Measure resources used by the enclosed code, nested into the current measurement if any.
+    Keyword arguments are stored with the measurement (netlist kind, test name, ncpus...).
+    """
+    parent = _current.get()
+    if parent and not collector:
+        collector = parent.collector
+    m = Measurement(name, kind, parent, collector, args)
+    token = _current.set(m)
+    try:
+        yield m
+    except BaseException:
+        m.status = "failed"
+        raise
+    finally:
+        _current.reset(token)
+        m.finish()
+        if m.collector:
+            m.collector.append(m)
+
+def child_finished(args : list, wall : float, ru):
+    """
+    Account a finished child process (resource usage from os.wait4) in the current measurement.
+    """
+    m = _current.get()
+    if not m:
+        return
+    m.add(ru.ru_utime, ru.ru_stime, ru.ru_maxrss * 1024, ru.ru_inblock * BLOCK_SIZE, ru.ru_oublock * BLOCK_SIZE)
+    logging.debug(f"{Path(str(args[0])).name} finished in {wall:.1f}s, CPU {ru.ru_utime + ru.ru_stime:.1f}s, peak RSS {ru.ru_maxrss / 1024:.0f}MB")
+
+class ResourceStats:
+    """
+    Collector of all measurements done during a flow run.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.measurements = []
+
+    def append(self, m : Measurement):
+        with self.lock:
+            self.measurements.append(m)
+
+    def measure(self, name : str, kind : str = "flow", **args):
+        """
+        Top level measurement, all nested measurements are collected here.
+        """
+        return measure(name, kind, self, **args)
+
+    def write(self, fname : Path):
+        """
+        Write all measurements in JSON, in start order.
+        """
+        ms = sorted(self.measurements, key = lambda m: m.start)
+        stats = {
+            "process_max_rss" : resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "measurements" : [m.to_dict() for m in ms],
+        }
+        with open(fname, "w") as f:
+            json.dump(stats, f, indent = 4)
+
+    def write_trace(self, fname : Path):
+        """
+        Write all measurements as Chrome trace events (chrome://tracing, ui.perfetto.dev).
+        """
+        ms = sorted(self.measurements, key = lambda m: m.start)
+        t0 = ms[0].start if ms else 0
+        pid = os.getpid()
+        tids = {}
+        events = []
+        for m in ms:
+            if m.thread not in tids:
+                tids[m.thread] = len(tids)
+                events.append({"ph" : "M", "name" : "thread_name", "pid" : pid, "tid" : tids[m.thread],
+                    "args" : {"name" : "main" if not tids[m.thread] else f"worker {tids[m.thread]}"}})
+            d = m.to_dict()
+            args = dict(m.args, **{k : d[k] for k in ("status", "user", "sys", "child_max_rss", "read_bytes", "write_bytes")})
+            events.append({
+                "ph"    : "X",
+                "name"  : m.name,
+                "cat"   : m.kind,
+                "pid"   : pid,
+                "tid"   : tids[m.thread],
+                "ts"    : round((m.start - t0) * 1e6),
+                "dur"   : round(m.wall * 1e6),
+                "args"  : args,
+            })
+        with open(fname, "w") as f:
+            json.dump({"traceEvents" : events, "displayTimeUnit" : "ms"}, f, indent = 1, default = str)
+
+    def log_summary(self):
+        """
+        Log summary table of all measurements.
+        """
+        mb = 1 << 20
+        logging.info(f"{'Stage / tool':<40} {'Wall, s':>9} {'User, s':>9} {'Sys, s':>8} {'RSS, MB':>8} {'Read, MB':>9} {'Write, MB':>9}")
+        for m in sorted(self.measurements, key = lambda m: m.start):
+            user, sys, max_rss, read, written = m.totals()
+            depth = 0
+            p = m.parent
+            while p:
+                depth, p = depth + 1, p.parent
+            name = "  " * depth + m.name
+            if m.status != "ok":
+                name += f" ({m.status})"
+            logging.info(f"{name[:40]:<40} {m.wall:>9.1f} {user:>9.1f} {sys:>8.1f} {max_rss / mb:>8.0f} {read / mb:>9.1f} {written / mb:>9.1f}")
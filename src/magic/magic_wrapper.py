@@ -1,32 +1,41 @@
 import logging
-import sys
 from os import environ, remove
-from subprocess import run, STDOUT, DEVNULL, CalledProcessError
+from subprocess import DEVNULL, CalledProcessError, TimeoutExpired
 from pathlib import Path
 
-def magic(script : Path, args : dict, log : str):
+from ..flow import process, stats
+from ..flow.errors import FlowError
+
+def magic(script : Path, args : dict, log : str, timeout : float = None, work_dir : Path = Path(".")):
     """
-    Run magic script. Passes arguments via environment.
+    Run magic script in work_dir. Passes arguments via environment, output is streamed into the log.
     """
+    args = dict(args)
     args.update(environ)
-    output = open(log, "w")
+    work_dir = Path(work_dir).absolute()
+    log = work_dir / log
     try:
-        tmp_script = "_magic_tmp.tcl"
+        tmp_script = work_dir / f"_magic_{Path(script).stem}.tcl"
         with open(tmp_script, "w") as f:
             f.write(f'catch {{ source {script} }} err\nputs $err\nif {{$err != ""}} {{exit 1}}')
-        run(
-            ["magic", "-noconsole", "-dnull", "-rcfile", Path(environ['PDK_ROOT']) / environ['PDK'] / f"libs.tech/magic/{environ['PDK']}.magicrc", tmp_script],
-            check = True,
-            stdout = output,
-            env = args,
-            stderr = STDOUT,
-            stdin = DEVNULL
-        )
+        with stats.measure(f"magic {Path(script).stem}", script = str(script), log = str(log), cell = args.get("CELL")):
+            process.run(
+                ["magic", "-noconsole", "-dnull", "-rcfile", Path(environ['PDK_ROOT']) / environ['PDK'] / f"libs.tech/magic/{environ['PDK']}.magicrc", tmp_script],
+                log = log,
+                append = False,
+                check = True,
+                env = args,
+                cwd = work_dir,
+                stdin = DEVNULL,
+                timeout = timeout
+            )
         remove(tmp_script)
-    except CalledProcessError as e:
-        err = "magic.err"
+    except (CalledProcessError, TimeoutExpired) as e:
+        err = work_dir / "magic.err"
         with open(err, "w") as f:
-            f.write(e.stdout.decode("utf-8"))
-        logging.error(f"Magic run failed, please check logfiles {log} and {err} for more info")
-        sys.exit(1)
+            f.write(e.output)
+        reason = f"timed out after {e.timeout}s" if isinstance(e, TimeoutExpired) else "failed"
+        logging.error(f"Magic run {reason}, last lines of the log:\n{e.output}")
+        logging.error(f"Please check logfiles {log} and {err} for more info")
+        raise FlowError(f"Magic run {reason}")
     
@@ -0,0 +1,8 @@
+#
+# Tests are run from the repository root, flow modules are imported as src.flow.*
+#
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
@@ -0,0 +1,61 @@
+#
+# Batch configurations are named after all their layout options & released into separate dirs
+#
+
+import argparse
+
+import pytest
+
+import efuse
+from efuse import macro_name
+from src.flow.errors import FlowError
+
+def test_macro_name():
+    assert macro_name(64, 64) == "efuse_array_64x64"
+    assert macro_name(64, 64, columns = 4) == "efuse_array_64x64_c4"
+    assert macro_name(64, 64, columns = 4, aspect = 1.5) == "efuse_array_64x64_a1p5"
+    assert macro_name(64, 64, centre_tap = True, ctrl_buf_rows = 8) == "efuse_array_64x64_ct_cb8"
+    assert macro_name(32, 64, bit_sel_buf = True) == "efuse_array_32x64_bsb"
+
+def batch_args(spec = None, **kwargs) -> argparse.Namespace:
+    args = dict(number_of_words = None, word_width = None, batch = spec, xyce_netlist = "none", digital_wrapper = "none",
+        digital_depth = None, digital_width = None, skip_drclvs = True, columns = 1, aspect = None, centre_tap = False,
+        bit_sel_buf = False, ctrl_buf_rows = 0, verbose = False, no_cache = True, cache_dir = None, trace = False, timeout = [],
+        jobs = 1, ncpus = 1)
+    args.update(kwargs)
+    return argparse.Namespace(**args)
+
+@pytest.fixture
+def batch(monkeypatch):
+    """
+    Configurations passed to the batch runner.
+    """
+    runs = []
+    class Runner:
+        def __init__(self, worker, configs, batch_dir, jobs, ncpus):
+            runs.append(configs)
+        def run(self):
+            return [{"ok" : True} for _ in runs[-1]]
+    monkeypatch.setattr(efuse, "BatchRunner", Runner)
+    monkeypatch.setattr(efuse, "setup_console_logging", lambda *args, **kwargs: None)
+    return runs
+
+def test_option_sweep_gets_separate_names(tmp_path, batch):
+    spec = tmp_path / "spec.json"
+    spec.write_text('{"nwords" : 64, "word_width" : 64, "ctrl_buf_rows" : [0, 4, 8], "columns" : [1, 2]}')
+    efuse.run_batch(batch_args(spec), tmp_path)
+    names = [c["name"] for c in batch[0]]
+    assert len(set(names)) == 6
+    assert "efuse_array_64x64_c2_cb4" in names
+
+def test_same_config_is_compiled_once(tmp_path, batch):
+    spec = tmp_path / "spec.json"
+    spec.write_text('[{"nwords" : 32, "word_width" : 8}, {"nwords" : 32, "word_width" : 8, "centre_tap" : true}]')
+    efuse.run_batch(batch_args(spec, number_of_words = [32], word_width = [8]), tmp_path)
+    assert [c["name"] for c in batch[0]] == ["efuse_array_32x8", "efuse_array_32x8_ct"]
+
+def test_different_configs_of_one_macro_are_rejected(tmp_path, batch):
+    spec = tmp_path / "spec.json"
+    spec.write_text('{"nwords" : 32, "word_width" : 8, "xyce_netlist" : ["ext", "pex"]}')
+    with pytest.raises(FlowError):
+        efuse.run_batch(batch_args(spec), tmp_path)
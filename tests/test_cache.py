@@ -0,0 +1,50 @@
+#
+# Content addressed artifact cache
+#
+
+from src.flow.cache import ArtifactCache, hash_key, hash_paths
+
+def test_key_depends_on_all_parts():
+    assert hash_key("stage", "gds", {"a" : 1, "b" : 2}) == hash_key("stage", "gds", {"b" : 2, "a" : 1})
+    assert hash_key("stage", "gds", {"a" : 1}) != hash_key("stage", "gds", {"a" : 2})
+    assert hash_key("stage", "gds") != hash_key("stage", "lef")
+
+def test_hash_paths_follows_contents(tmp_path):
+    f = tmp_path / "a.txt"
+    f.write_text("one")
+    h = hash_paths([tmp_path])
+    assert hash_paths([tmp_path]) == h
+    f.write_text("two")
+    assert hash_paths([tmp_path]) != h
+    assert hash_paths([tmp_path / "missing"]) != hash_paths([tmp_path / "other"])
+
+def test_store_and_restore(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache")
+    src = tmp_path / "run"
+    (src / "librelane").mkdir(parents = True)
+    (src / "array.gds").write_bytes(b"gds")
+    (src / "librelane" / "final.v").write_text("module m; endmodule")
+    key = hash_key("macro", 32, 8)
+
+    assert cache.lookup(key) is None
+    assert not cache.restore(key, tmp_path / "miss")
+
+    cache.store(key, [src / "array.gds", src / "librelane"], {"macro" : "efuse_array_32x8"})
+    assert cache.lookup(key)
+    assert cache.meta(key)["macro"] == "efuse_array_32x8"
+
+    dest = tmp_path / "release"
+    assert cache.restore(key, dest)
+    assert (dest / "array.gds").read_bytes() == b"gds"
+    assert (dest / "librelane" / "final.v").read_text() == "module m; endmodule"
+    assert not cache.restore(hash_key("macro", 32, 16), dest)
+
+def test_existing_entry_is_kept(tmp_path):
+    cache = ArtifactCache(tmp_path / "cache")
+    f = tmp_path / "a.txt"
+    f.write_text("first")
+    cache.store("k" * 64, [f])
+    f.write_text("second")
+    cache.store("k" * 64, [f])
+    cache.restore("k" * 64, tmp_path / "out")
+    assert (tmp_path / "out" / "a.txt").read_text() == "first"
@@ -0,0 +1,50 @@
+#
+# Compiler daemon requests over a Unix socket
+#
+
+import logging
+import threading
+
+import pytest
+
+from src.flow.daemon import CompilerDaemon, DaemonClient, parse_address
+from src.flow.errors import FlowError
+
+@pytest.fixture
+def daemon(tmp_path):
+    def echo(request : dict, emit) -> dict:
+        emit({"event" : "log", "message" : "working"})
+        return {"echo" : request}
+
+    def fail(request : dict, emit) -> dict:
+        raise FlowError("bad configuration")
+
+    address = f"unix:{tmp_path / 'efuse.sock'}"
+    d = CompilerDaemon(address, {"echo" : echo, "fail" : fail})
+    t = threading.Thread(target = d.serve, daemon = True)
+    t.start()
+    yield address
+    d.shutdown()
+    t.join(5)
+
+def test_parse_address(tmp_path):
+    assert parse_address(f"unix:{tmp_path}/s") == ("unix", tmp_path / "s")
+    assert parse_address("8123") == ("tcp", ("127.0.0.1", 8123))
+    with pytest.raises(ValueError):
+        parse_address("example.com:8123")
+
+def test_request_round_trip(daemon):
+    client = DaemonClient(daemon, timeout = 10)
+    events = []
+    res = client.call("echo", {"config" : {"nwords" : 32}, "workdir" : "work"}, events.append)
+    assert res["echo"]["config"] == {"nwords" : 32}
+    assert res["echo"]["workdir"].endswith("/work")
+    assert [e["event"] for e in events] == ["started", "log"]
+    assert client.status()["served"] == 1
+
+def test_request_errors(daemon):
+    client = DaemonClient(daemon, timeout = 10)
+    with pytest.raises(FlowError, match = "bad configuration"):
+        client.call("fail", {})
+    with pytest.raises(FlowError, match = "unknown request"):
+        client.call("route", {})
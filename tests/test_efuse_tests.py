@@ -0,0 +1,19 @@
+#
+# Xyce test setup must not modify the netlists it gets from the previous stages
+#
+
+from src.efuse_spice_gen.efuse_tests import EfuseArrayTest
+
+NETLIST = """X0 BIT_SEL[0] OUT[0] efuse
+X1 BIT_SEL[1] OUT[0] efuse
+"""
+
+def test_flat_netlist_is_patched_in_a_copy(tmp_path):
+    netlist = tmp_path / "efuse_array_16x1.magic_pex.spice"
+    netlist.write_text(NETLIST)
+    tb = tmp_path / "tb.xyce"
+    tb.write_text("")
+    for _ in range(2):
+        t = EfuseArrayTest(16, 1, tb, netlist, "uut.spice", True, 5.0, work_dir = tmp_path / "xyce_pex")
+        assert t.netlist.read_text().splitlines() == ["X0 BIT_SEL[0] OUT[0] efuse PARAMS: NUM=0", "X1 BIT_SEL[1] OUT[0] efuse PARAMS: NUM=1"]
+    assert netlist.read_text() == NETLIST
@@ -0,0 +1,37 @@
+#
+# Xyce testbench must simulate with flat (extracted) netlists as well as with the hierarchical one
+#
+
+import re
+
+from src.efuse_spice_gen.generate_spice import generate_spices
+
+DEVICES = {"nfet_06v0", "pfet_06v0"}
+
+def subckts(text : str) -> set:
+    return {l.split()[1].lower() for l in text.splitlines() if l.lower().startswith(".subckt")}
+
+def instances(text : str) -> set:
+    """
+    Subcircuits instantiated by X lines, parameters are skipped.
+    """
+    res = set()
+    for l in text.splitlines():
+        if l.startswith("X"):
+            res.add([t for t in l.split("PARAMS:")[0].split() if "=" not in t][-1].lower())
+    return res
+
+def test_testbench_with_ctrl_buffers_runs_on_flat_netlist(tmp_path):
+    name = "efuse_array_16x8"
+    spice, _, tb = generate_spices(name, "/pdk", 16, 8, out_dir = tmp_path, ctrl_rows = 4)
+    tb_text = tb.read_text()
+    spice_text = spice.read_text()
+    assert "gf180mcu_fd_sc_mcu7t5v0__buf_2" in spice_text
+
+    # flat extracted netlist has only the top cell, control buffers are flattened into it
+    flat = f".subckt {name} {' '.join(re.search(rf'^Xefuse_array (.*) {name}$', tb_text, re.M)[1].split())}\n.ends\n"
+    assert instances(tb_text) - DEVICES <= subckts(tb_text) | subckts(flat)
+
+    # hierarchical netlist, no subcircuit is defined twice
+    assert not subckts(tb_text) & subckts(spice_text)
+    assert instances(tb_text) - DEVICES <= subckts(tb_text) | subckts(spice_text)
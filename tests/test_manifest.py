@@ -0,0 +1,87 @@
+#
+# Resuming the flow in an existing run directory with --from-stage & --to-stage
+#
+
+import collections
+
+import pytest
+
+from efuse import EfuseFlow
+from src.flow.scheduler import Stage
+from src.flow.manifest import ManifestStore, snapshot
+from src.flow.errors import FlowError
+
+class ToyFlow(EfuseFlow):
+    """
+    Flow with small stages writing their artifacts, counting runs of each stage.
+    """
+    def __init__(self, tmp_path, **kwargs):
+        super().__init__(32, 8, tmp_path, "none", ("none",), 1, True, False, run_dir = tmp_path / "run", quiet = True, **kwargs)
+        self.runs = collections.Counter()
+
+    def stages(self) -> list:
+        def write(name : str, artifact : str, text : str):
+            def f():
+                self.runs[name] += 1
+                for p in self.files[artifact]:
+                    p.write_text(text)
+            return f
+
+        return [
+            Stage("layout", write("layout", "gds", "gds"), [], ["gds"]),
+            Stage("netlist", write("netlist", "spice", "spice"), ["gds"], ["spice"]),
+            Stage("verilog", write("verilog", "verilog", "verilog"), [], ["verilog"]),
+            Stage("release", write("release", "lef", "lef"), ["spice", "verilog"], ["lef"]),
+        ]
+
+def run(tmp_path, **kwargs) -> collections.Counter:
+    flow = ToyFlow(tmp_path, **kwargs)
+    flow.select_stages().run()
+    return flow.runs
+
+def test_rerun_skips_current_stages(tmp_path):
+    assert run(tmp_path) == {"layout" : 1, "netlist" : 1, "verilog" : 1, "release" : 1}
+    assert run(tmp_path) == {}
+
+def test_changed_output_reruns_stage(tmp_path):
+    run(tmp_path)
+    (tmp_path / "run" / "efuse_array_32x8.gds").write_text("edited")
+    assert run(tmp_path) == {"layout" : 1}
+    # the restored netlist has the same contents, so the release is still current
+    (tmp_path / "run" / "efuse_array_32x8.spice").unlink()
+    assert run(tmp_path) == {"netlist" : 1}
+
+def test_from_stage_reruns_stage_and_dependents(tmp_path):
+    run(tmp_path)
+    assert run(tmp_path, from_stage = "netlist") == {"netlist" : 1, "release" : 1}
+
+def test_from_stage_keeps_ancestors(tmp_path):
+    run(tmp_path)
+    # layout result is edited by hand & kept, netlist is rerun on it
+    (tmp_path / "run" / "efuse_array_32x8.gds").write_text("edited")
+    assert run(tmp_path, from_stage = "netlist") == {"netlist" : 1, "release" : 1}
+
+def test_to_stage_runs_needed_stages_only(tmp_path):
+    assert run(tmp_path, to_stage = "netlist") == {"layout" : 1, "netlist" : 1}
+    assert run(tmp_path) == {"verilog" : 1, "release" : 1}
+
+def test_from_and_to_stage(tmp_path):
+    run(tmp_path)
+    assert run(tmp_path, from_stage = "layout", to_stage = "netlist") == {"layout" : 1, "netlist" : 1}
+
+def test_unknown_stage(tmp_path):
+    with pytest.raises(FlowError):
+        run(tmp_path, from_stage = "magic")
+
+def test_manifest_is_current(tmp_path):
+    store = ManifestStore(tmp_path)
+    out = tmp_path / "out.txt"
+    out.write_text("x")
+    files = {"out" : [out]}
+    store.write("stage", {"a" : 1}, {}, snapshot(files, ["out"]))
+    assert store.is_current("stage", {"a" : 1}, {}, snapshot(files, ["out"]))
+    assert not store.is_current("stage", {"a" : 2}, {}, snapshot(files, ["out"]))
+    out.write_text("y")
+    assert not store.is_current("stage", {"a" : 1}, {}, snapshot(files, ["out"]))
+    store.invalidate("stage")
+    assert store.read("stage") is None
@@ -0,0 +1,103 @@
+#
+# External tool runner: timeouts & cancellation stop the whole process tree
+#
+
+import os
+import time
+import signal
+import asyncio
+import subprocess as sp
+from pathlib import Path
+
+import pytest
+
+from src.flow import process
+
+def alive(pid : int) -> bool:
+    """
+    Process exists & is not a zombie waiting for its (re)parent.
+    """
+    try:
+        return Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()[0] != "Z"
+    except FileNotFoundError:
+        return False
+
+def wait_dead(pid : int, timeout : float = 5) -> bool:
+    t0 = time.monotonic()
+    while alive(pid) and time.monotonic() - t0 < timeout:
+        time.sleep(0.05)
+    return not alive(pid)
+
+def tree(pidfile : Path) -> list:
+    """
+    Shell with a grandchild, the grandchild pid is written to pidfile.
+    """
+    return ["sh", "-c", f"sleep 60 & echo $! > {pidfile}; wait"]
+
+def read_pid(pidfile : Path) -> int:
+    t0 = time.monotonic()
+    while not pidfile.exists() or not pidfile.read_text().strip():
+        assert time.monotonic() - t0 < 5
+        time.sleep(0.05)
+    return int(pidfile.read_text())
+
+def test_output_and_exit_code(tmp_path):
+    log = tmp_path / "tool.log"
+    res = process.run(["sh", "-c", "echo first; echo last; exit 3"], log = log, check = False)
+    assert res.returncode == 3 and not res.ok
+    assert res.output.splitlines()[-1] == "last"
+    assert log.read_text() == "first\nlast\n"
+    with pytest.raises(sp.CalledProcessError):
+        res.check()
+
+def test_missing_tool():
+    res = process.run(["no_such_tool_here"], check = False)
+    assert res.returncode == 127
+
+def test_timeout_kills_process_tree(tmp_path):
+    pidfile = tmp_path / "pid"
+    t0 = time.monotonic()
+    with pytest.raises(sp.TimeoutExpired) as e:
+        process.run(tree(pidfile), timeout = 0.5)
+    assert time.monotonic() - t0 < process.KILL_DELAY
+    assert e.value.result.returncode == -signal.SIGTERM
+    assert wait_dead(read_pid(pidfile))
+
+def test_cancel_kills_process_tree(tmp_path, monkeypatch):
+    pidfile = tmp_path / "pid"
+    procs = []
+
+    class Popen(sp.Popen):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            procs.append(self)
+    monkeypatch.setattr(process.sp, "Popen", Popen)
+
+    async def cancel_run():
+        task = asyncio.ensure_future(process.run_async(tree(pidfile)))
+        while not pidfile.exists():
+            await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_run())
+    assert wait_dead(read_pid(pidfile))
+    # the child reaped by the runner is not waited for by subprocess later
+    assert procs[0].returncode == -signal.SIGTERM
+
+def test_grandchild_keeping_output_open(tmp_path):
+    # the tool exits while its background grandchild still holds stdout
+    pidfile = tmp_path / "pid"
+    t0 = time.monotonic()
+    res = process.run(["sh", "-c", f"sleep 60 & echo $! > {pidfile}; echo done"], stdout = sp.PIPE, timeout = 30)
+    assert time.monotonic() - t0 < 10
+    assert res.output == "done"
+    os.kill(read_pid(pidfile), signal.SIGTERM)
+
+def test_cancelled_group_refuses_new_tools():
+    with process.group() as g:
+        g.cancel()
+        res = process.run(["true"], check = False)
+    assert res.cancelled
+    assert process.run(["true"]).ok
@@ -0,0 +1,83 @@
+#
+# Stage dependency graph scheduler
+#
+
+import time
+import threading
+import subprocess as sp
+
+import pytest
+
+from src.flow.scheduler import Stage, StageScheduler
+from src.flow import process
+
+def test_stages_run_after_their_inputs():
+    order = []
+    lock = threading.Lock()
+
+    def work(name : str):
+        def f():
+            time.sleep(0.01)
+            with lock:
+                order.append(name)
+        return f
+
+    stages = [
+        Stage("release", work("release"), ["gds", "spice"], []),
+        Stage("spice", work("spice"), ["cells"], ["spice"]),
+        Stage("gds", work("gds"), [], ["gds", "cells"]),
+    ]
+    StageScheduler(stages, ncpus = 4).run()
+    assert order.index("gds") < order.index("spice") < order.index("release")
+
+def test_cpu_budget_is_shared():
+    grants = {}
+
+    def work(name : str):
+        def f(ncpus : int):
+            grants[name] = ncpus
+        return f
+
+    stages = [Stage("drc", work("drc"), max_cpus = 8), Stage("lvs", work("lvs"), max_cpus = 8)]
+    StageScheduler(stages, ncpus = 4).run()
+    assert sum(grants.values()) <= 4
+
+def test_ancestors_and_descendants():
+    stages = [Stage("a", None, [], ["x"]), Stage("b", None, ["x"], ["y"]), Stage("c", None, ["y"], []), Stage("d", None, ["x"], [])]
+    sched = StageScheduler(stages)
+    assert sched.ancestors("c") == {"a", "b"}
+    assert sched.descendants("a") == {"b", "c", "d"}
+
+def test_missing_producer_and_cycle():
+    with pytest.raises(ValueError):
+        StageScheduler([Stage("a", None, ["x"], [])])
+    with pytest.raises(ValueError):
+        StageScheduler([Stage("a", None, ["y"], ["x"]), Stage("b", None, ["x"], ["y"])])
+
+def test_failure_cancels_running_stages():
+    started = threading.Event()
+    result = {}
+
+    def slow():
+        started.set()
+        t0 = time.monotonic()
+        try:
+            process.run(["sleep", "30"])
+        finally:
+            result["wall"] = time.monotonic() - t0
+
+    def failing():
+        started.wait(5)
+        time.sleep(0.2)
+        raise RuntimeError("stage failed")
+
+    ran = []
+    stages = [
+        Stage("slow", slow),
+        Stage("failing", failing, [], ["x"]),
+        Stage("after", lambda: ran.append("after"), ["x"], []),
+    ]
+    with pytest.raises(RuntimeError, match = "stage failed"):
+        StageScheduler(stages, ncpus = 2).run()
+    assert result["wall"] < 10
+    assert not ran
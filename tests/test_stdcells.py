@@ -0,0 +1,44 @@
+#
+# Standard cell extract follows the flow cache directory & is not written without the cache
+#
+
+import pytest
+from klayout import db
+
+from src.efuse_gds_gen.gf180_klayout import StdCellLibrary, STDCELL_LIB
+
+@pytest.fixture
+def pdk(tmp_path, monkeypatch):
+    """
+    PDK with a library of a single inverter.
+    """
+    gds = tmp_path / "pdk" / "gf180mcuD" / f"libs.ref/{STDCELL_LIB}/gds/{STDCELL_LIB}.gds"
+    gds.parent.mkdir(parents = True)
+    layout = db.Layout()
+    layout.create_cell(f"{STDCELL_LIB}__inv_1").shapes(layout.layer(34, 0)).insert(db.Box(0, 0, 1120, 3920))
+    layout.write(str(gds))
+    monkeypatch.setenv("PDK_ROOT", str(tmp_path / "pdk"))
+    monkeypatch.setenv("PDK", "gf180mcuD")
+    monkeypatch.setenv("EFUSE_CACHE_DIR", str(tmp_path / "default"))
+    monkeypatch.setattr(StdCellLibrary, "_libs", {})
+    return gds
+
+def copy_inv(lib : StdCellLibrary) -> db.Box:
+    layout = db.Layout()
+    cell = layout.create_cell("inv")
+    lib.copy(cell, f"{STDCELL_LIB}__inv_1")
+    return cell.bbox()
+
+def test_extract_in_cache_dir(tmp_path, pdk):
+    lib = StdCellLibrary.get(tmp_path / "cache")
+    assert copy_inv(lib) == db.Box(0, 0, 1120, 3920)
+    assert len(list((tmp_path / "cache" / "stdcells").iterdir())) == 1
+    assert not (tmp_path / "default").exists()
+    assert StdCellLibrary.get(tmp_path / "cache") is lib
+
+def test_no_extract_without_cache(tmp_path, pdk):
+    lib = StdCellLibrary.get(cache = False)
+    assert copy_inv(lib) == db.Box(0, 0, 1120, 3920)
+    assert lib.extract is None
+    assert not (tmp_path / "default").exists()
+    assert StdCellLibrary.get() is not lib